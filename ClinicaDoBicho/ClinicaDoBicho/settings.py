@@ -61,6 +61,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.metricas.MetricasMiddleware',  # Server-Timing e /metrics (primeiro: mede todos os outros)
     'corsheaders.middleware.CorsMiddleware',  # Cors
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -75,7 +76,8 @@ ROOT_URLCONF = 'ClinicaDoBicho.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates com o tempo de renderização medido (core/metricas.py)
+        'BACKEND': 'core.metricas.TemplatesMedidos',
         'DIRS': [TEMPLATE_DIR],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -93,12 +95,134 @@ WSGI_APPLICATION = 'ClinicaDoBicho.wsgi.application'
 
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
+#
+# DB_ENGINE: 'sqlite' (padrão) ou 'postgres' (precisa do pacote psycopg, que
+# não está nas dependências). A suíte de testes só é executada no SQLite; no
+# PostgreSQL a busca textual cai para icontains (ver core/busca.py).
+
+DB_ENGINE = os.environ.get('DB_ENGINE', 'sqlite')
+
+# Conexões reaproveitadas entre requisições (segundos; 0 = uma por requisição).
+# Com CONN_HEALTH_CHECKS a conexão é testada antes de ser reutilizada.
+# O padrão é 0 porque a aplicação roda com ASGI, em que cada requisição usa
+# uma thread nova e as conexões persistentes nunca seriam reaproveitadas;
+# com um servidor WSGI de threads fixas, use por exemplo DB_CONN_MAX_AGE=60.
+DB_CONN_MAX_AGE = int(os.environ.get('DB_CONN_MAX_AGE', 0))
+
+if DB_ENGINE == 'postgres':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('DB_NAME', 'clinicadobicho'),
+            'USER': os.environ.get('DB_USER', 'postgres'),
+            'PASSWORD': os.environ.get('DB_PASSWORD', ''),
+            'HOST': os.environ.get('DB_HOST', '127.0.0.1'),
+            'PORT': os.environ.get('DB_PORT', '5432'),
+            'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+            'CONN_HEALTH_CHECKS': True,
+        }
+    }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ.get('DB_NAME', os.path.join(BASE_DIR, 'db.sqlite3')),
+            'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                # Transações de escrita pegam o lock já no BEGIN: sem isso uma
+                # leitura que vira escrita falha com "database is locked" na hora,
+                # sem esperar o busy_timeout.
+                'transaction_mode': 'IMMEDIATE',
+                # Executado a cada nova conexão:
+                # - WAL: leitores não bloqueiam o escritor (e vice-versa);
+                # - synchronous=NORMAL: seguro com WAL, sem fsync a cada commit;
+                # - busy_timeout: espera até 20 s pelo lock em vez de falhar;
+                # - cache de ~64 MB e 256 MB do arquivo lidos via mmap.
+                'init_command': (
+                    'PRAGMA journal_mode=WAL;'
+                    'PRAGMA synchronous=NORMAL;'
+                    'PRAGMA busy_timeout=20000;'
+                    'PRAGMA cache_size=-64000;'
+                    'PRAGMA mmap_size=268435456;'
+                    'PRAGMA temp_store=MEMORY;'
+                ),
+            },
+        }
+    }
+
+
+# Cache (ver core/cache.py)
+# CACHE_BACKEND: 'file' (padrão, compartilhado entre os processos da mesma
+# máquina), 'redis' (vários servidores; CACHE_URL=redis://host:6379/1) ou
+# 'locmem' (um cache por processo: só para um único worker, já que a versão
+# invalidada por um processo não chega aos outros).
+
+CACHE_BACKEND = os.environ.get('CACHE_BACKEND', 'file')
+
+if CACHE_BACKEND == 'redis':
+    _cache_default = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ.get('CACHE_URL', 'redis://127.0.0.1:6379/1'),
+    }
+elif CACHE_BACKEND == 'file':
+    import tempfile
+    _cache_default = {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ.get('CACHE_URL', os.path.join(tempfile.gettempdir(), 'clinicadobicho-cache')),
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    }
+else:
+    _cache_default = {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    }
+
+CACHES = {'default': {**_cache_default, 'KEY_PREFIX': 'clinicadobicho', 'TIMEOUT': 300}}
+
+
+# Avisos SSE de consultas para os calendários (ver core/notificacoes.py)
+# Cada tela aberta mantém uma conexão por minutos, o que só é viável com ASGI
+# (uvicorn ClinicaDoBicho.asgi:application); com WSGI (runserver, gunicorn) a
+# conexão prenderia um worker. Por isso as telas só abrem o fluxo com
+# NOTIFICACOES_ATIVAS=1, e o endpoint responde 204 a requisições WSGI.
+# NOTIFICACOES_BACKEND: 'local' (padrão, conexões de um único processo) ou
+# 'redis' (vários workers; NOTIFICACOES_URL=redis://host:6379/0).
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+NOTIFICACOES_ATIVAS = os.environ.get('NOTIFICACOES_ATIVAS') == '1'
+
+if os.environ.get('NOTIFICACOES_BACKEND', 'local') == 'redis':
+    NOTIFICACOES = {
+        'BACKEND': 'core.notificacoes.BrokerRedis',
+        'OPCOES': {'URL': os.environ.get('NOTIFICACOES_URL', 'redis://127.0.0.1:6379/0')},
     }
+else:
+    NOTIFICACOES = {'BACKEND': 'core.notificacoes.BrokerLocal'}
+
+
+# Métricas de desempenho (ver core/metricas.py)
+# /metrics responde para a equipe logada e para o Prometheus, que se identifica
+# pelo token (Authorization: Bearer <METRICAS_TOKEN>) ou pelo IP. Nenhum IP é
+# liberado por padrão: atrás de um proxy local (nginx, gunicorn) todas as
+# requisições chegam de 127.0.0.1.
+METRICAS_TOKEN = os.environ.get('METRICAS_TOKEN', '')
+METRICAS_IPS = [ip for ip in os.environ.get('METRICAS_IPS', '').split(',') if ip]
+# Consultas SQL mais lentas que isso (segundos) são logadas com o nome da rota
+METRICAS_CONSULTA_LENTA = float(os.environ.get('METRICAS_CONSULTA_LENTA', 0.1))
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'simples': {'format': '[{asctime}] {levelname} {name}: {message}', 'style': '{'},
+    },
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler', 'formatter': 'simples'},
+    },
+    'loggers': {
+        'core': {'handlers': ['console'], 'level': os.environ.get('LOG_LEVEL', 'INFO')},
+        'api': {'handlers': ['console'], 'level': os.environ.get('LOG_LEVEL', 'INFO')},
+    },
 }
 
 
@@ -125,7 +249,15 @@ REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
         # 'rest_framework.authentication.SessionAuthentication', # pode da problema com token do jwt remover
         'rest_framework_simplejwt.authentication.JWTAuthentication',
-    )
+    ),
+    # Paginação por cursor em todas as viewsets (ver api/pagination.py)
+    'DEFAULT_PAGINATION_CLASS': 'api.pagination.IdCursorPagination',
+    'PAGE_SIZE': 50,
+    # JSON gerado pelo orjson quando instalado (ver api/renderers.py)
+    'DEFAULT_RENDERER_CLASSES': (
+        'api.renderers.JSONRapidoRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
 }
 
 from datetime import timedelta
@@ -27,11 +27,16 @@ from api.auth import (
     LogoutView
 )
 
+from api import assincrono
 from api.views import (
     ClienteViewSet, 
     AnimalViewSet, 
     MedicoVeterinarioViewSet, 
-    ConsultaViewSet
+    ConsultaViewSet,
+    BuscaView,
+    CacheView,
+    ImportacaoView,
+    ExportacaoView,
 )
 
 router = routers.DefaultRouter()
@@ -42,6 +47,18 @@ router.register(r'consultas', ConsultaViewSet, basename='consulta')
 
 urlpatterns = [
     path('admin/', admin.site.urls), 
+    # Views assíncronas (ASGI) das telas de calendário e dashboard, ver api/assincrono.py
+    path('api/consultas/resumo_consultas/', assincrono.resumo_consultas, name='consulta-resumo-consultas'),
+    path('api/consultas/eventos_veterinario/', assincrono.eventos_veterinario,
+         name='consulta-eventos-veterinario'),
+    path('api/consultas/avisos/', assincrono.avisos_consultas, name='consulta-avisos'),
+    path('api/consultas/proximos_horarios/', assincrono.proximos_horarios, name='consulta-proximos-horarios'),
+    path('api/estatisticas/ocupacao/', assincrono.serie_ocupacao, name='estatisticas-ocupacao'),
+    path('api/estatisticas/cancelamentos/', assincrono.serie_cancelamentos, name='estatisticas-cancelamentos'),
+    path('api/search/', BuscaView.as_view(), name='busca_api'),
+    path('api/cache/', CacheView.as_view(), name='cache_api'),
+    path('api/importacao/<str:tipo>/', ImportacaoView.as_view(), name='importacao_api'),
+    path('api/exportacao/<str:tipo>/', ExportacaoView.as_view(), name='exportacao_api'),
     path('api/', include(router.urls)),
 
     path('api/login/', MyTokenObtainPairView.as_view(), name='token_obtain_pair'),
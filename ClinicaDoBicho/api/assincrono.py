@@ -0,0 +1,172 @@
+"""
+Endpoints da API consultados em intervalos curtos pelas telas de calendário
+e dashboard, servidos por views assíncronas: rodando com ASGI, uma requisição
+esperando o banco não prende uma thread do servidor.
+
+O DRF não tem views assíncronas; ``api_assincrona`` faz o que a APIView faria
+para estes GETs (mesma autenticação das viewsets, mesmas respostas de erro e
+o mesmo renderer JSON).
+"""
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse, HttpResponseBase
+from rest_framework import exceptions
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+from core import agenda, estatisticas, notificacoes
+from core.models import Consulta
+from .renderers import JSONRapidoRenderer
+
+
+def _resposta(dados, status=200, cabecalhos=None):
+    resposta = HttpResponse(JSONRapidoRenderer().render(dados), status=status,
+                            content_type='application/json')
+    for nome, valor in (cabecalhos or {}).items():
+        resposta[nome] = valor
+    return resposta
+
+
+def _resposta_de_erro(request, autenticadores, erro):
+    cabecalhos = {}
+    status = erro.status_code
+    if isinstance(erro, (exceptions.NotAuthenticated, exceptions.AuthenticationFailed)):
+        # Como a APIView: 401 com WWW-Authenticate quando o autenticador informa um
+        cabecalho = autenticadores[0].authenticate_header(request) if autenticadores else None
+        if cabecalho:
+            cabecalhos['WWW-Authenticate'] = cabecalho
+        else:
+            status = 403
+    dados = erro.detail if isinstance(erro.detail, (list, dict)) else {'detail': erro.detail}
+    return _resposta(dados, status, cabecalhos)
+
+
+def api_assincrona(view):
+    """
+    Autentica com ``DEFAULT_AUTHENTICATION_CLASSES`` (a consulta do usuário
+    roda numa thread, fora do loop de eventos), exige usuário autenticado e
+    chama ``view(request, usuario)``, que devolve os dados da resposta (ou
+    uma resposta pronta, como o fluxo SSE).
+    """
+    @wraps(view)
+    async def envolvida(request, *args, **kwargs):
+        autenticadores = [classe() for classe in api_settings.DEFAULT_AUTHENTICATION_CLASSES]
+        if request.method != 'GET':
+            return _resposta_de_erro(request, autenticadores, exceptions.MethodNotAllowed(request.method))
+        requisicao = Request(request, authenticators=autenticadores)
+        try:
+            usuario = await sync_to_async(lambda: requisicao.user)()
+            if not usuario.is_authenticated:
+                raise exceptions.NotAuthenticated()
+            dados = await view(request, usuario, *args, **kwargs)
+        except exceptions.APIException as erro:
+            return _resposta_de_erro(request, autenticadores, erro)
+        if isinstance(dados, HttpResponseBase):
+            return dados
+        return _resposta(dados)
+    return envolvida
+
+
+@api_assincrona
+async def resumo_consultas(request, usuario):
+    """
+    GET /api/consultas/resumo_consultas/[?inicio=&fim=&por_veterinario=1]
+    """
+    params = request.GET
+    por_veterinario = params.get("por_veterinario") in ("1", "true")
+    qs = Consulta.objects.visiveis_para(usuario)
+
+    # Caso comum (dashboard sem filtros): servido do cache
+    if not (params.get("inicio") or params.get("fim") or por_veterinario):
+        return await estatisticas.aresumo_em_cache(usuario, qs)
+
+    try:
+        qs = estatisticas.filtrar_periodo(qs, params)
+    except ValueError as e:
+        raise exceptions.ParseError(str(e))
+
+    if por_veterinario:
+        return await estatisticas.aresumo_por_veterinario(qs)
+    return await estatisticas.aresumo_consultas(qs)
+
+
+@api_assincrona
+async def eventos_veterinario(request, usuario):
+    """
+    GET /api/consultas/eventos_veterinario/?veterinario=<id>[&start=&end=]
+    """
+    veterinario_id = request.GET.get("veterinario")
+    if not veterinario_id or not veterinario_id.isdigit():
+        return []
+
+    try:
+        inicio, fim = agenda.intervalo_da_requisicao(request.GET)
+    except ValueError as e:
+        raise exceptions.ParseError(str(e))
+
+    return await agenda.aeventos_veterinario_em_cache(int(veterinario_id), inicio, fim)
+
+
+@api_assincrona
+async def proximos_horarios(request, usuario):
+    """
+    GET /api/consultas/proximos_horarios/[?especialidade=&a_partir_de=&limite=5]
+
+    Os primeiros horários livres entre todos os veterinários da
+    especialidade, do mais cedo para o mais tarde.
+    """
+    try:
+        inicio, limite = agenda.parametros_da_busca(request.GET)
+    except ValueError as e:
+        raise exceptions.ParseError(str(e))
+    return await agenda.aproximos_horarios(request.GET.get("especialidade", "").strip(), inicio, limite)
+
+
+@api_assincrona
+async def avisos_consultas(request, usuario):
+    """
+    GET /api/consultas/avisos/[?veterinario=<id>]
+
+    Fluxo SSE com as consultas criadas, alteradas, canceladas e removidas
+    (core/notificacoes.py). Sem veterinário, quem não é da equipe só recebe
+    avisos das próprias consultas. Só com ASGI; com WSGI, 204.
+    """
+    veterinario_id = request.GET.get("veterinario")
+    if veterinario_id is not None and not veterinario_id.isdigit():
+        raise exceptions.ParseError("veterinario deve ser um número.")
+    if veterinario_id is not None:
+        return notificacoes.resposta_sse(request, veterinario_id=int(veterinario_id))
+    return notificacoes.resposta_sse(request, usuario_id=None if usuario.is_staff else usuario.pk)
+
+
+@api_assincrona
+async def serie_ocupacao(request, usuario):
+    """
+    GET /api/estatisticas/ocupacao/[?inicio=&fim=&agrupar=dia|semana|mes&veterinario=<id>]
+
+    Slots de trabalho, slots ocupados e ocupação por período (só a equipe).
+    """
+    if not usuario.is_staff:
+        raise exceptions.PermissionDenied()
+    try:
+        inicio, fim, agrupar, veterinario_id = estatisticas.parametros_da_serie(request.GET)
+    except ValueError as e:
+        raise exceptions.ParseError(str(e))
+    return await estatisticas.aserie_ocupacao(inicio, fim, agrupar, veterinario_id)
+
+
+@api_assincrona
+async def serie_cancelamentos(request, usuario):
+    """
+    GET /api/estatisticas/cancelamentos/[?inicio=&fim=&agrupar=dia|semana|mes&veterinario=<id>]
+
+    Consultas, canceladas e taxa de cancelamento por período (só a equipe).
+    """
+    if not usuario.is_staff:
+        raise exceptions.PermissionDenied()
+    try:
+        inicio, fim, agrupar, veterinario_id = estatisticas.parametros_da_serie(request.GET)
+    except ValueError as e:
+        raise exceptions.ParseError(str(e))
+    return await estatisticas.aserie_cancelamentos(inicio, fim, agrupar, veterinario_id)
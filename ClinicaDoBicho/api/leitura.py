@@ -0,0 +1,121 @@
+from decimal import Decimal
+
+from django.utils import timezone
+from rest_framework.response import Response
+
+from core.metricas import medir
+from core.models import Animal
+
+CENTAVOS = Decimal('0.01')
+TIPOS_ESPECIE = dict(Animal.ESPECIES)
+
+
+def data_hora(valor, fuso):
+    # Mesmo formato do DateTimeField do DRF (ISO 8601 no fuso atual)
+    if valor is None:
+        return None
+    texto = valor.astimezone(fuso).isoformat()
+    if texto.endswith('+00:00'):
+        texto = texto[:-6] + 'Z'
+    return texto
+
+
+def decimal(valor):
+    # Mesmo formato do DecimalField do DRF (texto com 2 casas)
+    if valor is None:
+        return None
+    return f'{valor.quantize(CENTAVOS):f}'
+
+
+COLUNAS_ANIMAL = ('id', 'nome', 'especie', 'raca', 'idade', 'peso',
+                  'dono_id', 'dono__nome', 'dono__cpf')
+
+
+def animal_em_dict(linha, prefixo=''):
+    """
+    Linha de ``values(*COLUNAS_ANIMAL)`` no formato do ``AnimalSerializer``.
+    """
+    especie = linha[prefixo + 'especie']
+    return {
+        'id': linha[prefixo + 'id'],
+        'nome': linha[prefixo + 'nome'],
+        'especie': especie,
+        'tipo_especie': TIPOS_ESPECIE.get(especie, 'Desconhecido'),
+        'raca': linha[prefixo + 'raca'],
+        'idade': linha[prefixo + 'idade'],
+        'peso': decimal(linha[prefixo + 'peso']),
+        'dono': {
+            'id': linha[prefixo + 'dono_id'],
+            'nome': linha[prefixo + 'dono__nome'],
+            'cpf': linha[prefixo + 'dono__cpf'],
+        },
+    }
+
+
+def animais_em_dicts(linhas):
+    return [animal_em_dict(linha) for linha in linhas]
+
+
+COLUNAS_CONSULTA = (
+    ('id', 'data', 'motivo', 'observacoes', 'status', 'created_at', 'updated_at',
+     'veterinario_id', 'veterinario__nome', 'veterinario__especialidade')
+    + tuple(f'animal__{coluna}' for coluna in COLUNAS_ANIMAL)
+)
+
+
+def consultas_em_dicts(linhas):
+    """
+    Linhas de ``values(*COLUNAS_CONSULTA)`` no formato do ``ConsultaSerializer``.
+    """
+    fuso = timezone.get_current_timezone()
+    resultado = []
+    for linha in linhas:
+        veterinario = None
+        if linha['veterinario_id'] is not None:
+            veterinario = {
+                'id': linha['veterinario_id'],
+                'nome': linha['veterinario__nome'],
+                'especialidade': linha['veterinario__especialidade'],
+            }
+        resultado.append({
+            'id': linha['id'],
+            'animal': animal_em_dict(linha, 'animal__'),
+            'veterinario': veterinario,
+            'data': data_hora(linha['data'], fuso),
+            'motivo': linha['motivo'],
+            'observacoes': linha['observacoes'],
+            'status': linha['status'],
+            'created_at': data_hora(linha['created_at'], fuso),
+            'updated_at': data_hora(linha['updated_at'], fuso),
+        })
+    return resultado
+
+
+class LeituraRapidaMixin:
+    """
+    Listagem somente leitura sem o ``ModelSerializer``: as linhas vêm de
+    ``values(*colunas_rapidas)`` (os JOINs ficam no próprio SELECT) e viram
+    dicts em ``linhas_em_dicts`` (um ``staticmethod``), com a mesma saída do serializer da viewset.
+    Com ``?fields=``/``?expand=`` a listagem volta para o serializer.
+    """
+    colunas_rapidas = ()
+    linhas_em_dicts = None
+
+    def leitura_rapida(self):
+        selecao = getattr(self, 'selecao_de_campos', lambda: (None, None))()
+        return self.linhas_em_dicts is not None and selecao == (None, None)
+
+    def list(self, request, *args, **kwargs):
+        if not self.leitura_rapida():
+            return super().list(request, *args, **kwargs)
+
+        linhas = self.filter_queryset(self.get_queryset()).values(*self.colunas_rapidas)
+        # A paginação por cursor também aceita dicts (lê data/id das linhas)
+        pagina = self.paginate_queryset(linhas)
+        if pagina is not None:
+            with medir('serializacao'):
+                dados = self.linhas_em_dicts(pagina)
+            return self.get_paginated_response(dados)
+        linhas = list(linhas)  # a consulta fora do tempo de serialização
+        with medir('serializacao'):
+            return Response(self.linhas_em_dicts(linhas))
@@ -0,0 +1,117 @@
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.decorators import action
+from rest_framework.response import Response
+
+from core.models import MENSAGEM_HORARIO_OCUPADO, horario_ocupado
+
+
+class LoteMixin:
+    """
+    Adiciona ``POST <recurso>/lote/`` à viewset. O corpo é uma lista de
+    objetos; os que têm ``id`` são atualizações parciais, os demais são
+    inserções. O lote inteiro é validado antes de gravar (campos item a item,
+    chaves estrangeiras e conflitos em consultas por conjunto em
+    ``validar_lote``) e gravado com um ``bulk_create``/``bulk_update`` numa
+    única transação. A resposta traz um resultado curto por item.
+    """
+    lote_serializer_class = None
+    lote_tamanho_maximo = 1000
+
+    def validar_lote(self, validos, existentes):
+        """
+        Validações que dependem do banco, feitas de uma vez para o lote.
+        ``validos`` é {indice: dados validados} e pode ser ajustado no lugar;
+        retorna {indice: erros} dos itens rejeitados.
+        """
+        return {}
+
+    def lote_gravado(self, objetos):
+        """
+        ``bulk_create``/``bulk_update`` não disparam ``post_save``; as viewsets
+        que dependem dos signals refazem aqui o mesmo trabalho para o lote.
+        """
+
+    @action(detail=False, methods=['post'])
+    def lote(self, request):
+        itens = request.data
+        if not isinstance(itens, list) or not itens:
+            return Response({'detail': 'Envie uma lista de objetos.'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(itens) > self.lote_tamanho_maximo:
+            return Response(
+                {'detail': f'O lote deve ter no máximo {self.lote_tamanho_maximo} itens.'},
+                status=status.HTTP_400_BAD_REQUEST)
+
+        resultados = {}
+        validos = {}
+        contexto = self.get_serializer_context()
+        for indice, item in enumerate(itens):
+            atualizacao = isinstance(item, dict) and item.get('id') is not None
+            serializer = self.lote_serializer_class(data=item, partial=atualizacao, context=contexto)
+            if serializer.is_valid():
+                validos[indice] = dict(serializer.validated_data)
+            else:
+                resultados[indice] = {'indice': indice, 'status': 'erro', 'erros': serializer.errors}
+
+        # Objetos a atualizar: um único SELECT, limitado ao que o usuário pode ver
+        ids = [dados['id'] for dados in validos.values() if dados.get('id') is not None]
+        existentes = self.get_queryset().in_bulk(ids) if ids else {}
+        for indice, dados in list(validos.items()):
+            if dados.get('id') is not None and dados['id'] not in existentes:
+                resultados[indice] = {'indice': indice, 'status': 'erro',
+                                      'erros': {'id': ['Objeto não encontrado.']}}
+                del validos[indice]
+
+        for indice, erros in self.validar_lote(validos, existentes).items():
+            resultados[indice] = {'indice': indice, 'status': 'erro', 'erros': erros}
+            validos.pop(indice, None)
+
+        modelo = self.get_queryset().model
+        novos, alterados, campos = [], [], set()
+        for indice, dados in validos.items():
+            pk = dados.pop('id', None)
+            if pk is None:
+                novos.append((indice, modelo(**dados)))
+            else:
+                objeto = existentes[pk]
+                for campo, valor in dados.items():
+                    setattr(objeto, campo, valor)
+                campos.update(dados)
+                alterados.append((indice, objeto))
+
+        # bulk_update não aplica auto_now
+        if alterados and any(f.name == 'updated_at' for f in modelo._meta.fields):
+            agora = timezone.now()
+            for _indice, objeto in alterados:
+                objeto.updated_at = agora
+            campos.add('updated_at')
+
+        try:
+            with transaction.atomic():
+                modelo.objects.bulk_create([objeto for _indice, objeto in novos])
+                if alterados and campos:
+                    modelo.objects.bulk_update([objeto for _indice, objeto in alterados], list(campos))
+        except IntegrityError as e:
+            # Outro processo gravou um horário conflitante entre a validação e o INSERT
+            if horario_ocupado(e):
+                return Response({'detail': MENSAGEM_HORARIO_OCUPADO}, status=status.HTTP_409_CONFLICT)
+            raise
+
+        self.lote_gravado([objeto for _indice, objeto in novos + alterados])
+
+        for indice, objeto in novos:
+            resultados[indice] = {'indice': indice, 'status': 'criado', 'id': objeto.pk}
+        for indice, objeto in alterados:
+            resultados[indice] = {'indice': indice, 'status': 'atualizado', 'id': objeto.pk}
+
+        gravados = len(novos) + len(alterados)
+        if gravados == 0:
+            codigo = status.HTTP_400_BAD_REQUEST
+        elif gravados < len(itens):
+            codigo = status.HTTP_207_MULTI_STATUS
+        elif novos:
+            codigo = status.HTTP_201_CREATED
+        else:
+            codigo = status.HTTP_200_OK
+        return Response([resultados[indice] for indice in sorted(resultados)], status=codigo)
@@ -0,0 +1,186 @@
+import hashlib
+
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date
+from rest_framework.response import Response
+
+from core import cache
+
+
+class RelacionadosMixin:
+    """
+    Cada viewset declara os relacionamentos que o seu serializer percorre
+    (``select_related_campos`` para FK/OneToOne, ``prefetch_related_campos``
+    para relações reversas) e eles são aplicados automaticamente ao queryset,
+    evitando uma consulta extra por linha nos serializers aninhados.
+
+    Nas requisições GET a tela pode pedir só o que vai mostrar:
+
+    - ``?fields=id,data,animal``: apenas esses campos no primeiro nível;
+    - ``?expand=animal,animal.dono``: só esses objetos aninhados são
+      serializados por inteiro, os demais viram o id.
+
+    Sem os parâmetros a resposta é a de sempre. Os JOINs de relacionamentos
+    que não serão serializados saem do queryset.
+    """
+    select_related_campos = ()
+    prefetch_related_campos = ()
+
+    def selecao_de_campos(self):
+        """
+        (campos, expandir) pedidos na querystring; None quando o parâmetro não veio.
+        """
+        if not hasattr(self, '_selecao_de_campos'):
+            params = self.request.query_params if self.request.method == 'GET' else {}
+
+            def nomes(parametro):
+                if parametro not in params:
+                    return None
+                return {nome.strip() for nome in params[parametro].split(',') if nome.strip()}
+
+            self._selecao_de_campos = (nomes('fields') or None, nomes('expand'))
+        return self._selecao_de_campos
+
+    def relacao_incluida(self, caminho):
+        """
+        Se o relacionamento (``animal__dono``) aparece expandido na resposta.
+        """
+        if not caminho:
+            return True
+        campos, expandir = self.selecao_de_campos()
+        partes = caminho.split('__')
+        if campos is not None and partes[0] not in campos:
+            return False
+        if expandir is None:
+            return True
+        return all('.'.join(partes[:i]) in expandir for i in range(1, len(partes) + 1))
+
+    def _relacoes_incluidas(self, caminhos):
+        # 'animal__dono' vira 'animal' quando só o animal for expandido
+        incluidas = []
+        for caminho in caminhos:
+            partes = caminho.split('__')
+            while partes and not self.relacao_incluida('__'.join(partes)):
+                partes.pop()
+            if partes:
+                incluidas.append('__'.join(partes))
+        return incluidas
+
+    def get_queryset(self):
+        qs = super().get_queryset()
+        select_related = self._relacoes_incluidas(self.select_related_campos)
+        if select_related:
+            qs = qs.select_related(*select_related)
+        prefetch_related = self._relacoes_incluidas(self.prefetch_related_campos)
+        if prefetch_related:
+            qs = qs.prefetch_related(*prefetch_related)
+        return qs
+
+    def get_serializer_context(self):
+        contexto = super().get_serializer_context()
+        contexto['campos'], contexto['expandir'] = self.selecao_de_campos()
+        return contexto
+
+
+class RespostaCondicionalMixin:
+    """
+    GET condicional (ETag / Last-Modified) em ``list`` e ``retrieve``.
+
+    A lista é identificada por uma única agregação sobre o queryset já
+    filtrado: quantidade de linhas e o maior ``updated_at`` entre os campos
+    de ``campos_atualizacao`` (os relacionamentos que o serializer mostra
+    também contam). Se o cliente já tem essa versão, a resposta é um 304 sem
+    corpo, antes de qualquer serialização. No detalhe a versão vem da
+    própria linha.
+    """
+    campos_atualizacao = ('updated_at',)
+
+    def _campos_de_versao(self):
+        # Relacionamentos fora da resposta (?fields=/?expand=) não contam
+        incluida = getattr(self, 'relacao_incluida', lambda caminho: True)
+        return [campo for campo in self.campos_atualizacao if incluida(campo.rpartition('__')[0])]
+
+    def versao_da_lista(self, queryset):
+        agregados = {f'ultimo_{i}': Max(campo) for i, campo in enumerate(self._campos_de_versao())}
+        valores = queryset.order_by().aggregate(total=Count('pk'), **agregados)
+        total = valores.pop('total')
+        return total, max(filter(None, valores.values()), default=None)
+
+    def versao_do_objeto(self, instancia):
+        datas = []
+        for campo in self._campos_de_versao():
+            valor = instancia
+            for parte in campo.split('__'):
+                valor = getattr(valor, parte, None)
+            if valor is not None:
+                datas.append(valor)
+        return max(datas, default=None)
+
+    def _etag(self, *partes):
+        # A mesma URL devolve conteúdos diferentes para cada usuário
+        chave = '|'.join(str(parte) for parte in
+                         (self.request.get_full_path(), self.request.user.pk, *partes))
+        return f'W/"{hashlib.md5(chave.encode()).hexdigest()}"'
+
+    def _condicional(self, etag, ultimo):
+        # Last-Modified tem resolução de segundos
+        ultimo_timestamp = int(ultimo.timestamp()) if ultimo else None
+        return get_conditional_response(self.request, etag=etag, last_modified=ultimo_timestamp)
+
+    def _cabecalhos(self, resposta, etag, ultimo):
+        resposta['ETag'] = etag
+        if ultimo:
+            resposta['Last-Modified'] = http_date(ultimo.timestamp())
+        # O navegador guarda a resposta, mas sempre revalida com o servidor
+        resposta['Cache-Control'] = 'private, no-cache'
+        patch_vary_headers(resposta, ('Authorization', 'Cookie'))
+        return resposta
+
+    def list(self, request, *args, **kwargs):
+        total, ultimo = self.versao_da_lista(self.filter_queryset(self.get_queryset()))
+        # Também entra na chave do CacheDeListaMixin: o corpo sempre corresponde ao ETag
+        self.versao_lista = f'{total}-{ultimo.timestamp() if ultimo else 0}'
+        etag = self._etag('lista', total, ultimo)
+        resposta = self._condicional(etag, ultimo)
+        if resposta is None:
+            resposta = super().list(request, *args, **kwargs)
+        return self._cabecalhos(resposta, etag, ultimo)
+
+    def retrieve(self, request, *args, **kwargs):
+        instancia = self.get_object()
+        ultimo = self.versao_do_objeto(instancia)
+        etag = self._etag('detalhe', ultimo)
+        resposta = self._condicional(etag, ultimo)
+        if resposta is None:
+            resposta = Response(self.get_serializer(instancia).data)
+        return self._cabecalhos(resposta, etag, ultimo)
+
+
+class CacheDeListaMixin:
+    """
+    Guarda as páginas da lista já serializadas no cache (core/cache.py).
+    A chave é a URL completa (página, filtros, ``?fields=``...) mais o
+    usuário quando ``cache_por_usuario``; os signals mudam a versão dos
+    ``cache_escopos`` sempre que um dos modelos mostrados é alterado.
+
+    Com o ``RespostaCondicionalMixin``, a versão da lista lida do banco
+    (quantidade e último ``updated_at``) também entra na chave. Assim uma
+    alteração que não passa pelos signals (``.update()``, ``bulk_update``,
+    ou outro processo com cache local) não serve uma página antiga com o
+    ETag novo.
+    """
+    cache_escopos = ()
+    cache_por_usuario = True
+
+    def list(self, request, *args, **kwargs):
+        if not self.cache_escopos:
+            return super().list(request, *args, **kwargs)
+
+        def listar():
+            return super(CacheDeListaMixin, self).list(request, *args, **kwargs).data
+
+        partes = [request.build_absolute_uri(), getattr(self, 'versao_lista', None)]
+        if self.cache_por_usuario:
+            partes.append(request.user.pk)
+        return Response(cache.obter(list(self.cache_escopos), partes, listar, cache.TEMPO_API))
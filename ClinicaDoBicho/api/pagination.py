@@ -0,0 +1,38 @@
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+
+
+class IdCursorPagination(CursorPagination):
+    """
+    Paginação por cursor (keyset): cada página é um ``WHERE id > cursor``
+    sobre o índice, com custo constante em qualquer profundidade.
+    """
+    ordering = 'id'
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+
+
+class ConsultaCursorPagination(IdCursorPagination):
+    ordering = ('data', 'id')
+
+
+class PaginaPagination(PageNumberPagination):
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if not queryset.ordered:
+            queryset = queryset.order_by('pk')
+        return super().paginate_queryset(queryset, request, view)
+
+
+class PaginacaoMixin:
+    """
+    Usa a paginação por cursor da viewset por padrão; com ``?page=N`` na
+    querystring troca para a paginação numerada (telas administrativas).
+    """
+
+    @property
+    def paginator(self):
+        if not hasattr(self, '_paginator') and 'page' in self.request.query_params:
+            self._paginator = PaginaPagination()
+        return super().paginator
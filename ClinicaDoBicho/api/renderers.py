@@ -0,0 +1,33 @@
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+from core.metricas import medir
+
+try:
+    import orjson
+except ImportError:  # opcional: sem ele o DRF usa o json da biblioteca padrão
+    orjson = None
+
+
+class JSONRapidoRenderer(JSONRenderer):
+    """
+    Mesmo JSON do ``JSONRenderer`` do DRF (compacto, UTF-8), gerado pelo
+    orjson (em C) quando ele está instalado. Tipos que o orjson não conhece
+    (Decimal, textos traduzíveis...) passam pelo encoder do DRF.
+    """
+    _encoder = JSONEncoder()
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        with medir('serializacao'):
+            return self._render(data, accepted_media_type, renderer_context)
+
+    def _render(self, data, accepted_media_type, renderer_context):
+        if orjson is None or data is None:
+            return super().render(data, accepted_media_type, renderer_context)
+        # JSON indentado (API navegável, ?indent=) fica com o renderer padrão
+        if self.get_indent(accepted_media_type or '', renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        ret = orjson.dumps(data, default=self._encoder.default, option=orjson.OPT_NON_STR_KEYS)
+        # Mesmo tratamento do JSONRenderer para os separadores de linha do JavaScript
+        return ret.replace('\u2028'.encode(), b'\\u2028').replace('\u2029'.encode(), b'\\u2029')
@@ -1,25 +1,76 @@
 from rest_framework import serializers
-from core.models import Cliente, Animal, MedicoVeterinario, Consulta
+from core import agenda, recorrencia
+from core.metricas import medir
+from core.models import Cliente, Animal, MedicoVeterinario, Consulta, normalizar_cpf
 from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError as DjangoValidationError
 
-class UserSerializer(serializers.ModelSerializer):
+class CamposDinamicosMixin:
+    """
+    Aplica ``?fields=`` e ``?expand=`` (ver ``RelacionadosMixin`` em
+    api/mixins.py), lidos do contexto: remove os campos não pedidos do
+    primeiro nível e troca os serializers aninhados não expandidos pelo id.
+    """
+
+    def _caminho(self):
+        partes = []
+        campo = self
+        while campo.parent is not None:
+            if campo.field_name:
+                partes.append(campo.field_name)
+            campo = campo.parent
+        return '.'.join(reversed(partes))
+
+    def get_fields(self):
+        fields = super().get_fields()
+        campos = self.context.get('campos')
+        expandir = self.context.get('expandir')
+        caminho = self._caminho()
+
+        if campos is not None and not caminho:
+            fields = {nome: campo for nome, campo in fields.items() if nome in campos}
+        if expandir is not None:
+            for nome, campo in fields.items():
+                completo = f'{caminho}.{nome}' if caminho else nome
+                if isinstance(campo, serializers.BaseSerializer) and completo not in expandir:
+                    # Só o id, lido da chave estrangeira (sem JOIN)
+                    fields[nome] = serializers.PrimaryKeyRelatedField(read_only=True)
+        return fields
+
+    def to_representation(self, instance):
+        # Tempo de serialização da requisição (core/metricas.py)
+        with medir('serializacao'):
+            return super().to_representation(instance)
+
+
+class UserSerializer(CamposDinamicosMixin, serializers.ModelSerializer):
     class Meta:
         model = User
         fields = ['id', 'username', 'email', 'first_name', 'last_name']
         read_only_fields = ['id']
  
-class ClienteSerializer(serializers.ModelSerializer):
+class ClienteSerializer(CamposDinamicosMixin, serializers.ModelSerializer):
     usuario = UserSerializer(read_only=True)
     class Meta:
         model = Cliente
-        fields = '__all__'
+        exclude = ['cpf_digitos']
+
+    def validate_cpf(self, value):
+        digitos = normalizar_cpf(value)
+        if self.instance is not None and digitos == normalizar_cpf(self.instance.cpf):
+            # CPF não mudou (ver Cliente.digitos_para_gravar)
+            return value
+        if digitos and Cliente.objects.filter(cpf_digitos=digitos).exclude(
+                pk=getattr(self.instance, 'pk', None)).exists():
+            raise serializers.ValidationError('Já existe um cliente com este CPF.')
+        return value
 
-class ClienteSimpleSerializer(serializers.ModelSerializer):
+class ClienteSimpleSerializer(CamposDinamicosMixin, serializers.ModelSerializer):
     class Meta:
         model = Cliente
         fields = ['id', 'nome', 'cpf']
 
-class AnimalSerializer(serializers.ModelSerializer):
+class AnimalSerializer(CamposDinamicosMixin, serializers.ModelSerializer):
     dono = ClienteSimpleSerializer(read_only=True)
     tipo_especie = serializers.CharField(source='get_tipo_especie', read_only=True)
 
@@ -27,18 +78,54 @@ class AnimalSerializer(serializers.ModelSerializer):
         model = Animal
         fields = ('id', 'nome','especie', 'tipo_especie', 'raca', 'idade', 'peso', 'dono')
 
-class MedicoVeterinarioSimpleSerializer(serializers.ModelSerializer):
+class MedicoVeterinarioSimpleSerializer(CamposDinamicosMixin, serializers.ModelSerializer):
     class Meta:
         model = MedicoVeterinario
         fields = ['id', 'nome', 'especialidade']
 
-class MedicoVeterinarioSerializer(serializers.ModelSerializer):
+class MedicoVeterinarioSerializer(CamposDinamicosMixin, serializers.ModelSerializer):
     class Meta:
         model = MedicoVeterinario
         fields = '__all__'
 
 
-class ConsultaSerializer(serializers.ModelSerializer):
+class HorarioUnicoMixin:
+    """
+    O conflito de horário é verificado pela constraint do banco no momento do
+    INSERT/UPDATE (sem consulta extra antes); aqui ele vira um erro 400.
+    """
+
+    def create(self, validated_data):
+        try:
+            return super().create(validated_data)
+        except DjangoValidationError as e:
+            raise serializers.ValidationError({'non_field_errors': e.messages})
+
+    def update(self, instance, validated_data):
+        try:
+            return super().update(instance, validated_data)
+        except DjangoValidationError as e:
+            raise serializers.ValidationError({'non_field_errors': e.messages})
+
+
+class HorarioNaGradeMixin:
+    """
+    Como nas séries (core/recorrencia.py), o horário tem de caber na grade do
+    veterinário: jornada, pausas, folgas e início de slot.
+    """
+
+    def validate(self, attrs):
+        attrs = super().validate(attrs)
+        if 'data' in attrs or 'veterinario' in attrs:
+            veterinario = attrs.get('veterinario', getattr(self.instance, 'veterinario', None))
+            data = attrs.get('data', getattr(self.instance, 'data', None))
+            erro = veterinario and data and agenda.situacao_na_grade(veterinario.pk, data)
+            if erro:
+                raise serializers.ValidationError({'data': [erro]})
+        return attrs
+
+
+class ConsultaSerializer(HorarioNaGradeMixin, HorarioUnicoMixin, CamposDinamicosMixin, serializers.ModelSerializer):
     animal = AnimalSerializer(read_only=True)
     veterinario = MedicoVeterinarioSimpleSerializer(read_only=True)
 
@@ -47,7 +134,7 @@ class ConsultaSerializer(serializers.ModelSerializer):
         fields = '__all__' 
 
 
-class ConsultaAddSerializer(serializers.ModelSerializer):
+class ConsultaAddSerializer(HorarioNaGradeMixin, HorarioUnicoMixin, serializers.ModelSerializer):
     animal = serializers.PrimaryKeyRelatedField(
         queryset=Animal.objects.all(), write_only=True
     )
@@ -57,4 +144,57 @@ class ConsultaAddSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Consulta
-        fields = '__all__'
\ No newline at end of file
+        fields = '__all__'
+        # Sem o UniqueTogetherValidator gerado a partir da constraint:
+        # a verificação fica no banco (ver HorarioUnicoMixin).
+        validators = []
+
+
+class ConsultaRecorrenteSerializer(serializers.ModelSerializer):
+    """
+    POST /api/consultas/recorrente/: a consulta, com a data da primeira
+    ocorrência, e a regra da série (core/recorrencia.py).
+    """
+    animal = serializers.PrimaryKeyRelatedField(queryset=Animal.objects.all())
+    veterinario = serializers.PrimaryKeyRelatedField(queryset=MedicoVeterinario.objects.all())
+    intervalo = serializers.IntegerField(min_value=1, max_value=365)
+    unidade = serializers.ChoiceField(choices=list(recorrencia.UNIDADES))
+    ocorrencias = serializers.IntegerField(min_value=2, max_value=recorrencia.MAXIMO_OCORRENCIAS)
+    pular_fim_de_semana = serializers.BooleanField(default=True)
+
+    class Meta:
+        model = Consulta
+        fields = ['animal', 'veterinario', 'data', 'motivo', 'observacoes',
+                  'intervalo', 'unidade', 'ocorrencias', 'pular_fim_de_semana']
+        validators = []
+
+
+# Serializers planos usados nos endpoints de lote (POST <recurso>/lote/):
+# chaves estrangeiras chegam como ids e são conferidas de uma vez na viewset.
+
+class ClienteLoteSerializer(serializers.ModelSerializer):
+    id = serializers.IntegerField(required=False)
+
+    class Meta:
+        model = Cliente
+        fields = ['id', 'nome', 'cpf', 'telefone', 'email', 'endereco']
+
+
+class AnimalLoteSerializer(serializers.ModelSerializer):
+    id = serializers.IntegerField(required=False)
+    dono = serializers.IntegerField(source='dono_id', required=False)
+
+    class Meta:
+        model = Animal
+        fields = ['id', 'nome', 'especie', 'raca', 'idade', 'peso', 'dono']
+
+
+class ConsultaLoteSerializer(serializers.ModelSerializer):
+    id = serializers.IntegerField(required=False)
+    animal = serializers.IntegerField(source='animal_id')
+    veterinario = serializers.IntegerField(source='veterinario_id')
+
+    class Meta:
+        model = Consulta
+        fields = ['id', 'animal', 'veterinario', 'data', 'motivo', 'observacoes', 'status']
+        validators = []
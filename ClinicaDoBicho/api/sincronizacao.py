@@ -0,0 +1,93 @@
+from datetime import timedelta
+
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from rest_framework.response import Response
+
+from core.models import Remocao
+
+
+def _data(texto):
+    try:
+        data = parse_datetime(texto.replace(' ', '+'))
+    except ValueError:
+        # Bem formada, mas impossível (mês 13, dia 45...)
+        return None
+    if data is not None and timezone.is_naive(data):
+        data = timezone.make_aware(data)
+    return data
+
+
+class SincronizacaoMixin:
+    """
+    Sincronização incremental para o aplicativo (modo offline).
+
+    ``GET <recurso>/?since=<marca>`` devolve só as linhas com ``updated_at``
+    posterior à marca (pelo índice em ``updated_at``) e os ids removidos
+    desde então (tabela ``Remocao``, alimentada pelo ``post_delete``):
+
+        {"marca": "...", "completo": true, "alterados": [...], "removidos": [ids]}
+
+    Na primeira sincronização a marca é uma data ISO 8601; depois, o cliente
+    envia como ``since`` a ``marca`` da resposta anterior. ``alterados`` vem
+    em páginas de ``sincronizacao_tamanho_pagina`` linhas, em ordem de
+    (``updated_at``, id): com ``completo`` falso, a marca é a continuação
+    (``<data>~<updated_at>~<id>``) e o cliente pede de novo até completar.
+
+    A marca fica ``sincronizacao_margem`` antes do início da requisição: uma
+    transação longa (uma importação em lote, por exemplo) grava
+    ``updated_at`` antes de confirmar e só fica visível depois; sem a margem,
+    essas linhas ficariam para trás. Em troca, as linhas alteradas dentro da
+    margem vêm de novo na sincronização seguinte. As listas normais também
+    trazem a marca no cabeçalho ``X-Sync-Marca``, para a carga inicial.
+    """
+    # Clientes (usuários sem is_staff) só recebem as remoções dos próprios objetos
+    sincronizacao_por_usuario = True
+    sincronizacao_tamanho_pagina = 500
+    sincronizacao_margem = timedelta(minutes=1)
+
+    def list(self, request, *args, **kwargs):
+        marca = timezone.now() - self.sincronizacao_margem
+        since = request.query_params.get('since')
+        if since is None:
+            resposta = super().list(request, *args, **kwargs)
+            resposta['X-Sync-Marca'] = marca.isoformat()
+            return resposta
+
+        partes = since.split('~')
+        desde = _data(partes[0])
+        if desde is None or len(partes) not in (1, 3):
+            return Response({'detail': 'since deve ser uma data ISO 8601 ou a marca da última sincronização.'},
+                            status=400)
+
+        alterados = self.filter_queryset(self.get_queryset()).order_by('updated_at', 'id')
+        if len(partes) == 1:
+            alterados = alterados.filter(updated_at__gt=desde)
+        else:
+            # Continuação: a marca da primeira página segue até o fim
+            apos = _data(partes[1])
+            if apos is None or not partes[2].isdigit():
+                return Response({'detail': 'Marca de continuação inválida.'}, status=400)
+            marca = min(marca, desde)
+            alterados = alterados.filter(Q(updated_at__gt=apos) | Q(updated_at=apos, id__gt=int(partes[2])))
+        pagina = list(alterados[:self.sincronizacao_tamanho_pagina + 1])
+        completo = len(pagina) <= self.sincronizacao_tamanho_pagina
+        pagina = pagina[:self.sincronizacao_tamanho_pagina]
+
+        removidos = Remocao.objects.filter(
+            modelo=self.get_queryset().model._meta.model_name, removido_em__gt=desde)
+        if not request.user.is_staff and self.sincronizacao_por_usuario:
+            removidos = removidos.filter(usuario_id=request.user.pk)
+
+        proxima = marca.isoformat()
+        if not completo:
+            proxima = f'{proxima}~{pagina[-1].updated_at.isoformat()}~{pagina[-1].pk}'
+        resposta = Response({
+            'marca': proxima,
+            'completo': completo,
+            'alterados': self.get_serializer(pagina, many=True).data,
+            'removidos': list(removidos.values_list('objeto_id', flat=True)),
+        })
+        resposta['X-Sync-Marca'] = marca.isoformat()
+        return resposta
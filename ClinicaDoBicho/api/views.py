@@ -1,26 +1,96 @@
+import io
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.exceptions import ValidationError as DjangoValidationError
+
 from rest_framework import viewsets
-from rest_framework.permissions import IsAuthenticated
-from core.models import Cliente, Animal, MedicoVeterinario, Consulta
-from rest_framework.response import Response
 from rest_framework.decorators import action
+from rest_framework.parsers import MultiPartParser
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
+from rest_framework.views import APIView
+from core.models import (Cliente, Animal, MedicoVeterinario, Consulta,
+                         MENSAGEM_HORARIO_OCUPADO, normalizar_cpf)
+from core import agenda, busca, cache, exportacao, importacao, recorrencia
+from core.signals import consultas_gravadas_em_lote, gravados_em_lote
+from rest_framework.response import Response
 
 from .serializers import (ClienteSerializer, 
                           AnimalSerializer,     
                           MedicoVeterinarioSerializer, 
                           ConsultaAddSerializer,
                           ConsultaSerializer,
+                          ClienteLoteSerializer,
+                          AnimalLoteSerializer,
+                          ConsultaLoteSerializer,
+                          ConsultaRecorrenteSerializer,
                           ) 
+from .leitura import (LeituraRapidaMixin, COLUNAS_ANIMAL, COLUNAS_CONSULTA,
+                      animais_em_dicts, consultas_em_dicts)
+from .lote import LoteMixin
+from .sincronizacao import SincronizacaoMixin
+from .mixins import CacheDeListaMixin, RelacionadosMixin, RespostaCondicionalMixin
+from .pagination import PaginacaoMixin, ConsultaCursorPagination
 
-class ClienteViewSet(viewsets.ModelViewSet):
+class ClienteViewSet(LoteMixin, SincronizacaoMixin, RespostaCondicionalMixin, CacheDeListaMixin,
+                     RelacionadosMixin, PaginacaoMixin, viewsets.ModelViewSet):
     queryset = Cliente.objects.all()
     serializer_class = ClienteSerializer
     permission_classes = [IsAuthenticated]
+    select_related_campos = ('usuario',)
+    # A lista de clientes não é filtrada por usuário
+    sincronizacao_por_usuario = False
+    cache_escopos = ('api:clientes',)
+    cache_por_usuario = False
+    lote_serializer_class = ClienteLoteSerializer
+
+    def lote_gravado(self, objetos):
+        busca.indexar(*objetos)
+        gravados_em_lote(objetos)
+
+    def validar_lote(self, validos, existentes):
+        # bulk_create não chama Cliente.save(): normaliza o CPF aqui
+        erros = {}
+        com_cpf = {}
+        for indice, dados in validos.items():
+            if 'cpf' in dados:
+                dados['cpf_digitos'] = normalizar_cpf(dados['cpf']) or None
+                existente = existentes.get(dados.get('id'))
+                if existente is not None and dados['cpf_digitos'] == normalizar_cpf(existente.cpf):
+                    # CPF não mudou (ver Cliente.digitos_para_gravar)
+                    dados['cpf_digitos'] = existente.cpf_digitos
+                elif dados['cpf_digitos']:
+                    com_cpf[indice] = dados['cpf_digitos']
+
+        # CPFs repetidos no banco ou dentro do lote, em uma única consulta
+        cadastrados = dict(Cliente.objects.filter(
+            cpf_digitos__in=com_cpf.values()).values_list('cpf_digitos', 'id'))
+        vistos = {}
+        for indice, cpf in com_cpf.items():
+            if cpf in cadastrados and cadastrados[cpf] != validos[indice].get('id'):
+                erros[indice] = {'cpf': ['Já existe um cliente com este CPF.']}
+            elif cpf in vistos:
+                erros[indice] = {'cpf': [f'CPF repetido no item {vistos[cpf]} do lote.']}
+            else:
+                vistos[cpf] = indice
+        return erros
     
 
-class AnimalViewSet(viewsets.ModelViewSet):
+class AnimalViewSet(LoteMixin, SincronizacaoMixin, RespostaCondicionalMixin, CacheDeListaMixin, LeituraRapidaMixin,
+                    RelacionadosMixin, PaginacaoMixin, viewsets.ModelViewSet):
     queryset = Animal.objects.all()
     serializer_class = AnimalSerializer
     permission_classes = [IsAuthenticated]
+    select_related_campos = ('dono',)
+    campos_atualizacao = ('updated_at', 'dono__updated_at')
+    colunas_rapidas = COLUNAS_ANIMAL
+    cache_escopos = ('api:animais',)
+    linhas_em_dicts = staticmethod(animais_em_dicts)
+    lote_serializer_class = AnimalLoteSerializer
+
+    def lote_gravado(self, objetos):
+        busca.indexar(*objetos)
+        gravados_em_lote(objetos)
 
     def perform_create(self, serializer):
         serializer.save(dono=self.request.user.cliente)
@@ -29,22 +99,60 @@ class AnimalViewSet(viewsets.ModelViewSet):
         serializer.save(dono=self.request.user.cliente)
 
     def get_queryset(self):
+        qs = super().get_queryset()
         user = self.request.user
         if user.is_staff:
-            return Animal.objects.all()
-        return Animal.objects.filter(dono__usuario=user)
+            return qs
+        return qs.filter(dono__usuario=user)
+
+    def validar_lote(self, validos, existentes):
+        user = self.request.user
+        erros = {}
+
+        # Clientes só cadastram animais para si mesmos (como no POST simples)
+        if not user.is_staff:
+            cliente = getattr(user, 'cliente', None)
+            for indice, dados in validos.items():
+                if cliente is None:
+                    erros[indice] = {'dono': ['Usuário sem cadastro de cliente.']}
+                else:
+                    dados['dono_id'] = cliente.id
+            return erros
 
+        for indice, dados in validos.items():
+            if dados.get('id') is None and dados.get('dono_id') is None:
+                erros[indice] = {'dono': ['Este campo é obrigatório.']}
 
-class MedicoVeterinarioViewSet(viewsets.ModelViewSet):
+        donos = {dados['dono_id'] for dados in validos.values() if dados.get('dono_id') is not None}
+        encontrados = set(Cliente.objects.filter(id__in=donos).values_list('id', flat=True))
+        for indice, dados in validos.items():
+            if dados.get('dono_id') is not None and dados['dono_id'] not in encontrados:
+                erros[indice] = {'dono': ['Cliente não encontrado.']}
+        return erros
+
+
+class MedicoVeterinarioViewSet(RespostaCondicionalMixin, CacheDeListaMixin, RelacionadosMixin, PaginacaoMixin,
+                               viewsets.ModelViewSet):
     queryset = MedicoVeterinario.objects.all()
     serializer_class = MedicoVeterinarioSerializer
     permission_classes = [IsAuthenticated]
+    cache_escopos = ('api:veterinarios',)
+    cache_por_usuario = False
 
 
-class ConsultaViewSet(viewsets.ModelViewSet):
+class ConsultaViewSet(LoteMixin, SincronizacaoMixin, RespostaCondicionalMixin, CacheDeListaMixin, LeituraRapidaMixin,
+                      RelacionadosMixin, PaginacaoMixin, viewsets.ModelViewSet):
     queryset = Consulta.objects.all()
     serializer_class = ConsultaSerializer 
     permission_classes = [IsAuthenticated]
+    pagination_class = ConsultaCursorPagination
+    select_related_campos = ('animal__dono', 'veterinario')
+    campos_atualizacao = ('updated_at', 'animal__updated_at', 'animal__dono__updated_at',
+                          'veterinario__updated_at')
+    colunas_rapidas = COLUNAS_CONSULTA
+    cache_escopos = ('api:consultas',)
+    linhas_em_dicts = staticmethod(consultas_em_dicts)
+    lote_serializer_class = ConsultaLoteSerializer
 
     def get_serializer_class(self):
         if self.action == 'create':
@@ -52,74 +160,185 @@ class ConsultaViewSet(viewsets.ModelViewSet):
         return ConsultaSerializer 
     
     def get_queryset(self):
+        return super().get_queryset().visiveis_para(self.request.user)
+
+    def validar_lote(self, validos, existentes):
         user = self.request.user
-        if user.is_staff:
-            return Consulta.objects.all()
-        return Consulta.objects.filter(animal__dono__usuario=user)
-        
-    @action(detail=False)
-    def resumo_consultas(self, request):
-        qs = self.get_queryset()
-
-        resumo = {
-            "todas": qs.count(), # 4 
-            "agendadas": qs.filter(status='Agendada').count(), # 5
-            "concluidas": qs.filter(status='Concluida').count(),
-            "canceladas": qs.filter(status='Cancelada').count(),
+        erros = defaultdict(dict)
+
+        # Atualizações parciais: completa com os valores atuais da consulta
+        def valor(dados, campo):
+            if campo in dados:
+                return dados[campo]
+            if dados.get('id') is not None:
+                return getattr(existentes[dados['id']], campo)
+            return Consulta._meta.get_field(campo.removesuffix('_id')).get_default()
+
+        animais = Animal.objects.all() if user.is_staff else Animal.objects.filter(dono__usuario=user)
+        animal_ids = set(animais.filter(
+            id__in={valor(d, 'animal_id') for d in validos.values()}).values_list('id', flat=True))
+        veterinario_ids = set(MedicoVeterinario.objects.filter(
+            id__in={valor(d, 'veterinario_id') for d in validos.values()}).values_list('id', flat=True))
+
+        horarios = {}
+        for indice, dados in validos.items():
+            if valor(dados, 'animal_id') not in animal_ids:
+                erros[indice]['animal'] = ['Animal não encontrado.']
+            if valor(dados, 'veterinario_id') not in veterinario_ids:
+                erros[indice]['veterinario'] = ['Veterinário não encontrado.']
+            if valor(dados, 'status') == Consulta.StatusConsulta.AGENDADA:
+                horarios[indice] = (valor(dados, 'veterinario_id'), valor(dados, 'data'))
+
+        # Jornada, pausas e folgas, como no POST simples (só dos horários novos ou alterados)
+        na_grade = [indice for indice, dados in validos.items() if indice in horarios and indice not in erros
+                    and (dados.get('id') is None or 'data' in dados or 'veterinario_id' in dados)]
+        for indice, erro in zip(na_grade, agenda.situacoes_na_grade(horarios[i] for i in na_grade)):
+            if erro:
+                erros[indice]['data'] = [erro]
+
+        # Conflitos de horário do lote inteiro em uma única consulta
+        ocupados = {
+            (veterinario_id, data): consulta_id
+            for consulta_id, veterinario_id, data in Consulta.objects.filter(
+                status=Consulta.StatusConsulta.AGENDADA,
+                veterinario_id__in={vet for vet, _data in horarios.values()},
+                data__in={data for _vet, data in horarios.values()},
+            ).values_list('id', 'veterinario_id', 'data')
         }
+        vistos = {}
+        for indice, horario in horarios.items():
+            if horario in ocupados and ocupados[horario] != validos[indice].get('id'):
+                erros[indice].setdefault('non_field_errors', []).append(MENSAGEM_HORARIO_OCUPADO)
+            elif horario in vistos:
+                erros[indice].setdefault('non_field_errors', []).append(
+                    f'Conflita com o item {vistos[horario]} do lote.')
+            else:
+                vistos[horario] = indice
+        return erros
 
-        return Response(resumo)
-    
-    @action(detail=False, methods=['get'])
-    def eventos_veterinario(self, request):   
-        from django.utils.timezone import localtime, make_aware, get_current_timezone
-        from datetime import datetime, time, timedelta # time é mais limpo que datetime.min.time() 
-
-        veterinario_id = request.query_params.get("veterinario")
-        if not veterinario_id:
-            return Response([], status=200)
-
-        # Consultas agendadas já no formato necessário
-        consultas = (
-            Consulta.objects.filter(veterinario_id=veterinario_id)
-            .select_related("animal", "veterinario")
-        )
-
-        consultas_dict = {
-              f"{localtime(c.data).strftime('%Y-%m-%d')}-{localtime(c.data).hour}": c.id for c in consultas
-          }
-        # 2025-09-12-09
-        print(consultas_dict)
-
-        eventos = [
-            {
-                "id": c.id,
-                "title": f"{c.animal.nome} - {c.veterinario.nome}",
-                "start": localtime(c.data).strftime("%Y-%m-%dT%H:%M:%S"), # 2: Converta para o fuso local
-                "color": "#dc3545",  # vermelho
-            }
-            for c in consultas
-        ]
-
-        hoje = localtime().date() # Use localtime() para pegar a data atual no fuso correto
-        horarios = [8, 9, 10, 11, 13, 14, 15, 16]
-
-        for i in range(7): 
-            data = hoje + timedelta(days=i)
-            if data.weekday() >= 5:  # Pula sábado e domingo
-                continue 
-
-            for hora in horarios:
-                key = f"{data.strftime('%Y-%m-%d')}-{hora}" 
-                print(key)
-                if key not in consultas_dict:
-                    slot_inicio = make_aware(datetime.combine(data, time(hour=hora)), get_current_timezone()) # timezone são paulo, portugal
-                    eventos.append(
-                        {
-                            "id": f"disp-{data}-{hora}",
-                            "title": "Disponível",
-                            "start": slot_inicio.strftime("%Y-%m-%dT%H:%M:%S"), # Formate o slot fuso horário
-                            "color": "#28a745",  # verde
-                        }
-                    )  
-        return Response(eventos)
\ No newline at end of file
+    def lote_gravado(self, objetos):
+        consultas_gravadas_em_lote(objetos)
+
+    @action(detail=False, methods=['post'])
+    def recorrente(self, request):
+        """
+        Agenda uma série de consultas (a cada ``intervalo`` dias ou semanas,
+        ``ocorrencias`` vezes). Com algum horário indisponível nada é gravado
+        e a resposta 409 traz os conflitos, cada um com sugestões.
+        """
+        serializer = ConsultaRecorrenteSerializer(data=request.data, context=self.get_serializer_context())
+        serializer.is_valid(raise_exception=True)
+        dados = dict(serializer.validated_data)
+        if not request.user.is_staff and dados['animal'].dono.usuario_id != request.user.id:
+            return Response({'animal': ['Animal não encontrado.']}, status=400)
+        regra = {campo: dados.pop(campo) for campo in ('intervalo', 'unidade', 'ocorrencias', 'pular_fim_de_semana')}
+        try:
+            consultas, conflitos = recorrencia.agendar_serie(Consulta(**dados), **regra)
+        except DjangoValidationError as e:
+            codigo = 409 if e.code == 'horario_ocupado' else 400
+            return Response({'detail': ' '.join(e.messages)}, status=codigo)
+        if conflitos:
+            return Response({'detail': f'{len(conflitos)} consulta(s) da série em horário indisponível.',
+                             'conflitos': conflitos}, status=409)
+        return Response({'consultas': [{'id': consulta.pk, 'data': consulta.data} for consulta in consultas]},
+                        status=201)
+        
+
+class BuscaView(APIView):
+    """
+    GET /api/search/?q=<texto>[&tipo=cliente|animal|veterinario][&limite=20]
+
+    Busca por relevância no índice textual (core/busca.py). Usuários que não
+    são da equipe só podem buscar veterinários.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        tipos = request.query_params.getlist('tipo') or list(busca.CODIGOS)
+        invalidos = [tipo for tipo in tipos if tipo not in busca.CODIGOS]
+        if invalidos:
+            return Response({"detail": f"Tipo inválido: {', '.join(invalidos)}"}, status=400)
+        if not request.user.is_staff:
+            tipos = [tipo for tipo in tipos if tipo == busca.VETERINARIO]
+
+        try:
+            limite = min(max(int(request.query_params.get('limite', 20)), 1), 100)
+        except ValueError:
+            return Response({"detail": "limite deve ser um número."}, status=400)
+
+        return Response(busca.buscar(request.query_params.get('q', ''), tipos, limite))
+
+
+class CacheView(APIView):
+    """
+    GET /api/cache/ - acertos e falhas do cache por escopo (equipe).
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response({
+            "backend": settings.CACHES["default"]["BACKEND"].rsplit(".", 1)[-1],
+            "escopos": cache.estatisticas(),
+        })
+
+
+class ImportacaoView(APIView):
+    """
+    POST /api/importacao/<tipo>/ (multipart, campo ``arquivo``) - importa
+    clientes, veterinários, animais ou consultas de um CSV ou JSONL (equipe).
+    Ver core/importacao.py. A resposta traz o resumo e os erros das primeiras
+    linhas rejeitadas; os arquivos muito grandes ficam melhor no comando
+    ``importar_dados``.
+    """
+    permission_classes = [IsAdminUser]
+    parser_classes = [MultiPartParser]
+    limite_erros = 1000
+
+    def post(self, request, tipo):
+        if tipo not in importacao.IMPORTADORES:
+            return Response({"detail": f"Tipo inválido: {tipo}"}, status=404)
+        arquivo = request.FILES.get('arquivo')
+        if arquivo is None:
+            return Response({"detail": "Envie o arquivo no campo 'arquivo'."}, status=400)
+        formato = request.query_params.get('formato') or importacao.formato_do_arquivo(arquivo.name)
+        if formato not in ('csv', 'jsonl'):
+            return Response({"detail": "Formato desconhecido: use ?formato=csv ou ?formato=jsonl."}, status=400)
+
+        erros = []
+
+        def guardar_erro(numero, mensagens):
+            if len(erros) < self.limite_erros:
+                erros.append({"linha": numero, "erros": mensagens})
+
+        # O Django já guardou o upload (em disco, se for grande): lido aos poucos
+        texto = io.TextIOWrapper(arquivo.file, encoding='utf-8-sig', newline='')
+        try:
+            resumo = importacao.importar(tipo, importacao.ler_linhas(texto, formato), ao_errar=guardar_erro)
+        except UnicodeDecodeError:
+            return Response({"detail": "O arquivo deve estar em UTF-8."}, status=400)
+
+        if resumo["gravadas"] == 0 and resumo["erros"]:
+            codigo = 400
+        elif resumo["erros"]:
+            codigo = 207
+        else:
+            codigo = 200
+        return Response({**resumo, "detalhes": erros}, status=codigo)
+
+
+class ExportacaoView(APIView):
+    """
+    GET /api/exportacao/<consultas|clientes>/?formato=csv|xlsx - relatório
+    enviado em fluxo (core/exportacao.py), para a equipe. As consultas
+    aceitam ``veterinario``, ``status``, ``inicio`` e ``fim`` (AAAA-MM-DD).
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, tipo):
+        if tipo not in exportacao.RELATORIOS:
+            return Response({"detail": f"Tipo inválido: {tipo}"}, status=404)
+        try:
+            return exportacao.resposta(request._request, tipo, request.query_params.get('formato', 'csv'),
+                                       request.query_params)
+        except ValueError as e:
+            return Response({"detail": str(e)}, status=400)
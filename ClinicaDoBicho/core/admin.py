@@ -1,8 +1,12 @@
 from django.contrib import admin
 from .models import (
-    Cliente, Animal, MedicoVeterinario, Consulta)
+    Cliente, Animal, MedicoVeterinario, Consulta,
+    JornadaVeterinario, PausaVeterinario, Folga)
 
 admin.site.register(Cliente)
 admin.site.register(Animal)
 admin.site.register(MedicoVeterinario)
 admin.site.register(Consulta)
+admin.site.register(JornadaVeterinario)
+admin.site.register(PausaVeterinario)
+admin.site.register(Folga)
@@ -0,0 +1,553 @@
+"""
+Motor de disponibilidade da agenda dos veterinários.
+
+Cada dia de trabalho de um veterinário é representado por um bitmap (um int)
+em que o bit ``i`` corresponde ao slot que começa em ``i * DURACAO_SLOT``
+minutos depois da meia-noite. A jornada, as pausas e as folgas são compiladas
+uma única vez em máscaras por dia da semana e as consultas da janela pedida
+marcam os bits ocupados, de modo que descobrir os horários livres de um dia é
+apenas ``jornada & ~ocupados``.
+"""
+import heapq
+from collections import defaultdict
+from datetime import datetime, time, timedelta, timezone
+from itertools import islice
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils.dateparse import parse_date, parse_datetime
+from django.utils.timezone import get_current_timezone, is_naive, localtime, make_aware, now
+
+from . import cache
+from .models import (MENSAGEM_HORARIO_OCUPADO, Consulta, Folga, JornadaVeterinario, MedicoVeterinario,
+                     PausaVeterinario)
+
+# Duração de cada slot em minutos (a agenda trabalha com consultas de 1 hora)
+DURACAO_SLOT = getattr(settings, 'AGENDA_DURACAO_SLOT', 60)
+SLOTS_POR_DIA = 24 * 60 // DURACAO_SLOT
+
+# Janela padrão e máxima aceitas nas consultas de disponibilidade
+JANELA_PADRAO = timedelta(days=7)
+JANELA_MAXIMA = timedelta(days=92)
+
+# Busca dos próximos horários livres: janelas a partir de um dia, até JANELA_MAXIMA
+JANELA_BUSCA = timedelta(days=1)
+LIMITE_HORARIOS_PADRAO = 5
+LIMITE_HORARIOS_MAXIMO = 50
+
+# Grade usada para veterinários sem jornada cadastrada: seg-sex, 8h-12h e 13h-17h
+JORNADA_PADRAO = {
+    dia: [(time(8), time(12)), (time(13), time(17))] for dia in range(5)
+}
+
+MENSAGEM_FORA_DA_JORNADA = "Fora do horário de atendimento do veterinário."
+MENSAGEM_FORA_DA_GRADE = f"As consultas começam no início de um horário de {DURACAO_SLOT} minutos."
+
+COR_OCUPADO = "#dc3545"  # vermelho
+COR_LIVRE = "#28a745"  # verde
+
+# Cores fixas por veterinário no calendário geral (a mesma cor em toda requisição)
+PALETA_VETERINARIOS = [
+    "#0d6efd", "#6f42c1", "#d63384", "#fd7e14", "#20c997",
+    "#0dcaf0", "#6610f2", "#198754", "#ffc107", "#795548",
+]
+COR_SEM_VETERINARIO = "#6c757d"  # cinza
+
+
+def cor_veterinario(veterinario_id):
+    if veterinario_id is None:
+        return COR_SEM_VETERINARIO
+    return PALETA_VETERINARIOS[veterinario_id % len(PALETA_VETERINARIOS)]
+
+
+def _minutos(hora):
+    return hora.hour * 60 + hora.minute
+
+
+def mascara_intervalos(intervalos):
+    """
+    Converte uma lista de (inicio, fim) em um bitmap com os slots que cabem
+    inteiramente dentro de algum dos intervalos.
+    """
+    mascara = 0
+    for inicio, fim in intervalos:
+        primeiro = -(-_minutos(inicio) // DURACAO_SLOT)  # arredonda para cima
+        ultimo = (_minutos(fim) or 24 * 60) // DURACAO_SLOT
+        for slot in range(primeiro, ultimo):
+            mascara |= 1 << slot
+    return mascara
+
+
+def mascara_ocupacao(intervalos):
+    """
+    Bitmap com todos os slots que tocam algum dos intervalos (pausas).
+    """
+    mascara = 0
+    for inicio, fim in intervalos:
+        primeiro = _minutos(inicio) // DURACAO_SLOT
+        ultimo = -(-(_minutos(fim) or 24 * 60) // DURACAO_SLOT)
+        for slot in range(primeiro, ultimo):
+            mascara |= 1 << slot
+    return mascara
+
+
+def slot_da_data(data_local):
+    return (data_local.hour * 60 + data_local.minute) // DURACAO_SLOT
+
+
+def inicio_do_slot(dia, slot, fuso=None):
+    minutos = slot * DURACAO_SLOT
+    return make_aware(
+        datetime.combine(dia, time(hour=minutos // 60, minute=minutos % 60)),
+        fuso or get_current_timezone())
+
+
+def _para_datetime(valor, padrao):
+    if not valor:
+        return padrao
+    valor = valor.strip().replace(' ', '+')  # '+' do fuso chega como espaço na querystring
+    data = parse_datetime(valor)
+    if data is None:
+        dia = parse_date(valor[:10])
+        if dia is None:
+            raise ValueError(f"Data inválida: {valor}")
+        data = datetime.combine(dia, time.min)
+    if is_naive(data):
+        data = make_aware(data, get_current_timezone())
+    return data
+
+
+def intervalo_da_requisicao(params):
+    """
+    Lê os parâmetros ``start``/``end`` (formato enviado pelo FullCalendar) e
+    devolve a janela como datetimes com fuso. Sem parâmetros, a janela começa
+    hoje e dura ``JANELA_PADRAO``; janelas maiores que ``JANELA_MAXIMA`` são
+    cortadas.
+    """
+    hoje = make_aware(datetime.combine(localtime().date(), time.min), get_current_timezone())
+    inicio = _para_datetime(params.get('start'), hoje)
+    fim = _para_datetime(params.get('end'), inicio + JANELA_PADRAO)
+    if fim <= inicio:
+        raise ValueError("O fim da janela deve ser posterior ao início.")
+    return inicio, min(fim, inicio + JANELA_MAXIMA)
+
+
+class AgendaVeterinario:
+    """
+    Agenda compilada de um veterinário para uma janela de tempo.
+    """
+
+    def __init__(self, veterinario_id, mascaras_semana, folgas):
+        self.veterinario_id = veterinario_id
+        self.mascaras_semana = mascaras_semana  # dia_semana -> bitmap de trabalho
+        self.folgas = folgas  # conjunto de datas sem atendimento
+        self.ocupacao = defaultdict(int)  # data -> bitmap de slots ocupados
+        self.consultas = []  # (id, data, animal, veterinario) dentro da janela
+
+    def ocupar(self, consulta_id, data, animal_nome, veterinario_nome):
+        data_local = self.reservar(data)
+        self.consultas.append((consulta_id, data_local, animal_nome, veterinario_nome))
+
+    def reservar(self, data, fuso=None):
+        """
+        Marca o slot de ``data`` como ocupado (sem uma consulta gravada).
+        Com muitas datas, passar o ``fuso`` evita buscá-lo a cada chamada.
+        """
+        data_local = data.astimezone(fuso) if fuso else localtime(data)
+        self.ocupacao[data_local.date()] |= 1 << slot_da_data(data_local)
+        return data_local
+
+    def situacao(self, data):
+        """
+        ``None`` se o slot de ``data`` está livre; senão, o motivo.
+        """
+        data_local = localtime(data)
+        if (data_local.hour * 60 + data_local.minute) % DURACAO_SLOT or data_local.second or data_local.microsecond:
+            return MENSAGEM_FORA_DA_GRADE
+        bit = 1 << slot_da_data(data_local)
+        if self.ocupacao.get(data_local.date(), 0) & bit:
+            return MENSAGEM_HORARIO_OCUPADO
+        if not self.mascara_trabalho(data_local.date()) & bit:
+            return MENSAGEM_FORA_DA_JORNADA
+        return None
+
+    def mascara_trabalho(self, dia):
+        if dia in self.folgas:
+            return 0
+        return self.mascaras_semana.get(dia.weekday(), 0)
+
+    def slots(self, inicio, fim, somente_livres=False):
+        """
+        Gera ``(inicio_do_slot, livre)`` em ordem cronológica para os slots de
+        trabalho dentro de ``[inicio, fim)``.
+        """
+        fuso = get_current_timezone()
+        dia = localtime(inicio, fuso).date()
+        ultimo_dia = localtime(fim, fuso).date()
+        while dia <= ultimo_dia:
+            trabalho = self.mascara_trabalho(dia)
+            livres = trabalho & ~self.ocupacao.get(dia, 0)
+            mascara = livres if somente_livres else trabalho
+            slot = 0
+            while mascara:
+                if mascara & 1:
+                    comeco = inicio_do_slot(dia, slot, fuso)
+                    # No início do horário de verão a hora do slot não existe
+                    # (o relógio a pula e ela cai no slot seguinte): fica de fora
+                    real = comeco.astimezone(timezone.utc).astimezone(fuso)
+                    if inicio <= comeco < fim and slot_da_data(real) == slot:
+                        yield comeco, bool(livres >> slot & 1)
+                mascara >>= 1
+                slot += 1
+            dia += timedelta(days=1)
+
+
+def _grades(veterinario_ids):
+    """
+    Jornadas e pausas dos veterinários (consultas ainda não executadas).
+    """
+    jornadas = JornadaVeterinario.objects.filter(
+        veterinario_id__in=veterinario_ids).values_list('veterinario_id', 'dia_semana', 'inicio', 'fim')
+    pausas = PausaVeterinario.objects.filter(
+        veterinario_id__in=veterinario_ids).values_list('veterinario_id', 'dia_semana', 'inicio', 'fim')
+    return jornadas, pausas
+
+
+def _folgas(veterinario_ids, inicio, fim):
+    return Folga.objects.filter(
+        Q(veterinario_id__in=veterinario_ids) | Q(veterinario__isnull=True),
+        data__gte=localtime(inicio).date(), data__lte=localtime(fim).date()).values_list(
+        'veterinario_id', 'data')
+
+
+def _consultas_da_agenda(veterinario_ids, inicio, fim):
+    """
+    As quatro consultas ao banco de ``compilar_agendas``: jornadas, pausas,
+    folgas e consultas da janela (ainda não executadas).
+    """
+    jornadas, pausas = _grades(veterinario_ids)
+    consultas = (
+        Consulta.objects.filter(
+            veterinario_id__in=veterinario_ids, data__gte=inicio, data__lt=fim)
+        .exclude(status=Consulta.StatusConsulta.CANCELADA)
+        .values_list('id', 'veterinario_id', 'data', 'animal__nome', 'veterinario__nome')
+        .order_by('data')
+    )
+    return jornadas, pausas, _folgas(veterinario_ids, inicio, fim), consultas
+
+
+def _montar_agendas(veterinario_ids, linhas_jornadas, linhas_pausas, linhas_folgas, linhas_consultas):
+    jornadas = defaultdict(lambda: defaultdict(list))
+    for vet_id, dia, ini, fim_jornada in linhas_jornadas:
+        jornadas[vet_id][dia].append((ini, fim_jornada))
+
+    pausas = defaultdict(lambda: defaultdict(list))
+    for vet_id, dia, ini, fim_pausa in linhas_pausas:
+        pausas[vet_id][dia].append((ini, fim_pausa))
+
+    folgas_clinica = set()
+    folgas = defaultdict(set)
+    for vet_id, dia in linhas_folgas:
+        if vet_id is None:
+            folgas_clinica.add(dia)
+        else:
+            folgas[vet_id].add(dia)
+
+    agendas = {}
+    for vet_id in veterinario_ids:
+        semana = jornadas.get(vet_id) or JORNADA_PADRAO
+        mascaras = {
+            dia: mascara_intervalos(intervalos) & ~mascara_ocupacao(pausas[vet_id].get(dia, []))
+            for dia, intervalos in semana.items()
+        }
+        agendas[vet_id] = AgendaVeterinario(vet_id, mascaras, folgas_clinica | folgas[vet_id])
+
+    for consulta_id, vet_id, data, animal_nome, veterinario_nome in linhas_consultas:
+        agendas[vet_id].ocupar(consulta_id, data, animal_nome, veterinario_nome)
+
+    return agendas
+
+
+def compilar_agendas(veterinario_ids, inicio, fim):
+    """
+    Monta a agenda de cada veterinário em ``veterinario_ids`` para a janela
+    ``[inicio, fim)``. São feitas quatro consultas ao banco no total,
+    independentemente do número de veterinários ou do histórico de consultas.
+    """
+    veterinario_ids = list(veterinario_ids)
+    linhas = [list(qs) for qs in _consultas_da_agenda(veterinario_ids, inicio, fim)]
+    return _montar_agendas(veterinario_ids, *linhas)
+
+
+def situacoes_na_grade(horarios):
+    """
+    Para cada (veterinario_id, data) de ``horarios``, o motivo de a data não
+    caber na grade do veterinário (fora da jornada, numa pausa ou folga, fora
+    do início de um slot) ou ``None``. As consultas já marcadas não entram:
+    o conflito com elas fica com a constraint do banco. São três consultas ao
+    banco para a lista inteira.
+    """
+    horarios = list(horarios)
+    if not horarios:
+        return []
+    veterinario_ids = list({veterinario_id for veterinario_id, _data in horarios})
+    datas = [data for _veterinario_id, data in horarios]
+    jornadas, pausas = _grades(veterinario_ids)
+    agendas = _montar_agendas(veterinario_ids, jornadas, pausas,
+                              _folgas(veterinario_ids, min(datas), max(datas)), [])
+    return [agendas[veterinario_id].situacao(data) for veterinario_id, data in horarios]
+
+
+def situacao_na_grade(veterinario_id, data):
+    return situacoes_na_grade([(veterinario_id, data)])[0]
+
+
+async def acompilar_agendas(veterinario_ids, inicio, fim):
+    """
+    ``compilar_agendas`` com o ORM assíncrono (views ASGI).
+    """
+    veterinario_ids = list(veterinario_ids)
+    linhas = []
+    for qs in _consultas_da_agenda(veterinario_ids, inicio, fim):
+        linhas.append([linha async for linha in qs])
+    return _montar_agendas(veterinario_ids, *linhas)
+
+
+def _consultas_da_busca(veterinario_ids, inicio, fim):
+    """
+    Folgas e só (veterinário, data) das consultas da janela: uma consulta
+    por intervalo no índice (veterinario, data), sem os JOINs dos nomes
+    usados no calendário.
+    """
+    ocupados = (
+        Consulta.objects.filter(veterinario_id__in=veterinario_ids, data__gte=inicio, data__lt=fim)
+        .exclude(status=Consulta.StatusConsulta.CANCELADA)
+        .values_list('veterinario_id', 'data')
+        .order_by()
+    )
+    return _folgas(veterinario_ids, inicio, fim), ocupados
+
+
+def _veterinarios_da_busca(especialidade):
+    qs = MedicoVeterinario.objects.order_by('nome', 'id').values_list('id', 'nome', 'especialidade')
+    if especialidade:
+        qs = qs.filter(especialidade__iexact=especialidade)
+    return qs
+
+
+def _primeiros_livres(veterinarios, jornadas, pausas, folgas, ocupados, inicio, fim, limite):
+    """
+    Os ``limite`` primeiros horários livres de ``[inicio, fim)`` entre todos
+    os veterinários: ``heapq.merge`` das sequências (já em ordem) de cada
+    um, que só são percorridas até o necessário.
+    """
+    agendas = _montar_agendas([vet_id for vet_id, _nome, _esp in veterinarios], jornadas, pausas, folgas, [])
+    fuso = get_current_timezone()
+    for vet_id, data in ocupados:
+        agendas[vet_id].reservar(data, fuso)
+
+    def livres(ordem, veterinario):
+        for comeco, _livre in agendas[veterinario[0]].slots(inicio, fim, somente_livres=True):
+            yield comeco, ordem, veterinario
+
+    sequencias = [livres(ordem, veterinario) for ordem, veterinario in enumerate(veterinarios)]
+    return [
+        {
+            'inicio': localtime(comeco).strftime('%Y-%m-%dT%H:%M:%S'),
+            'veterinario': {'id': vet_id, 'nome': nome, 'especialidade': especialidade},
+        }
+        for comeco, _ordem, (vet_id, nome, especialidade) in islice(heapq.merge(*sequencias), limite)
+    ]
+
+
+def _janelas(inicio):
+    # Janelas de 1, 1, 2, 4, 8... dias: com a agenda cheia, cada consulta
+    # marcada lida custa mais que uma ida a mais ao banco
+    comeco, tamanho = inicio, JANELA_BUSCA
+    while comeco < inicio + JANELA_MAXIMA:
+        fim = min(comeco + tamanho, inicio + JANELA_MAXIMA)
+        yield comeco, fim
+        if comeco != inicio:
+            tamanho *= 2
+        comeco = fim
+
+
+def proximos_horarios(especialidade, inicio, limite):
+    """
+    Os ``limite`` primeiros horários livres a partir de ``inicio`` entre os
+    veterinários da ``especialidade`` (todos, se vazia), do mais cedo para
+    o mais tarde. Procura em janelas cada vez maiores até ``JANELA_MAXIMA``:
+    três consultas ao banco mais duas por janela (folgas e consultas
+    marcadas), qualquer que seja o número de veterinários.
+    """
+    veterinarios = list(_veterinarios_da_busca(especialidade))
+    ids = [vet_id for vet_id, _nome, _esp in veterinarios]
+    jornadas, pausas = [list(qs) for qs in _grades(ids)]
+    horarios = []
+    for comeco, fim in _janelas(inicio):
+        if not veterinarios or len(horarios) >= limite:
+            break
+        folgas, ocupados = [list(qs) for qs in _consultas_da_busca(ids, comeco, fim)]
+        horarios += _primeiros_livres(veterinarios, jornadas, pausas, folgas, ocupados,
+                                      comeco, fim, limite - len(horarios))
+    return horarios
+
+
+async def aproximos_horarios(especialidade, inicio, limite):
+    veterinarios = [linha async for linha in _veterinarios_da_busca(especialidade)]
+    ids = [vet_id for vet_id, _nome, _esp in veterinarios]
+    jornadas, pausas = _grades(ids)
+    jornadas = [linha async for linha in jornadas]
+    pausas = [linha async for linha in pausas]
+    horarios = []
+    for comeco, fim in _janelas(inicio):
+        if not veterinarios or len(horarios) >= limite:
+            break
+        folgas, ocupados = _consultas_da_busca(ids, comeco, fim)
+        folgas = [linha async for linha in folgas]
+        ocupados = [linha async for linha in ocupados]
+        horarios += _primeiros_livres(veterinarios, jornadas, pausas, folgas, ocupados,
+                                      comeco, fim, limite - len(horarios))
+    return horarios
+
+
+def parametros_da_busca(params):
+    """
+    Lê ``a_partir_de`` (data ou data/hora; padrão e mínimo: agora) e
+    ``limite``. Levanta ValueError com parâmetros inválidos.
+    """
+    agora = now()
+    inicio = max(_para_datetime(params.get('a_partir_de'), agora), agora)
+    limite = params.get('limite') or str(LIMITE_HORARIOS_PADRAO)
+    if not limite.isdigit() or not 1 <= int(limite) <= LIMITE_HORARIOS_MAXIMO:
+        raise ValueError(f"limite deve ser um número de 1 a {LIMITE_HORARIOS_MAXIMO}.")
+    return inicio, int(limite)
+
+
+def _capacidade(agendas, inicio, fim):
+    capacidade = {}
+    dia = inicio
+    while dia <= fim:
+        capacidade[dia] = sum(agenda.mascara_trabalho(dia).bit_count() for agenda in agendas.values())
+        dia += timedelta(days=1)
+    return capacidade
+
+
+def capacidade_por_dia(veterinario_ids, inicio, fim):
+    """
+    Slots de trabalho somados dos veterinários em cada dia de ``inicio`` a
+    ``fim`` (datas, inclusive), pelas jornadas, pausas e folgas cadastradas.
+    Três consultas ao banco; as consultas agendadas não são lidas.
+    """
+    veterinario_ids = list(veterinario_ids)
+    jornadas, pausas = _grades(veterinario_ids)
+    folgas = _folgas(veterinario_ids, inicio_do_slot(inicio, 0), inicio_do_slot(fim, 0))
+    agendas = _montar_agendas(veterinario_ids, list(jornadas), list(pausas), list(folgas), [])
+    return _capacidade(agendas, inicio, fim)
+
+
+async def acapacidade_por_dia(veterinario_ids, inicio, fim):
+    veterinario_ids = list(veterinario_ids)
+    jornadas, pausas = _grades(veterinario_ids)
+    folgas = _folgas(veterinario_ids, inicio_do_slot(inicio, 0), inicio_do_slot(fim, 0))
+    linhas = []
+    for qs in (jornadas, pausas, folgas):
+        linhas.append([linha async for linha in qs])
+    return _capacidade(_montar_agendas(veterinario_ids, *linhas, []), inicio, fim)
+
+
+def _eventos(agenda, inicio, fim):
+    eventos = [
+        {
+            "id": consulta_id,
+            "title": f"{animal_nome} - {veterinario_nome}",
+            "start": data.strftime("%Y-%m-%dT%H:%M:%S"),
+            "color": COR_OCUPADO,
+        }
+        for consulta_id, data, animal_nome, veterinario_nome in agenda.consultas
+    ]
+
+    for slot_inicio, _livre in agenda.slots(max(inicio, now()), fim, somente_livres=True):
+        slot_local = localtime(slot_inicio)
+        eventos.append(
+            {
+                "id": f"disp-{slot_local:%Y-%m-%d-%H%M}",
+                "title": "Disponível",
+                "start": slot_local.strftime("%Y-%m-%dT%H:%M:%S"),
+                "color": COR_LIVRE,
+            }
+        )
+    return eventos
+
+
+def eventos_veterinario(veterinario_id, inicio, fim):
+    """
+    Eventos do calendário de um veterinário no formato do FullCalendar:
+    consultas da janela em vermelho e horários livres a partir de agora em verde.
+    """
+    return _eventos(compilar_agendas([veterinario_id], inicio, fim)[veterinario_id], inicio, fim)
+
+
+async def aeventos_veterinario(veterinario_id, inicio, fim):
+    agendas = await acompilar_agendas([veterinario_id], inicio, fim)
+    return _eventos(agendas[veterinario_id], inicio, fim)
+
+
+def _partes_da_chave(veterinario_id, inicio, fim):
+    # Os horários livres começam em "agora": o slot atual faz parte da chave
+    agora = localtime(now())
+    return (veterinario_id, inicio.isoformat(), fim.isoformat(), f'{agora:%Y%m%d}-{slot_da_data(agora)}')
+
+
+def eventos_veterinario_em_cache(veterinario_id, inicio, fim):
+    """
+    ``eventos_veterinario`` pelo cache (core/cache.py). Consultas, jornadas,
+    pausas e folgas do veterinário mudam a versão pelos signals.
+    """
+    return cache.obter(
+        ['agenda', f'agenda:{veterinario_id}'], _partes_da_chave(veterinario_id, inicio, fim),
+        lambda: eventos_veterinario(veterinario_id, inicio, fim), cache.TEMPO_AGENDA)
+
+
+async def aeventos_veterinario_em_cache(veterinario_id, inicio, fim):
+    return await cache.aobter(
+        ['agenda', f'agenda:{veterinario_id}'], _partes_da_chave(veterinario_id, inicio, fim),
+        lambda: aeventos_veterinario(veterinario_id, inicio, fim), cache.TEMPO_AGENDA)
+
+
+CAMPOS_DA_CLINICA = ('id', 'data', 'animal__nome', 'veterinario_id', 'veterinario__nome')
+
+
+def _consultas_da_clinica(inicio, fim):
+    return Consulta.objects.filter(data__gte=inicio, data__lt=fim).order_by('data', 'id')
+
+
+def evento_consulta(consulta_id, data, animal_nome, veterinario_id, veterinario_nome):
+    """
+    Evento de uma consulta no calendário geral (também enviado nos avisos SSE).
+    """
+    return {
+        "id": consulta_id,
+        "title": f"{animal_nome} - {veterinario_nome or 'desconhecido'}",
+        "start": localtime(data).strftime("%Y-%m-%dT%H:%M:%S"),
+        "color": cor_veterinario(veterinario_id),
+    }
+
+
+def eventos_clinica(inicio, fim):
+    """
+    Gera os eventos de todas as consultas da janela, sem carregar a lista inteira
+    na memória: uma única consulta com JOIN lida em blocos pelo ``iterator()``.
+    """
+    linhas = _consultas_da_clinica(inicio, fim).values_list(*CAMPOS_DA_CLINICA)
+    for linha in linhas.iterator(chunk_size=2000):
+        yield evento_consulta(*linha)
+
+
+async def aeventos_clinica(inicio, fim):
+    # values() e não values_list(): no Django 5.2 o aiterator() de values_list()
+    # executa a consulta fora da thread (ValuesListIterable.__iter__ não é um
+    # gerador) e levanta SynchronousOnlyOperation.
+    linhas = _consultas_da_clinica(inicio, fim).values(*CAMPOS_DA_CLINICA)
+    async for linha in linhas.aiterator(chunk_size=2000):
+        yield evento_consulta(*linha.values())
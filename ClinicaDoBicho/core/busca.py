@@ -0,0 +1,145 @@
+"""
+Índice de busca textual (SQLite FTS5) sobre clientes, animais e veterinários.
+
+O índice é a tabela virtual ``core_busca``, criada pela migração 0010 e
+mantida pelos signals em ``core/signals.py``. Cada documento usa como rowid
+``id * 4 + código do tipo``, então atualizar ou remover um objeto é uma
+operação direta pela chave, sem varrer o índice. Em outros bancos (sem FTS5)
+a busca cai para ``icontains`` nos próprios modelos.
+"""
+import re
+
+from django.db import connection
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+from .models import Animal, Cliente, MedicoVeterinario
+
+TABELA = 'core_busca'
+
+CLIENTE = 'cliente'
+ANIMAL = 'animal'
+VETERINARIO = 'veterinario'
+
+CODIGOS = {CLIENTE: 1, ANIMAL: 2, VETERINARIO: 3}
+TIPOS = {codigo: tipo for tipo, codigo in CODIGOS.items()}
+TIPOS_POR_MODELO = {Cliente: CLIENTE, Animal: ANIMAL, MedicoVeterinario: VETERINARIO}
+MODELOS = {tipo: modelo for modelo, tipo in TIPOS_POR_MODELO.items()}
+
+def disponivel():
+    return connection.vendor == 'sqlite'
+
+
+def _rowid(tipo, objeto_id):
+    return objeto_id * 4 + CODIGOS[tipo]
+
+
+def documento(instancia):
+    """
+    (tipo, id, titulo, conteudo, detalhe, referencia_id) indexados para o objeto.
+    """
+    if isinstance(instancia, Cliente):
+        return (CLIENTE, instancia.pk, instancia.nome,
+                f"{instancia.nome} {instancia.email} {instancia.telefone}",
+                instancia.email, None)
+    if isinstance(instancia, Animal):
+        return (ANIMAL, instancia.pk, instancia.nome,
+                f"{instancia.nome} {instancia.raca}",
+                instancia.raca, instancia.dono_id)
+    return (VETERINARIO, instancia.pk, instancia.nome,
+            f"{instancia.nome} {instancia.crmv} {instancia.especialidade}",
+            instancia.especialidade, None)
+
+
+def indexar(*instancias):
+    if not disponivel() or not instancias:
+        return
+    linhas = [
+        (_rowid(tipo, objeto_id), titulo, conteudo, detalhe, referencia_id)
+        for tipo, objeto_id, titulo, conteudo, detalhe, referencia_id in map(documento, instancias)
+    ]
+    with connection.cursor() as cursor:
+        cursor.executemany(f"DELETE FROM {TABELA} WHERE rowid = %s", [(linha[0],) for linha in linhas])
+        cursor.executemany(
+            f"INSERT INTO {TABELA} (rowid, titulo, conteudo, detalhe, referencia_id) "
+            "VALUES (%s, %s, %s, %s, %s)", linhas)
+
+
+def remover(instancia):
+    if not disponivel():
+        return
+    tipo = TIPOS_POR_MODELO[type(instancia)]
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {TABELA} WHERE rowid = %s", [_rowid(tipo, instancia.pk)])
+
+
+def expressao_fts(texto):
+    """
+    Converte o texto digitado numa expressão FTS5: cada palavra vira um
+    prefixo entre aspas ("mar"* AND "sil"*), o que também neutraliza a
+    sintaxe especial do FTS5.
+    """
+    palavras = re.findall(r'\w+', texto or '')
+    return ' '.join(f'"{palavra}"*' for palavra in palavras)
+
+
+def buscar(texto, tipos=None, limite=20):
+    """
+    Resultados ordenados por relevância (bm25, com peso maior para o título):
+    lista de dicts com ``tipo``, ``id``, ``titulo``, ``detalhe`` e ``referencia_id``.
+    """
+    tipos = list(CODIGOS) if tipos is None else list(tipos)
+    expressao = expressao_fts(texto)
+    if not expressao or not tipos:
+        return []
+    if not disponivel():
+        return _buscar_sem_indice(texto, tipos, limite)
+
+    codigos = [CODIGOS[tipo] for tipo in tipos]
+    marcadores = ', '.join(['%s'] * len(codigos))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT rowid, titulo, detalhe, referencia_id FROM {TABELA} "
+            f"WHERE {TABELA} MATCH %s AND rowid %% 4 IN ({marcadores}) "
+            f"ORDER BY bm25({TABELA}, 10.0, 1.0) LIMIT %s",
+            [expressao, *codigos, limite])
+        return [
+            {'tipo': TIPOS[rowid % 4], 'id': rowid // 4, 'titulo': titulo,
+             'detalhe': detalhe, 'referencia_id': referencia_id}
+            for rowid, titulo, detalhe, referencia_id in cursor.fetchall()
+        ]
+
+
+def ids_por_nome(tipo, texto):
+    """
+    Subconsulta com os ids de um tipo cujo nome (o título do documento) tem
+    palavras começando pelas do texto, para filtrar querysets das telas com
+    ``id__in``. Sem limite de resultados: o banco resolve o filtro inteiro.
+    Sem o índice, o nome é filtrado com icontains.
+    """
+    modelo = MODELOS[tipo]
+    expressao = expressao_fts(texto)
+    if not expressao:
+        return modelo.objects.none().values('id')
+    if not disponivel():
+        return modelo.objects.filter(nome__icontains=texto).values('id')
+    return RawSQL(
+        f"SELECT rowid / 4 FROM {TABELA} WHERE {TABELA} MATCH %s AND rowid %% 4 = %s",
+        [f'titulo : ({expressao})', CODIGOS[tipo]])
+
+
+def _buscar_sem_indice(texto, tipos, limite):
+    filtros = {
+        CLIENTE: (Cliente, Q(nome__icontains=texto) | Q(email__icontains=texto) | Q(telefone__icontains=texto)),
+        ANIMAL: (Animal, Q(nome__icontains=texto) | Q(raca__icontains=texto)),
+        VETERINARIO: (MedicoVeterinario, Q(nome__icontains=texto) | Q(crmv__icontains=texto)
+                      | Q(especialidade__icontains=texto)),
+    }
+    resultados = []
+    for tipo in tipos:
+        modelo, filtro = filtros[tipo]
+        for instancia in modelo.objects.filter(filtro)[:limite]:
+            _tipo, objeto_id, titulo, _conteudo, detalhe, referencia_id = documento(instancia)
+            resultados.append({'tipo': tipo, 'id': objeto_id, 'titulo': titulo,
+                               'detalhe': detalhe, 'referencia_id': referencia_id})
+    return resultados[:limite]
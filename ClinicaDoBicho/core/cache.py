@@ -0,0 +1,162 @@
+"""
+Cache de dados de referência com chaves versionadas.
+
+Cada entrada pertence a um ou mais escopos ('veterinarios', 'agenda',
+'agenda:<id do veterinário>', 'api:consultas', ...). A chave inclui a versão
+atual de cada escopo; invalidar um escopo é só incrementar a sua versão, e as
+entradas antigas deixam de ser lidas e expiram sozinhas. Funciona igual com
+qualquer backend de ``settings.CACHES`` (memória local, arquivo ou Redis).
+
+As versões são incrementadas pelos signals em ``core/signals.py``.
+"""
+import hashlib
+import threading
+import time
+from collections import defaultdict
+
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import MedicoVeterinario
+
+PREFIXO_VERSAO = 'versao:'
+
+# Tempos máximos no cache (segundos); normalmente a versão muda antes
+TEMPO_VETERINARIOS = 60 * 60
+TEMPO_AGENDA = 60 * 5
+TEMPO_API = 60 * 5
+
+_contadores = defaultdict(lambda: {'acertos': 0, 'falhas': 0})
+_trava = threading.Lock()
+
+
+def _chaves_de_versao(escopos):
+    return [PREFIXO_VERSAO + escopo for escopo in escopos]
+
+
+def _versao_inicial():
+    # Versão inicial pelo relógio: se a chave da versão for descartada
+    # pelo backend, a nova nunca coincide com uma versão antiga.
+    return time.time_ns()
+
+
+def _versoes(escopos):
+    chaves = _chaves_de_versao(escopos)
+    versoes = cache.get_many(chaves)
+    for chave_versao in chaves:
+        if chave_versao not in versoes:
+            cache.add(chave_versao, _versao_inicial(), timeout=None)
+            versoes[chave_versao] = cache.get(chave_versao)
+    return [versoes[chave_versao] for chave_versao in chaves]
+
+
+async def _aversoes(escopos):
+    chaves = _chaves_de_versao(escopos)
+    versoes = await cache.aget_many(chaves)
+    for chave_versao in chaves:
+        if chave_versao not in versoes:
+            await cache.aadd(chave_versao, _versao_inicial(), timeout=None)
+            versoes[chave_versao] = await cache.aget(chave_versao)
+    return [versoes[chave_versao] for chave_versao in chaves]
+
+
+def _montar_chave(escopos, versoes, partes):
+    versoes = '.'.join(str(versao) for versao in versoes)
+    resto = ':'.join(str(parte) for parte in partes)
+    if len(resto) > 150:
+        # Memcached/Redis têm limite de tamanho de chave (URLs longas)
+        resto = hashlib.md5(resto.encode()).hexdigest()
+    return f'{escopos[0]}:{versoes}:{resto}'
+
+
+def chave(escopos, *partes):
+    return _montar_chave(escopos, _versoes(escopos), partes)
+
+
+def obter(escopos, partes, calcular, tempo):
+    """
+    Valor em cache para os escopos/partes, ou o resultado de ``calcular()``
+    (gravado no cache). Conta acertos e falhas pelo primeiro escopo.
+    """
+    nome = escopos[0].split(':')[0]
+    chave_entrada = chave(escopos, *partes)
+    valor = cache.get(chave_entrada)
+    if valor is not None:
+        _contar(nome, 'acertos')
+        return valor
+    _contar(nome, 'falhas')
+    valor = calcular()
+    cache.set(chave_entrada, valor, tempo)
+    return valor
+
+
+async def aobter(escopos, partes, acalcular, tempo):
+    """
+    ``obter`` para as views assíncronas: ``acalcular()`` devolve uma corrotina.
+    """
+    nome = escopos[0].split(':')[0]
+    chave_entrada = _montar_chave(escopos, await _aversoes(escopos), partes)
+    valor = await cache.aget(chave_entrada)
+    if valor is not None:
+        _contar(nome, 'acertos')
+        return valor
+    _contar(nome, 'falhas')
+    valor = await acalcular()
+    await cache.aset(chave_entrada, valor, tempo)
+    return valor
+
+
+def veterinarios():
+    """
+    Todos os veterinários por nome (listas e selects das telas).
+    """
+    return obter(['veterinarios'], ('todos',),
+                 lambda: list(MedicoVeterinario.objects.order_by('nome')), TEMPO_VETERINARIOS)
+
+
+def _incrementar(escopos):
+    for escopo in escopos:
+        chave_versao = PREFIXO_VERSAO + escopo
+        try:
+            cache.incr(chave_versao)
+        except ValueError:
+            cache.add(chave_versao, time.time_ns(), timeout=None)
+
+
+def invalidar(*escopos):
+    """
+    Incrementa a versão dos escopos agora (a própria transação já enxerga a
+    mudança) e de novo depois do commit, para descartar o que outra
+    requisição tenha gravado no cache com os dados antigos nesse meio tempo.
+    """
+    escopos = [escopo for escopo in escopos if escopo]
+    if not escopos:
+        return
+    _incrementar(escopos)
+    if transaction.get_connection().in_atomic_block:
+        transaction.on_commit(lambda: _incrementar(escopos))
+
+
+def _contar(nome, tipo):
+    with _trava:
+        _contadores[nome][tipo] += 1
+
+
+def estatisticas():
+    """
+    Acertos e falhas por escopo (contados neste processo).
+    """
+    with _trava:
+        resultado = {}
+        for nome, contadores in sorted(_contadores.items()):
+            total = contadores['acertos'] + contadores['falhas']
+            resultado[nome] = {
+                **contadores,
+                'taxa_acertos': round(contadores['acertos'] / total, 3) if total else None,
+            }
+        return resultado
+
+
+def zerar_estatisticas():
+    with _trava:
+        _contadores.clear()
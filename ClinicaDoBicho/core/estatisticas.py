@@ -0,0 +1,378 @@
+"""
+Contadores de consultas usados pelos dashboards.
+
+As séries por dia (ocupação e taxa de cancelamento) não contam a tabela de
+consultas: leem a ``ConsultasPorDia``, que os signals da consulta mantêm
+somando +1/-1 a cada consulta criada, alterada (troca de dia, veterinário ou
+status) ou removida. O custo de uma série depende só do tamanho da janela, e
+não do histórico. Alterações que não passam pelos signals (``.update()``,
+SQL direto) são corrigidas pelo comando ``reconstruir_estatisticas``.
+"""
+from collections import Counter
+from datetime import datetime, time, timedelta
+
+from django.db import connection, transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils.dateparse import parse_date
+from django.utils.timezone import get_current_timezone, is_naive, localtime, make_aware
+
+from . import agenda, cache
+from .models import Consulta, ConsultasPorDia, MedicoVeterinario
+
+# Uma única agregação condicional em vez de um COUNT(*) por status
+CONTADORES = {
+    "todas": Count("id"),
+    "agendadas": Count("id", filter=Q(status=Consulta.StatusConsulta.AGENDADA)),
+    "concluidas": Count("id", filter=Q(status=Consulta.StatusConsulta.CONCLUIDA)),
+    "canceladas": Count("id", filter=Q(status=Consulta.StatusConsulta.CANCELADA)),
+}
+
+# Tempo máximo no cache; normalmente a entrada é removida antes pelos signals
+TEMPO_CACHE_RESUMO = 60 * 10
+
+
+def resumo_consultas(qs):
+    return qs.aggregate(**CONTADORES)
+
+
+async def aresumo_consultas(qs):
+    return await qs.aaggregate(**CONTADORES)
+
+
+def _linhas_por_veterinario(qs):
+    return (
+        qs.values("veterinario_id", veterinario_nome=F("veterinario__nome"))
+        .annotate(**CONTADORES)
+        .order_by("veterinario_nome")
+    )
+
+
+def resumo_por_veterinario(qs):
+    return list(_linhas_por_veterinario(qs))
+
+
+async def aresumo_por_veterinario(qs):
+    return [linha async for linha in _linhas_por_veterinario(qs)]
+
+
+def filtrar_periodo(qs, params):
+    """
+    Aplica os parâmetros opcionais ``inicio``/``fim`` (datas AAAA-MM-DD,
+    ambas inclusivas) sobre o campo ``data`` da consulta.
+    """
+    tz = get_current_timezone()
+    inicio, fim = params.get("inicio"), params.get("fim")
+    if inicio:
+        dia = parse_date(inicio)
+        if dia is None:
+            raise ValueError(f"Data inválida: {inicio}")
+        qs = qs.filter(data__gte=make_aware(datetime.combine(dia, time.min), tz))
+    if fim:
+        dia = parse_date(fim)
+        if dia is None:
+            raise ValueError(f"Data inválida: {fim}")
+        qs = qs.filter(data__lt=make_aware(datetime.combine(dia + timedelta(days=1), time.min), tz))
+    return qs
+
+
+def escopo_resumo(usuario_id=None):
+    """
+    A equipe (is_staff) vê todas as consultas e compartilha uma entrada;
+    cada cliente tem a sua (escopos do cache em core/cache.py).
+    """
+    if usuario_id is None:
+        return "resumo:equipe"
+    return f"resumo:usuario:{usuario_id}"
+
+
+def resumo_em_cache(usuario, qs):
+    escopo = escopo_resumo(None if usuario.is_staff else usuario.id)
+    return cache.obter([escopo], (), lambda: resumo_consultas(qs), TEMPO_CACHE_RESUMO)
+
+
+async def aresumo_em_cache(usuario, qs):
+    escopo = escopo_resumo(None if usuario.is_staff else usuario.id)
+    return await cache.aobter([escopo], (), lambda: aresumo_consultas(qs), TEMPO_CACHE_RESUMO)
+
+
+def invalidar_resumo(*usuario_ids):
+    cache.invalidar(escopo_resumo(), *[
+        escopo_resumo(usuario_id) for usuario_id in usuario_ids if usuario_id is not None])
+
+
+# Estado de uma consulta carregada com campos adiados (.only()/.defer()):
+# o que está no banco só é lido se ela for gravada ou removida.
+DESCONHECIDO = object()
+
+OCUPAM_HORARIO = (Consulta.StatusConsulta.AGENDADA, Consulta.StatusConsulta.CONCLUIDA)
+
+AGRUPAMENTOS = {
+    "dia": lambda dia: dia,
+    "semana": lambda dia: dia - timedelta(days=dia.weekday()),
+    "mes": lambda dia: dia.replace(day=1),
+}
+
+# Janela padrão e máxima das séries dos dashboards
+JANELA_SERIE_PADRAO = timedelta(days=30)
+JANELA_SERIE_MAXIMA = timedelta(days=731)
+
+
+def estado_da_consulta(consulta):
+    """
+    (veterinario_id, data, status) do objeto, ou ``DESCONHECIDO`` se algum
+    desses campos não foi carregado.
+    """
+    campos = consulta.__dict__
+    if "veterinario_id" not in campos or "data" not in campos or "status" not in campos:
+        return DESCONHECIDO
+    return campos["veterinario_id"], campos["data"], campos["status"]
+
+
+def estados_no_banco(consulta_ids):
+    return {
+        consulta_id: (veterinario_id, data, status)
+        for consulta_id, veterinario_id, data, status in Consulta.objects.filter(
+            pk__in=consulta_ids).values_list("id", "veterinario_id", "data", "status")
+    }
+
+
+def _dia(data):
+    data = Consulta._meta.get_field("data").to_python(data)
+    if is_naive(data):
+        data = make_aware(data, get_current_timezone())
+    return localtime(data).date()
+
+
+def variacoes(pares):
+    """
+    Variação das contagens para pares (estado anterior, estado atual);
+    ``None`` é a consulta que ainda não existia ou que foi removida.
+    """
+    deltas = Counter()
+    for anterior, atual in pares:
+        if anterior is not None:
+            veterinario_id, data, status = anterior
+            deltas[veterinario_id or 0, _dia(data), status] -= 1
+        if atual is not None:
+            veterinario_id, data, status = atual
+            deltas[veterinario_id or 0, _dia(data), status] += 1
+    return deltas
+
+
+def registrar(deltas):
+    """
+    Soma as variações na ``ConsultasPorDia`` com um único upsert
+    (``INSERT ... ON CONFLICT DO UPDATE``, SQLite e PostgreSQL), sem ler a
+    tabela antes: gravações simultâneas no mesmo dia não perdem contagens.
+    """
+    linhas = [
+        (veterinario_id, connection.ops.adapt_datefield_value(dia), status, quantidade)
+        for (veterinario_id, dia, status), quantidade in deltas.items() if quantidade
+    ]
+    if not linhas:
+        return
+    tabela = connection.ops.quote_name(ConsultasPorDia._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f"INSERT INTO {tabela} (veterinario_id, dia, status, quantidade) VALUES (%s, %s, %s, %s) "
+            f"ON CONFLICT (dia, veterinario_id, status) "
+            f"DO UPDATE SET quantidade = {tabela}.quantidade + excluded.quantidade",
+            linhas,
+        )
+
+
+def consultas_gravadas(consultas):
+    """
+    Atualiza as contagens para consultas gravadas sem os signals
+    (``bulk_create``/``bulk_update``), com o estado guardado no ``post_init``.
+    """
+    anteriores = [getattr(consulta, "_estatistica_inicial", None) for consulta in consultas]
+    desconhecidas = [consulta.pk for consulta, anterior in zip(consultas, anteriores) if anterior is DESCONHECIDO]
+    if desconhecidas:
+        no_banco = estados_no_banco(desconhecidas)
+        anteriores = [no_banco.get(consulta.pk) if anterior is DESCONHECIDO else anterior
+                      for consulta, anterior in zip(consultas, anteriores)]
+    atuais = [estado_da_consulta(consulta) for consulta in consultas]
+    registrar(variacoes(zip(anteriores, atuais)))
+    for consulta, atual in zip(consultas, atuais):
+        consulta._estatistica_inicial = atual
+
+
+def veterinario_removido(veterinario_id):
+    """
+    As consultas de um veterinário removido ficam sem veterinário
+    (``SET_NULL`` por um UPDATE, sem signals): as contagens passam para o 0.
+    """
+    linhas = ConsultasPorDia.objects.filter(veterinario_id=veterinario_id)
+    deltas = Counter()
+    for dia, status, quantidade in linhas.values_list("dia", "status", "quantidade"):
+        deltas[0, dia, status] += quantidade
+    linhas.delete()
+    registrar(deltas)
+
+
+def divergencias(inicio=None, fim=None):
+    """
+    {(veterinario_id, dia, status): (contagem gravada, contagem real)} das
+    contagens da ``ConsultasPorDia`` que não batem com a tabela de consultas,
+    nos dias de ``inicio`` a ``fim`` (inclusive; sem limites = tudo).
+    """
+    consultas = Consulta.objects.all()
+    gravadas = ConsultasPorDia.objects.all()
+    tz = get_current_timezone()
+    if inicio:
+        consultas = consultas.filter(data__gte=make_aware(datetime.combine(inicio, time.min), tz))
+        gravadas = gravadas.filter(dia__gte=inicio)
+    if fim:
+        consultas = consultas.filter(data__lt=make_aware(datetime.combine(fim + timedelta(days=1), time.min), tz))
+        gravadas = gravadas.filter(dia__lte=fim)
+
+    reais = Counter()
+    for veterinario_id, dia, status, quantidade in (
+            consultas.annotate(dia=TruncDate("data")).values("veterinario_id", "dia", "status")
+            .annotate(quantidade=Count("id")).values_list("veterinario_id", "dia", "status", "quantidade")
+            .order_by()):
+        reais[veterinario_id or 0, dia, status] += quantidade
+    gravadas = {
+        (veterinario_id, dia, status): quantidade
+        for veterinario_id, dia, status, quantidade in gravadas.values_list(
+            "veterinario_id", "dia", "status", "quantidade")
+    }
+    return {
+        chave: (gravadas.get(chave, 0), reais[chave])
+        for chave in reais.keys() | gravadas.keys()
+        if gravadas.get(chave, 0) != reais[chave]
+    }
+
+
+def reconstruir(inicio=None, fim=None):
+    """
+    Corrige as divergências (ver ``divergencias``) e apaga as contagens
+    zeradas do período. Devolve as divergências encontradas.
+    """
+    with transaction.atomic():
+        encontradas = divergencias(inicio, fim)
+        registrar(Counter({chave: real - gravada for chave, (gravada, real) in encontradas.items()}))
+        zeradas = ConsultasPorDia.objects.filter(quantidade=0)
+        if inicio:
+            zeradas = zeradas.filter(dia__gte=inicio)
+        if fim:
+            zeradas = zeradas.filter(dia__lte=fim)
+        zeradas.delete()
+    return encontradas
+
+
+def parametros_da_serie(params):
+    """
+    Lê ``inicio``/``fim`` (AAAA-MM-DD, inclusive; padrão: os últimos 30
+    dias), ``agrupar`` (dia, semana ou mes) e ``veterinario``. Levanta
+    ValueError com parâmetros inválidos.
+    """
+    datas = {}
+    for nome in ("inicio", "fim"):
+        valor = params.get(nome)
+        if valor:
+            datas[nome] = parse_date(valor)
+            if datas[nome] is None:
+                raise ValueError(f"Data inválida: {valor}")
+    fim = datas.get("fim") or localtime().date()
+    inicio = datas.get("inicio") or fim - JANELA_SERIE_PADRAO + timedelta(days=1)
+    if fim < inicio:
+        raise ValueError("O fim do período deve ser igual ou posterior ao início.")
+    if fim - inicio >= JANELA_SERIE_MAXIMA:
+        raise ValueError(f"O período deve ter no máximo {JANELA_SERIE_MAXIMA.days} dias.")
+    agrupar = params.get("agrupar") or "dia"
+    if agrupar not in AGRUPAMENTOS:
+        raise ValueError(f"agrupar deve ser um de: {', '.join(AGRUPAMENTOS)}.")
+    veterinario_id = params.get("veterinario")
+    if veterinario_id is not None:
+        if not veterinario_id.isdigit():
+            raise ValueError("veterinario deve ser um número.")
+        veterinario_id = int(veterinario_id)
+    return inicio, fim, agrupar, veterinario_id
+
+
+def _contagens(inicio, fim, veterinario_id):
+    qs = ConsultasPorDia.objects.filter(dia__gte=inicio, dia__lte=fim)
+    if veterinario_id is not None:
+        qs = qs.filter(veterinario_id=veterinario_id)
+    return qs.values("dia", "status").annotate(total=Sum("quantidade")).values_list("dia", "status", "total")
+
+
+def _veterinarios(veterinario_id):
+    qs = MedicoVeterinario.objects.values_list("id", flat=True)
+    if veterinario_id is not None:
+        qs = qs.filter(pk=veterinario_id)
+    return qs
+
+
+def _periodos(inicio, fim, agrupar):
+    periodo = AGRUPAMENTOS[agrupar]
+    periodos = {}
+    dia = inicio
+    while dia <= fim:
+        periodos.setdefault(periodo(dia), Counter())
+        dia += timedelta(days=1)
+    return periodo, periodos
+
+
+def _taxa(parte, total):
+    return round(parte / total, 4) if total else None
+
+
+def _serie_cancelamentos(contagens, inicio, fim, agrupar):
+    periodo, periodos = _periodos(inicio, fim, agrupar)
+    for dia, status, total in contagens:
+        periodos[periodo(dia)][status] += total
+    serie = []
+    for comeco, contagem in periodos.items():
+        total = sum(contagem.values())
+        canceladas = contagem[Consulta.StatusConsulta.CANCELADA]
+        serie.append({"periodo": comeco.isoformat(), "consultas": total, "canceladas": canceladas,
+                      "taxa_cancelamento": _taxa(canceladas, total)})
+    return serie
+
+
+def _serie_ocupacao(contagens, capacidade, inicio, fim, agrupar):
+    periodo, periodos = _periodos(inicio, fim, agrupar)
+    for dia, slots in capacidade.items():
+        periodos[periodo(dia)]["capacidade"] += slots
+    for dia, status, total in contagens:
+        if status in OCUPAM_HORARIO:
+            periodos[periodo(dia)]["ocupados"] += total
+    return [
+        {"periodo": comeco.isoformat(), "capacidade": contagem["capacidade"], "ocupados": contagem["ocupados"],
+         "ocupacao": _taxa(contagem["ocupados"], contagem["capacidade"])}
+        for comeco, contagem in periodos.items()
+    ]
+
+
+def serie_cancelamentos(inicio, fim, agrupar="dia", veterinario_id=None):
+    """
+    Consultas, canceladas e taxa de cancelamento de cada período.
+    """
+    return _serie_cancelamentos(_contagens(inicio, fim, veterinario_id), inicio, fim, agrupar)
+
+
+async def aserie_cancelamentos(inicio, fim, agrupar="dia", veterinario_id=None):
+    contagens = [linha async for linha in _contagens(inicio, fim, veterinario_id)]
+    return _serie_cancelamentos(contagens, inicio, fim, agrupar)
+
+
+def serie_ocupacao(inicio, fim, agrupar="dia", veterinario_id=None):
+    """
+    Slots de trabalho (core/agenda.py), slots ocupados (consultas agendadas
+    ou concluídas, com veterinário) e a ocupação de cada período. A
+    capacidade usa as jornadas atuais, também para dias passados.
+    """
+    contagens = _contagens(inicio, fim, veterinario_id).exclude(veterinario_id=0)
+    capacidade = agenda.capacidade_por_dia(_veterinarios(veterinario_id), inicio, fim)
+    return _serie_ocupacao(contagens, capacidade, inicio, fim, agrupar)
+
+
+async def aserie_ocupacao(inicio, fim, agrupar="dia", veterinario_id=None):
+    contagens = [linha async for linha in _contagens(inicio, fim, veterinario_id).exclude(veterinario_id=0)]
+    veterinarios = [veterinario async for veterinario in _veterinarios(veterinario_id)]
+    capacidade = await agenda.acapacidade_por_dia(veterinarios, inicio, fim)
+    return _serie_ocupacao(contagens, capacidade, inicio, fim, agrupar)
@@ -0,0 +1,270 @@
+"""
+Exportação de consultas e de clientes (com os animais) em CSV ou XLSX,
+para os relatórios da gerência.
+
+As linhas vêm de um único SELECT com os JOINs (``values_list``) percorrido
+com ``.iterator(chunk_size=...)``, e o arquivo é montado e enviado em blocos
+por uma ``StreamingHttpResponse``: o download começa na hora e nem o
+resultado nem o arquivo ficam inteiros na memória, seja qual for o tamanho.
+
+O XLSX é escrito aqui mesmo (é um zip de XMLs, gerado em fluxo pelo
+``zipfile``), sem dependências externas.
+"""
+import csv
+import re
+import zipfile
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+from itertools import chain, islice
+from xml.sax.saxutils import escape
+
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
+from django.utils.timezone import get_current_timezone, localtime, make_aware
+
+from .models import Animal, Cliente, Consulta
+
+TAMANHO_BLOCO = 2000  # linhas lidas do banco e enviadas de cada vez
+FORMATOS = {
+    'csv': 'text/csv; charset=utf-8',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
+ESPECIES = dict(Animal.ESPECIES)
+
+
+def _data_hora(valor):
+    return localtime(valor).strftime('%d/%m/%Y %H:%M') if valor else ''
+
+
+def _data_do_parametro(params, nome):
+    valor = params.get(nome)
+    if not valor:
+        return None
+    try:
+        return date.fromisoformat(valor)
+    except ValueError:
+        raise ValueError(f'{nome} deve estar no formato AAAA-MM-DD.')
+
+
+def consultas(params):
+    """
+    (cabeçalho, linhas) das consultas, filtradas por ``veterinario``,
+    ``status`` e pelo intervalo de dias ``inicio``/``fim`` (inclusive).
+    """
+    qs = Consulta.objects.all()
+    veterinario = params.get('veterinario')
+    if veterinario:
+        if not veterinario.isdigit():
+            raise ValueError('veterinario deve ser um número.')
+        qs = qs.filter(veterinario_id=int(veterinario))
+    status = params.get('status')
+    if status:
+        if status not in Consulta.StatusConsulta.values:
+            raise ValueError(f'status deve ser um de: {", ".join(Consulta.StatusConsulta.values)}.')
+        qs = qs.filter(status=status)
+    fuso = get_current_timezone()
+    inicio = _data_do_parametro(params, 'inicio')
+    if inicio:
+        qs = qs.filter(data__gte=make_aware(datetime.combine(inicio, time.min), fuso))
+    fim = _data_do_parametro(params, 'fim')
+    if fim:
+        qs = qs.filter(data__lt=make_aware(datetime.combine(fim + timedelta(days=1), time.min), fuso))
+
+    cabecalho = ['ID', 'Data', 'Status', 'Animal', 'Espécie', 'Dono', 'CPF', 'Veterinário', 'CRMV',
+                 'Motivo', 'Observações']
+    colunas = qs.order_by('data', 'id').values_list(
+        'id', 'data', 'status', 'animal__nome', 'animal__especie', 'animal__dono__nome',
+        'animal__dono__cpf', 'veterinario__nome', 'veterinario__crmv', 'motivo', 'observacoes',
+    ).iterator(chunk_size=TAMANHO_BLOCO)
+    linhas = (
+        (consulta_id, _data_hora(data), status, animal, ESPECIES.get(especie, especie), dono, cpf,
+         veterinario or '', crmv or '', motivo, observacoes)
+        for consulta_id, data, status, animal, especie, dono, cpf, veterinario, crmv, motivo, observacoes
+        in colunas
+    )
+    return cabecalho, linhas
+
+
+def clientes(params):
+    """
+    (cabeçalho, linhas) dos clientes, uma linha por animal (e uma linha sem
+    animal para quem não tem nenhum).
+    """
+    cabecalho = ['ID', 'Nome', 'CPF', 'Telefone', 'Email', 'Endereço', 'Animal', 'Espécie', 'Raça',
+                 'Idade', 'Peso']
+    colunas = Cliente.objects.order_by('id', 'animais__id').values_list(
+        'id', 'nome', 'cpf', 'telefone', 'email', 'endereco',
+        'animais__nome', 'animais__especie', 'animais__raca', 'animais__idade', 'animais__peso',
+    ).iterator(chunk_size=TAMANHO_BLOCO)
+    linhas = (
+        (*cliente, animal or '', ESPECIES.get(especie, especie or ''), raca or '', idade, peso)
+        for *cliente, animal, especie, raca, idade, peso in colunas
+    )
+    return cabecalho, linhas
+
+
+RELATORIOS = {'consultas': consultas, 'clientes': clientes}
+
+
+class _Pedacos:
+    """
+    Arquivo só de escrita que guarda o que recebe até ser esvaziado.
+    """
+
+    def __init__(self):
+        self._partes = []
+
+    def write(self, dados):
+        self._partes.append(dados)
+        return len(dados)
+
+    def flush(self):
+        pass
+
+    def esvaziar(self):
+        partes, self._partes = self._partes, []
+        return partes
+
+
+# Início de fórmula para o Excel/LibreOffice ao abrir o CSV
+_INICIO_FORMULA = ('=', '+', '-', '@', '\t', '\r')
+
+
+def _celula_csv(valor):
+    # Texto digitado pelos clientes (nome, motivo, endereço...) não pode virar
+    # fórmula na planilha: o apóstrofo faz o Excel mostrar o texto como está.
+    # No XLSX não é preciso, as células de texto são inlineStr.
+    if isinstance(valor, str) and valor.startswith(_INICIO_FORMULA):
+        return "'" + valor
+    return valor
+
+
+def csv_em_blocos(cabecalho, linhas):
+    # BOM: o Excel só reconhece o UTF-8 com ele
+    pedacos = _Pedacos()
+    escritor = csv.writer(pedacos)
+    escritor.writerow(cabecalho)
+    yield ('\ufeff' + ''.join(pedacos.esvaziar())).encode()
+    while bloco := list(islice(linhas, TAMANHO_BLOCO)):
+        escritor.writerows([_celula_csv(valor) for valor in linha] for linha in bloco)
+        yield ''.join(pedacos.esvaziar()).encode()
+
+
+# Caracteres de controle não são aceitos no XML da planilha
+_INVALIDOS_XML = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+# Linhas por planilha, fora o cabeçalho (limite do Excel: 1.048.576)
+LINHAS_POR_PLANILHA = 1_048_575
+
+_XML = '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+_TIPO = 'application/vnd.openxmlformats-officedocument.spreadsheetml.'
+_RELACAO = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+
+
+def _partes_fixas_xlsx(titulo, planilhas):
+    """
+    Arquivos do XLSX além das planilhas, para ``planilhas`` planilhas.
+    """
+    nomes = [titulo] + [f'{titulo} {numero}' for numero in range(2, planilhas + 1)]
+    numeros = range(1, planilhas + 1)
+    return {
+        '[Content_Types].xml': (
+            _XML + '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+            '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+            '<Default Extension="xml" ContentType="application/xml"/>'
+            f'<Override PartName="/xl/workbook.xml" ContentType="{_TIPO}sheet.main+xml"/>'
+            + ''.join(f'<Override PartName="/xl/worksheets/sheet{numero}.xml" '
+                      f'ContentType="{_TIPO}worksheet+xml"/>' for numero in numeros)
+            + '</Types>'),
+        '_rels/.rels': (
+            _XML + '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+            f'<Relationship Id="rId1" Target="xl/workbook.xml" Type="{_RELACAO}/officeDocument"/>'
+            '</Relationships>'),
+        'xl/workbook.xml': (
+            _XML + '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+            f'xmlns:r="{_RELACAO}"><sheets>'
+            + ''.join(f'<sheet name="{escape(nome)}" sheetId="{numero}" r:id="rId{numero}"/>'
+                      for numero, nome in zip(numeros, nomes))
+            + '</sheets></workbook>'),
+        'xl/_rels/workbook.xml.rels': (
+            _XML + '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+            + ''.join(f'<Relationship Id="rId{numero}" Target="worksheets/sheet{numero}.xml" '
+                      f'Type="{_RELACAO}/worksheet"/>' for numero in numeros)
+            + '</Relationships>'),
+    }
+
+
+def _celula(valor):
+    if valor is None or valor == '':
+        return '<c/>'
+    if isinstance(valor, (int, Decimal)) and not isinstance(valor, bool):
+        return f'<c><v>{valor}</v></c>'
+    texto = escape(_INVALIDOS_XML.sub('', str(valor)))
+    return f'<c t="inlineStr"><is><t xml:space="preserve">{texto}</t></is></c>'
+
+
+def _linha_xlsx(linha):
+    return '<row>' + ''.join(map(_celula, linha)) + '</row>'
+
+
+def xlsx_em_blocos(cabecalho, linhas, titulo):
+    """
+    Grava as planilhas primeiro e o índice do arquivo no final, quando já se
+    sabe quantas foram (a ordem dentro do zip não importa).
+    """
+    pedacos = _Pedacos()
+    planilhas = 0
+    # Sem seek: o zipfile grava os tamanhos depois de cada arquivo (data descriptor)
+    with zipfile.ZipFile(pedacos, 'w', zipfile.ZIP_DEFLATED) as pacote:
+        while True:
+            planilhas += 1
+            with pacote.open(f'xl/worksheets/sheet{planilhas}.xml', 'w', force_zip64=True) as planilha:
+                planilha.write((
+                    _XML + '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+                    '<sheetData>' + _linha_xlsx(cabecalho)).encode())
+                yield b''.join(pedacos.esvaziar())
+                restantes = LINHAS_POR_PLANILHA
+                while restantes and (bloco := list(islice(linhas, min(TAMANHO_BLOCO, restantes)))):
+                    restantes -= len(bloco)
+                    planilha.write(''.join(map(_linha_xlsx, bloco)).encode())
+                    yield b''.join(pedacos.esvaziar())
+                planilha.write(b'</sheetData></worksheet>')
+            if restantes or (proxima := next(linhas, None)) is None:
+                break
+            linhas = chain([proxima], linhas)
+        for nome, conteudo in _partes_fixas_xlsx(titulo, planilhas).items():
+            pacote.writestr(nome, conteudo)
+    yield b''.join(pedacos.esvaziar())
+
+
+async def _blocos_assincronos(blocos):
+    # Cada bloco é lido do banco numa thread, fora do loop de eventos
+    proximo = sync_to_async(next)
+    try:
+        while (bloco := await proximo(blocos, None)) is not None:
+            yield bloco
+    finally:
+        await sync_to_async(blocos.close)()
+
+
+def resposta(request, relatorio, formato, params):
+    """
+    StreamingHttpResponse com o relatório. Levanta ValueError com filtros ou
+    formato inválidos.
+    """
+    if formato not in FORMATOS:
+        raise ValueError('formato deve ser csv ou xlsx.')
+    cabecalho, linhas = RELATORIOS[relatorio](params)
+    if formato == 'csv':
+        blocos = csv_em_blocos(cabecalho, linhas)
+    else:
+        blocos = xlsx_em_blocos(cabecalho, linhas, relatorio.capitalize())
+    # Com ASGI, um iterador síncrono seria consumido inteiro antes do envio
+    if isinstance(request, ASGIRequest):
+        blocos = _blocos_assincronos(blocos)
+    resposta = StreamingHttpResponse(blocos, content_type=FORMATOS[formato])
+    resposta['Content-Disposition'] = f'attachment; filename="{relatorio}-{localtime():%Y-%m-%d}.{formato}"'
+    # nginx: enviar os blocos conforme são gerados
+    resposta['X-Accel-Buffering'] = 'no'
+    return resposta
@@ -1,5 +1,7 @@
 from django import forms 
-from .models import Consulta, Cliente, Animal, MedicoVeterinario
+from django.core.exceptions import ValidationError
+from .models import Consulta, Cliente, Animal, MedicoVeterinario, normalizar_cpf
+from . import agenda, cache, recorrencia
 from django.contrib.auth.models import User 
 
 # Formulário para o modelo Animal
@@ -17,6 +19,9 @@ class AnimalForm(forms.ModelForm):
 
 # Formulário para o modelo Clientes
 class ClienteForm(forms.ModelForm):
+    # Aceita o CPF com pontuação (123.456.789-00); é gravado só com os dígitos
+    cpf = forms.CharField(max_length=14, required=False)
+
     class Meta:
         model = Cliente
         fields = ['nome', 'cpf', 'telefone', 'email', 'endereco']
@@ -27,12 +32,17 @@ class ClienteForm(forms.ModelForm):
         for field in self.fields.values():
             field.widget.attrs.update({'class': 'form-control'}) 
 
+    def clean_cpf(self):
+        cpf = normalizar_cpf(self.cleaned_data.get('cpf'))
+        if cpf and len(cpf) != 11:
+            raise forms.ValidationError('O CPF deve ter 11 dígitos.')
+        return cpf or None
+
     def save(self, commit=True):
         """
         Cria usuários para cliente que não possuem um usuário associado 
         """
         cliente = super().save(commit=False)
-        print("[FORMS linha 32]",  cliente)
         if not cliente.usuario: # usuario == null, vazio
             if cliente.email:
                 username = cliente.email.split('@')[0]
@@ -67,6 +77,15 @@ class MedicoVeterinarioForm(forms.ModelForm):
 
 # Formulário para o modelo Consulta
 class ConsultaForm(forms.ModelForm):
+    # Série de consultas (core/recorrencia.py); sem "repetir", uma consulta só
+    repetir = forms.BooleanField(required=False)
+    intervalo = forms.IntegerField(min_value=1, max_value=365, initial=1, required=False)
+    unidade = forms.ChoiceField(choices=[('dias', 'dia(s)'), ('semanas', 'semana(s)')], initial='semanas',
+                                required=False)
+    ocorrencias = forms.IntegerField(min_value=2, max_value=recorrencia.MAXIMO_OCORRENCIAS, initial=2,
+                                     required=False)
+    pular_fim_de_semana = forms.BooleanField(required=False, initial=True)
+
     class Meta:
         model = Consulta
         fields = ['animal', 'veterinario', 'data', 'motivo', 'observacoes']
@@ -82,28 +101,49 @@ class ConsultaForm(forms.ModelForm):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs) 
 
+        # Opções do select de veterinários vindas do cache (core/cache.py)
+        veterinario = self.fields['veterinario']
+        veterinario.choices = [('', veterinario.empty_label)] + [
+            (vet.pk, str(vet)) for vet in cache.veterinarios()]
+
         for field in self.fields.values():
             field.widget.attrs.update({'class': 'form-control'})
-            
-        
-
-    def clean(self): 
-        cleaned_data = super().clean()
-        data = cleaned_data.get('data')
-        veterinario = cleaned_data.get('veterinario')
-
-        # Garante que ambos os campos existem antes de tentar a consulta
-        if data and veterinario:
-            # Exclui a própria instância se estivermos editando uma consulta existente
-            # Isso evita que o formulário dê erro ao salvar uma edição sem alterar o horário.
-            qs = Consulta.objects.filter(data=data, veterinario=veterinario)
-            if self.instance.pk:
-                qs = qs.exclude(pk=self.instance.pk)
-            
-            if qs.exists():
-                raise forms.ValidationError(
-                    'Já existe uma consulta agendada neste horário para este veterinário.'
-                )
-        
-        return cleaned_data
-     
+        for nome in ('repetir', 'pular_fim_de_semana'):
+            self.fields[nome].widget.attrs['class'] = 'form-check-input'
+
+    def clean(self):
+        dados = super().clean()
+        if dados.get('repetir'):
+            for campo in ('intervalo', 'unidade', 'ocorrencias'):
+                if not dados.get(campo) and campo not in self.errors:
+                    self.add_error(campo, 'Obrigatório para repetir a consulta.')
+        elif dados.get('veterinario') and dados.get('data'):
+            # Na série, cada ocorrência é conferida por recorrencia.conflitos
+            erro = agenda.situacao_na_grade(dados['veterinario'].pk, dados['data'])
+            if erro:
+                self.add_error('data', erro)
+        return dados
+
+    def agendar_serie(self):
+        """
+        Agenda a série pedida no formulário; devolve (consultas, conflitos).
+        """
+        dados = self.cleaned_data
+        try:
+            return recorrencia.agendar_serie(
+                super().save(commit=False), dados['intervalo'], dados['unidade'], dados['ocorrencias'],
+                dados['pular_fim_de_semana'])
+        except ValidationError as e:
+            self.add_error(None, e)
+            raise
+
+    def save(self, commit=True):
+        """
+        O conflito de horário é garantido pela constraint do banco: se o INSERT
+        falhar, o erro é devolvido ao formulário como erro de validação.
+        """
+        try:
+            return super().save(commit)
+        except ValidationError as e:
+            self.add_error(None, e)
+            raise
@@ -0,0 +1,401 @@
+"""
+Importação em massa de dados de outras clínicas (planilhas exportadas em
+CSV ou JSONL), usada pelo comando ``importar_dados`` e por
+``POST /api/importacao/<tipo>/``.
+
+O arquivo é lido linha a linha e gravado em lotes de ``TAMANHO_LOTE``: a
+memória usada não depende do tamanho do arquivo. Em cada lote:
+
+- os campos de cada linha são validados pelos próprios campos do modelo;
+- as chaves estrangeiras (CPF do dono, CRMV) viram ids com uma consulta por
+  lote, guardadas num dicionário;
+- os registros são gravados com ``bulk_create``, atualizando os que já
+  existem pela chave natural: CPF (clientes), CRMV (veterinários), dono +
+  nome (animais) e animal + data (consultas).
+
+Importar o mesmo arquivo de novo não duplica nada. Cada lote é gravado numa
+transação; as linhas com erro são puladas e informadas com o número da linha.
+
+Colunas (CSV com cabeçalho, ou as mesmas chaves em cada objeto JSONL):
+
+- clientes: nome, cpf, telefone, email, endereco
+- veterinarios: nome, crmv, especialidade, contato
+- animais: cpf_dono, nome, especie, raca, idade, peso
+- consultas: cpf_dono, animal, crmv, data, motivo, observacoes, status
+"""
+import csv
+import json
+from datetime import datetime
+from itertools import islice
+
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from . import busca
+from .models import (Animal, Cliente, Consulta, MedicoVeterinario, MENSAGEM_HORARIO_OCUPADO,
+                     horario_ocupado, normalizar_cpf)
+from .signals import consultas_gravadas_em_lote, gravados_em_lote
+
+TAMANHO_LOTE = 2000
+# Planilhas brasileiras costumam trazer datas neste formato
+FORMATOS_DATA = ('%d/%m/%Y %H:%M', '%d/%m/%Y %H:%M:%S')
+
+
+def ler_linhas(arquivo, formato):
+    """
+    Gera ``(número da linha, dados, erro)`` para cada registro de um arquivo
+    de texto aberto. ``erro`` vem preenchido (e ``dados`` vazio) quando a
+    linha não pôde ser lida.
+    """
+    if formato == 'csv':
+        leitor = csv.DictReader(arquivo)
+        for dados in leitor:
+            if None in dados:
+                yield leitor.line_num, {}, 'Mais colunas que o cabeçalho.'
+            else:
+                yield leitor.line_num, dados, None
+    elif formato == 'jsonl':
+        for numero, linha in enumerate(arquivo, start=1):
+            if not linha.strip():
+                continue
+            try:
+                dados = json.loads(linha)
+            except ValueError as e:
+                yield numero, {}, f'JSON inválido: {e}'
+                continue
+            if isinstance(dados, dict):
+                yield numero, dados, None
+            else:
+                yield numero, {}, 'Cada linha deve ser um objeto JSON.'
+    else:
+        raise ValueError(f'Formato desconhecido: {formato} (use csv ou jsonl).')
+
+
+def formato_do_arquivo(nome):
+    extensao = nome.rsplit('.', 1)[-1].lower() if '.' in nome else ''
+    return {'csv': 'csv', 'jsonl': 'jsonl', 'ndjson': 'jsonl'}.get(extensao)
+
+
+class Importador:
+    """
+    Importação de um modelo. As subclasses definem as colunas e como
+    resolver as chaves estrangeiras e gravar um lote.
+    """
+    modelo = None
+    # Colunas do arquivo que são campos do modelo
+    campos = ()
+    # Colunas obrigatórias que não são campos (chaves estrangeiras)
+    referencias = ()
+
+    def converter(self, dados):
+        """
+        Valida os campos de uma linha; devolve (valores, erros).
+        """
+        valores, erros = {}, {}
+        for nome in self.campos:
+            campo = self.modelo._meta.get_field(nome)
+            valor = dados.get(nome)
+            if isinstance(valor, str):
+                valor = valor.strip()
+            if valor in (None, ''):
+                if campo.has_default():
+                    valor = campo.get_default()
+                elif campo.null:
+                    valor = None
+                elif campo.blank:
+                    valor = ''
+            try:
+                valores[nome] = self.converter_campo(campo, valor)
+            except ValidationError as e:
+                erros[nome] = e.messages
+        for nome in self.referencias:
+            valor = str(dados.get(nome) or '').strip()
+            if valor:
+                valores[nome] = valor
+            else:
+                erros[nome] = ['Este campo é obrigatório.']
+        return valores, erros
+
+    def converter_campo(self, campo, valor):
+        return campo.clean(valor, None)
+
+    def resolver(self, linhas):
+        """
+        Troca as referências das linhas válidas de um lote por ids, com uma
+        consulta por lote. ``linhas`` é {número: valores}; devolve
+        {número: erros} das linhas que não puderam ser resolvidas.
+        """
+        return {}
+
+    def chave(self, valores):
+        """
+        Chave natural de uma linha já resolvida. Dentro do lote vale a última
+        linha com a mesma chave, como aconteceria entre lotes.
+        """
+        raise NotImplementedError
+
+    def gravar(self, objetos):
+        raise NotImplementedError
+
+
+class ImportadorClientes(Importador):
+    modelo = Cliente
+    campos = ('nome', 'cpf', 'telefone', 'email', 'endereco')
+
+    def converter(self, dados):
+        # O CPF é a chave da importação; grava só os dígitos, como o cadastro
+        dados = dict(dados)
+        dados['cpf'] = normalizar_cpf(str(dados.get('cpf') or ''))
+        valores, erros = super().converter(dados)
+        valores['cpf_digitos'] = valores.get('cpf') or None
+        if 'cpf' not in erros and valores['cpf_digitos'] is None:
+            erros['cpf'] = ['Este campo é obrigatório.']
+        elif 'cpf' not in erros and len(valores['cpf_digitos']) != 11:
+            # Mesma regra do ClienteForm.clean_cpf
+            erros['cpf'] = ['O CPF deve ter 11 dígitos.']
+        return valores, erros
+
+    def chave(self, valores):
+        return valores['cpf_digitos']
+
+    def gravar(self, objetos):
+        # Os clientes importados ficam sem usuário (ver create_users_for_clients)
+        objetos = Cliente.objects.bulk_create(
+            objetos, update_conflicts=True, unique_fields=['cpf_digitos'],
+            update_fields=['nome', 'cpf', 'telefone', 'email', 'endereco', 'updated_at'])
+        busca.indexar(*objetos)
+        gravados_em_lote(objetos)
+
+
+class ImportadorVeterinarios(Importador):
+    modelo = MedicoVeterinario
+    campos = ('nome', 'crmv', 'especialidade', 'contato')
+
+    def chave(self, valores):
+        return valores['crmv']
+
+    def gravar(self, objetos):
+        objetos = MedicoVeterinario.objects.bulk_create(
+            objetos, update_conflicts=True, unique_fields=['crmv'],
+            update_fields=['nome', 'especialidade', 'contato', 'updated_at'])
+        busca.indexar(*objetos)
+        gravados_em_lote(objetos)
+
+
+def _gravar_por_chave(modelo, objetos, existentes, campos):
+    """
+    Grava ``objetos`` ({chave: objeto}) dando aos que já existem o id de
+    ``existentes``: um upsert pela chave primária, para os modelos cuja chave
+    natural não tem índice único no banco.
+    """
+    for chave, objeto in objetos.items():
+        objeto.pk = existentes.get(chave)
+    return modelo.objects.bulk_create(
+        list(objetos.values()), update_conflicts=True, unique_fields=['id'], update_fields=[*campos, 'updated_at'])
+
+
+class ImportadorAnimais(Importador):
+    modelo = Animal
+    campos = ('nome', 'especie', 'raca', 'idade', 'peso')
+    referencias = ('cpf_dono',)
+    # Aceita o nome da espécie além do código ('Gato' ou 'G')
+    especies = {nome.lower(): codigo for codigo, nome in Animal.ESPECIES}
+
+    def converter(self, dados):
+        dados = dict(dados)
+        especie = str(dados.get('especie') or '').strip()
+        dados['especie'] = self.especies.get(especie.lower(), especie.upper())
+        peso = dados.get('peso')
+        if isinstance(peso, str):
+            dados['peso'] = peso.replace(',', '.')
+        return super().converter(dados)
+
+    def resolver(self, linhas):
+        cpfs = {normalizar_cpf(valores['cpf_dono']) for valores in linhas.values()}
+        donos = dict(Cliente.objects.filter(cpf_digitos__in=cpfs).values_list('cpf_digitos', 'id'))
+        erros = {}
+        for numero, valores in linhas.items():
+            dono_id = donos.get(normalizar_cpf(valores.pop('cpf_dono')))
+            if dono_id is None:
+                erros[numero] = {'cpf_dono': ['Cliente não encontrado.']}
+            else:
+                valores['dono_id'] = dono_id
+        return erros
+
+    def chave(self, valores):
+        return valores['dono_id'], valores['nome']
+
+    def gravar(self, objetos):
+        objetos = {(objeto.dono_id, objeto.nome): objeto for objeto in objetos}
+        existentes = {}
+        # order_by('-id'): com nomes repetidos no banco, atualiza o mais antigo
+        for dono_id, nome, animal_id in Animal.objects.filter(
+                dono_id__in={dono_id for dono_id, _nome in objetos}).order_by('-id').values_list(
+                'dono_id', 'nome', 'id'):
+            existentes[dono_id, nome] = animal_id
+        objetos = _gravar_por_chave(Animal, objetos, existentes, ['especie', 'raca', 'idade', 'peso'])
+        busca.indexar(*objetos)
+        gravados_em_lote(objetos)
+
+
+class ImportadorConsultas(Importador):
+    modelo = Consulta
+    campos = ('data', 'motivo', 'observacoes', 'status')
+    referencias = ('cpf_dono', 'animal', 'crmv')
+    status = {valor.lower(): valor for valor in Consulta.StatusConsulta.values}
+
+    def converter(self, dados):
+        dados = dict(dados)
+        status = str(dados.get('status') or '').strip()
+        dados['status'] = self.status.get(status.lower(), status)
+        return super().converter(dados)
+
+    def converter_campo(self, campo, valor):
+        if campo.name != 'data':
+            return super().converter_campo(campo, valor)
+        if isinstance(valor, str):
+            for formato in FORMATOS_DATA:
+                try:
+                    valor = datetime.strptime(valor, formato)
+                    break
+                except ValueError:
+                    pass
+        valor = campo.clean(valor, None)
+        if timezone.is_naive(valor):
+            valor = timezone.make_aware(valor)
+        return valor
+
+    def resolver(self, linhas):
+        cpfs = {normalizar_cpf(valores['cpf_dono']) for valores in linhas.values()}
+        animais = {
+            (cpf, nome): animal_id
+            for cpf, nome, animal_id in Animal.objects.filter(dono__cpf_digitos__in=cpfs).order_by('-id')
+            .values_list('dono__cpf_digitos', 'nome', 'id')
+        }
+        veterinarios = dict(MedicoVeterinario.objects.filter(
+            crmv__in={valores['crmv'] for valores in linhas.values()}).values_list('crmv', 'id'))
+
+        erros = {}
+        for numero, valores in linhas.items():
+            animal_id = animais.get((normalizar_cpf(valores.pop('cpf_dono')), valores.pop('animal')))
+            veterinario_id = veterinarios.get(valores.pop('crmv'))
+            if animal_id is None:
+                erros[numero] = {'animal': ['Animal não encontrado para este CPF.']}
+            elif veterinario_id is None:
+                erros[numero] = {'crmv': ['Veterinário não encontrado.']}
+            else:
+                valores.update(animal_id=animal_id, veterinario_id=veterinario_id)
+        return erros
+
+    def chave(self, valores):
+        return valores['animal_id'], valores['data']
+
+    def conflitos(self, objetos, existentes):
+        """
+        Números das linhas que ocupariam um horário já agendado (no banco ou
+        numa linha anterior do lote) do mesmo veterinário.
+        """
+        agendadas = [objeto for objeto in objetos.values() if objeto.status == Consulta.StatusConsulta.AGENDADA]
+        ocupados = {
+            (veterinario_id, data): consulta_id
+            for veterinario_id, data, consulta_id in Consulta.objects.filter(
+                status=Consulta.StatusConsulta.AGENDADA,
+                veterinario_id__in={objeto.veterinario_id for objeto in agendadas},
+                data__in={objeto.data for objeto in agendadas},
+            ).values_list('veterinario_id', 'data', 'id')
+        }
+        no_lote = set()
+        conflitos = []
+        for chave, objeto in objetos.items():
+            if objeto.status != Consulta.StatusConsulta.AGENDADA:
+                continue
+            horario = (objeto.veterinario_id, objeto.data)
+            outra = ocupados.get(horario)
+            if horario in no_lote or (outra is not None and outra != existentes.get(chave)):
+                conflitos.append(chave)
+            no_lote.add(horario)
+        return conflitos
+
+    def gravar(self, objetos):
+        objetos = {(objeto.animal_id, objeto.data): objeto for objeto in objetos}
+        existentes = {}
+        for animal_id, data, consulta_id, veterinario_id, status in Consulta.objects.filter(
+                animal_id__in={animal_id for animal_id, _data in objetos},
+                data__in={data for _animal_id, data in objetos},
+        ).values_list('animal_id', 'data', 'id', 'veterinario_id', 'status'):
+            existentes[animal_id, data] = consulta_id
+            # Se a consulta trocar de veterinário, a agenda antiga também muda (core/signals.py),
+            # e as contagens por dia saem do estado anterior (core/estatisticas.py)
+            objetos[animal_id, data]._veterinario_inicial = veterinario_id
+            objetos[animal_id, data]._estatistica_inicial = (veterinario_id, data, status)
+        rejeitadas = self.conflitos(objetos, existentes)
+        for chave in rejeitadas:
+            del objetos[chave]
+        objetos = _gravar_por_chave(Consulta, objetos, existentes,
+                                    ['veterinario', 'motivo', 'observacoes', 'status'])
+        consultas_gravadas_em_lote(objetos)
+        return rejeitadas
+
+
+IMPORTADORES = {
+    'clientes': ImportadorClientes,
+    'veterinarios': ImportadorVeterinarios,
+    'animais': ImportadorAnimais,
+    'consultas': ImportadorConsultas,
+}
+
+
+def importar(tipo, registros, tamanho_lote=TAMANHO_LOTE, ao_errar=None):
+    """
+    Importa os registros de ``ler_linhas`` em lotes. ``ao_errar(numero,
+    erros)`` é chamado para cada linha rejeitada, na hora (os erros não ficam
+    acumulados). Devolve {'linhas', 'gravadas', 'erros'}.
+    """
+    importador = IMPORTADORES[tipo]()
+    resumo = {'linhas': 0, 'gravadas': 0, 'erros': 0}
+
+    def rejeitar(numero, erros):
+        resumo['erros'] += 1
+        if ao_errar is not None:
+            ao_errar(numero, erros)
+
+    registros = iter(registros)
+    while lote := list(islice(registros, tamanho_lote)):
+        resumo['linhas'] += len(lote)
+        linhas = {}
+        for numero, dados, erro in lote:
+            if erro:
+                rejeitar(numero, {'linha': [erro]})
+                continue
+            valores, erros = importador.converter(dados)
+            if erros:
+                rejeitar(numero, erros)
+            else:
+                linhas[numero] = valores
+        for numero, erros in importador.resolver(linhas).items():
+            del linhas[numero]
+            rejeitar(numero, erros)
+        if not linhas:
+            continue
+
+        # A última linha com a mesma chave vale; as anteriores contam como gravadas
+        numeros = {}
+        for numero, valores in linhas.items():
+            numeros.setdefault(importador.chave(valores), []).append(numero)
+        objetos = [importador.modelo(**linhas[grupo[-1]]) for grupo in numeros.values()]
+        try:
+            with transaction.atomic():
+                rejeitadas = importador.gravar(objetos) or []
+        except IntegrityError as e:
+            # Outro processo agendou um horário do lote entre a verificação e o INSERT
+            if not horario_ocupado(e):
+                raise
+            for numero in linhas:
+                rejeitar(numero, {'data': [MENSAGEM_HORARIO_OCUPADO + ' Lote não gravado; importe de novo.']})
+            continue
+        for chave in rejeitadas:
+            for numero in numeros.pop(chave):
+                rejeitar(numero, {'data': [MENSAGEM_HORARIO_OCUPADO]})
+        resumo['gravadas'] += sum(len(grupo) for grupo in numeros.values())
+    return resumo
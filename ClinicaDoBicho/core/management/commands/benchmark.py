@@ -0,0 +1,195 @@
+import itertools
+import json
+import statistics
+import time
+from datetime import datetime, timedelta
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Min
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.utils.timezone import localtime, make_aware
+from rest_framework_simplejwt.tokens import AccessToken
+
+from core.models import Animal, Cliente, Consulta, MedicoVeterinario
+
+
+class Desfazer(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = ('Mede as principais telas e endpoints da API pelo cliente de testes do Django '
+            '(latência p50/p95/p99 e quantidade de consultas SQL) e compara com uma linha de base. '
+            'Rode num banco preenchido pelo popular_clinica; o que as requisições gravam é desfeito no final. '
+            'Ex.: DB_NAME=/tmp/bench.sqlite3 python manage.py benchmark --linha-de-base benchmark.json')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeticoes', type=int, default=20,
+                            help='Requisições medidas por caso (padrão: 20)')
+        parser.add_argument('--aquecimento', type=int, default=2,
+                            help='Requisições descartadas antes das medidas (padrão: 2)')
+        parser.add_argument('--linha-de-base', help='JSON de uma execução anterior para comparar')
+        parser.add_argument('--salvar', help='Grava os resultados num JSON (a nova linha de base)')
+        parser.add_argument('--tolerancia', type=float, default=0.25,
+                            help='Piora relativa aceita no p50/p95 (padrão: 0.25 = 25%%)')
+        parser.add_argument('--margem', type=float, default=2.0,
+                            help='Piora absoluta sempre aceita, em ms (padrão: 2)')
+        parser.add_argument('--com-cache', action='store_true',
+                            help='Não limpa o cache antes de cada requisição (mede o caso quente)')
+
+    def handle(self, *args, **options):
+        if options['repeticoes'] < 2:
+            raise CommandError('--repeticoes deve ser ao menos 2.')
+        veterinarios = list(MedicoVeterinario.objects.order_by('id').values_list('id', flat=True)[:2])
+        animal = Animal.objects.order_by('id').values_list('id', flat=True).first()
+        if len(veterinarios) < 2 or animal is None:
+            raise CommandError('Banco sem dados: preencha antes com o popular_clinica.')
+
+        parametros = {
+            'clientes': Cliente.objects.count(),
+            'animais': Animal.objects.count(),
+            'consultas': Consulta.objects.count(),
+            'veterinarios': MedicoVeterinario.objects.count(),
+        }
+        base = self.ler_linha_de_base(options['linha_de_base'], parametros)
+
+        resultados = {}
+        try:
+            # O log de consultas lentas (core/metricas.py) só atrapalharia o relatório
+            with transaction.atomic(), override_settings(ALLOWED_HOSTS=['testserver'],
+                                                         METRICAS_CONSULTA_LENTA=float('inf')):
+                casos = self.casos(veterinarios, animal)
+                for nome, requisicao in casos:
+                    resultados[nome] = self.medir(nome, requisicao, options)
+                raise Desfazer
+        except Desfazer:
+            pass
+
+        regressoes = self.relatar(resultados, base, options['tolerancia'], options['margem'])
+
+        if options['salvar']:
+            with open(options['salvar'], 'w', encoding='utf-8') as arquivo:
+                json.dump({'parametros': parametros, 'casos': resultados}, arquivo, indent=2, ensure_ascii=False)
+                arquivo.write('\n')
+            self.stdout.write(f'Resultados gravados em {options["salvar"]}')
+
+        if regressoes:
+            raise CommandError(f'{len(regressoes)} regressão(ões): ' + '; '.join(regressoes))
+
+    def ler_linha_de_base(self, caminho, parametros):
+        if not caminho:
+            return None
+        try:
+            with open(caminho, encoding='utf-8') as arquivo:
+                base = json.load(arquivo)
+        except (OSError, ValueError) as e:
+            raise CommandError(f'Não foi possível ler a linha de base: {e}')
+        if base.get('parametros') != parametros:
+            # Outro volume de dados muda as latências: a comparação não valeria nada
+            raise CommandError(f'A linha de base foi medida com outros dados ({base.get("parametros")}); '
+                               f'este banco tem {parametros}.')
+        return base['casos']
+
+    def casos(self, veterinarios, animal):
+        """
+        Lista de (nome, função que faz uma requisição e devolve a resposta).
+        """
+        usuario, _ = User.objects.get_or_create(username='benchmark', defaults={'is_staff': True})
+        navegador = Client()
+        navegador.force_login(usuario)
+        api = Client(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(usuario)}')
+
+        # Janela do calendário (6 semanas, como a visão mensal) onde há consultas
+        primeira = Consulta.objects.filter(veterinario_id=veterinarios[0]).aggregate(data=Min('data'))['data']
+        inicio = localtime(primeira) if primeira else localtime()
+        calendario = {'veterinario': veterinarios[0], 'start': inicio.date().isoformat(),
+                      'end': (inicio + timedelta(weeks=6)).date().isoformat()}
+
+        # Cada agendamento vai para um horário livre diferente, longe dos dados
+        horarios = itertools.count()
+
+        def horario():
+            return make_aware(datetime(2099, 1, 5, 8)) + timedelta(hours=next(horarios))
+
+        def agendar_pela_api():
+            return api.post('/api/consultas/', {
+                'animal': animal, 'veterinario': veterinarios[0], 'data': horario().isoformat(),
+                'motivo': 'Benchmark'}, content_type='application/json')
+
+        def agendar_pelo_formulario():
+            resposta = navegador.post('/agendar_consulta/', {
+                'salvar': '1', 'animal': animal, 'veterinario': veterinarios[1],
+                'data': localtime(horario()).strftime('%Y-%m-%dT%H:%M'), 'motivo': 'Benchmark'})
+            # Com erro no formulário a tela volta com status 200, sem agendar
+            if resposta.status_code != 302:
+                raise CommandError(f'agendar_consulta: o formulário não foi aceito (status {resposta.status_code})')
+            return resposta
+
+        return [
+            ('lista_clientes', lambda: navegador.get('/clientes/')),
+            ('lista_clientes (página 1000)', lambda: navegador.get('/clientes/', {'page': 1000})),
+            ('lista_consultas', lambda: navegador.get('/consultas/')),
+            ('eventos_doctor', lambda: navegador.get('/eventos_doctor/', calendario)),
+            ('agendar_consulta (POST)', agendar_pelo_formulario),
+            ('api consultas', lambda: api.get('/api/consultas/')),
+            ('api eventos_veterinario', lambda: api.get('/api/consultas/eventos_veterinario/', calendario)),
+            ('api proximos_horarios', lambda: api.get('/api/consultas/proximos_horarios/', {'limite': 10})),
+            ('api resumo_consultas', lambda: api.get('/api/consultas/resumo_consultas/')),
+            ('api resumo_consultas por veterinário',
+             lambda: api.get('/api/consultas/resumo_consultas/', {'por_veterinario': 1})),
+            ('api consultas (POST)', agendar_pela_api),
+        ]
+
+    def medir(self, nome, requisicao, options):
+        latencias, consultas = [], 0
+        for rodada in range(options['aquecimento'] + options['repeticoes']):
+            if not options['com_cache']:
+                cache.clear()
+            with CaptureQueriesContext(connection) as capturadas:
+                inicio = time.perf_counter()
+                resposta = requisicao()
+                duracao = time.perf_counter() - inicio
+            if resposta.status_code >= 400:
+                raise CommandError(f'{nome}: status {resposta.status_code}')
+            if rodada >= options['aquecimento']:
+                latencias.append(duracao * 1000)
+                consultas = max(consultas, len(capturadas))
+        percentis = statistics.quantiles(latencias, n=100, method='inclusive')
+        return {
+            'consultas': consultas,
+            'p50': round(percentis[49], 2),
+            'p95': round(percentis[94], 2),
+            'p99': round(percentis[98], 2),
+        }
+
+    def relatar(self, resultados, base, tolerancia, margem):
+        regressoes = []
+        largura = max(len(nome) for nome in resultados)
+        self.stdout.write(f'{"caso":<{largura}}  consultas      p50      p95      p99 (ms)')
+        for nome, resultado in resultados.items():
+            linha = (f'{nome:<{largura}}  {resultado["consultas"]:>9}  {resultado["p50"]:>7.1f}  '
+                     f'{resultado["p95"]:>7.1f}  {resultado["p99"]:>7.1f}')
+            anterior = base.get(nome) if base is not None else None
+            if base is not None and anterior is None:
+                linha += '  (novo)'
+            problemas = self.comparar(resultado, anterior, tolerancia, margem) if anterior else []
+            if problemas:
+                regressoes.append(f'{nome}: ' + ', '.join(problemas))
+                linha += '  ' + self.style.ERROR('; '.join(problemas))
+            self.stdout.write(linha)
+        return regressoes
+
+    def comparar(self, resultado, anterior, tolerancia, margem):
+        problemas = []
+        # A quantidade de consultas não depende da máquina: qualquer aumento conta
+        if resultado['consultas'] > anterior['consultas']:
+            problemas.append(f'consultas SQL {anterior["consultas"]} -> {resultado["consultas"]}')
+        for percentil in ('p50', 'p95'):
+            limite = max(anterior[percentil] * (1 + tolerancia), anterior[percentil] + margem)
+            if resultado[percentil] > limite:
+                problemas.append(f'{percentil} {anterior[percentil]:.1f} -> {resultado[percentil]:.1f} ms')
+        return problemas
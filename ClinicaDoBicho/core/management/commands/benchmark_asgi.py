@@ -0,0 +1,145 @@
+import asyncio
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test import AsyncClient, Client, override_settings
+from django.utils.timezone import localdate
+from rest_framework_simplejwt.tokens import AccessToken
+
+from core.models import MedicoVeterinario
+
+
+class MonitorDeThreads:
+    """
+    Maior número de threads vivas no processo durante a medição (no modo
+    WSGI isso inclui a thread de cada cliente simulado).
+    """
+
+    def __init__(self):
+        self.maximo = threading.active_count()
+        self._parar = threading.Event()
+        self._thread = threading.Thread(target=self._observar, daemon=True)
+
+    def _observar(self):
+        while not self._parar.wait(0.01):
+            self.maximo = max(self.maximo, threading.active_count())
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._parar.set()
+        self._thread.join()
+
+
+class Command(BaseCommand):
+    help = ('Compara as views assíncronas do calendário/dashboard servidas como ASGI '
+            '(um loop de eventos) e como WSGI (um número fixo de threads), com vários '
+            'clientes simultâneos. Só faz leituras; use um banco com dados.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clientes', type=int, default=100,
+                            help='Clientes simultâneos, cada um esperando a própria resposta (padrão: 100)')
+        parser.add_argument('--requisicoes', type=int, default=20,
+                            help='Requisições por cliente (padrão: 20)')
+        parser.add_argument('--threads', type=int, default=8,
+                            help='Threads do servidor WSGI simulado (padrão: 8)')
+        parser.add_argument('--usuario', help='Usuário da equipe usado nas requisições (padrão: o primeiro)')
+
+    def handle(self, *args, **options):
+        usuarios = User.objects.filter(is_staff=True).order_by('id')
+        if options['usuario']:
+            usuarios = usuarios.filter(username=options['usuario'])
+        usuario = usuarios.first()
+        if usuario is None:
+            raise CommandError('Nenhum usuário da equipe encontrado (crie um com createsuperuser).')
+        veterinario = MedicoVeterinario.objects.order_by('id').first()
+        if veterinario is None:
+            raise CommandError('Cadastre ao menos um veterinário.')
+
+        inicio = localdate()
+        janela = f'start={inicio}&end={inicio + timedelta(days=7)}'
+        self.urls = [
+            f'/eventos_doctor/?veterinario={veterinario.pk}&{janela}',
+            f'/api/consultas/eventos_veterinario/?veterinario={veterinario.pk}&{janela}',
+            '/api/consultas/resumo_consultas/',
+        ]
+        self.usuario = usuario
+        self.cabecalhos = {'Authorization': f'Bearer {AccessToken.for_user(usuario)}'}
+        connections.close_all()
+
+        clientes, requisicoes = options['clientes'], options['requisicoes']
+        self.stdout.write(f'{clientes} clientes x {requisicoes} requisições, URLs em rodízio:')
+        for url in self.urls:
+            self.stdout.write(f'  {url}')
+
+        # Os clientes de teste do Django usam o host 'testserver'
+        with override_settings(ALLOWED_HOSTS=['testserver']):
+            self.relatar(f'WSGI ({options["threads"]} threads)',
+                         *self.medir_wsgi(clientes, requisicoes, options['threads']))
+            self.relatar('ASGI', *asyncio.run(self.medir_asgi(clientes, requisicoes)))
+
+    def medir_wsgi(self, clientes, requisicoes, threads):
+        # Cada cliente espera a própria resposta; no máximo ``threads``
+        # requisições são atendidas ao mesmo tempo, como num servidor WSGI.
+        servidor = threading.Semaphore(threads)
+        latencias = []
+
+        def cliente(numero):
+            http = Client()
+            http.force_login(self.usuario)
+            for i in range(requisicoes):
+                url = self.urls[(numero + i) % len(self.urls)]
+                comeco = time.perf_counter()
+                with servidor:
+                    resposta = http.get(url, headers=self.cabecalhos)
+                    b''.join(resposta) if resposta.streaming else resposta.content
+                latencias.append(time.perf_counter() - comeco)
+                self.conferir(resposta, url)
+            connections.close_all()
+
+        with MonitorDeThreads() as monitor:
+            comeco = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=clientes) as executor:
+                list(executor.map(cliente, range(clientes)))
+            duracao = time.perf_counter() - comeco
+        return latencias, duracao, monitor.maximo
+
+    async def medir_asgi(self, clientes, requisicoes):
+        latencias = []
+
+        async def cliente(numero):
+            http = AsyncClient()
+            await http.aforce_login(self.usuario)
+            for i in range(requisicoes):
+                url = self.urls[(numero + i) % len(self.urls)]
+                comeco = time.perf_counter()
+                resposta = await http.get(url, headers=self.cabecalhos)
+                if resposta.streaming:
+                    [parte async for parte in resposta.streaming_content]
+                latencias.append(time.perf_counter() - comeco)
+                self.conferir(resposta, url)
+
+        with MonitorDeThreads() as monitor:
+            comeco = time.perf_counter()
+            await asyncio.gather(*(cliente(numero) for numero in range(clientes)))
+            duracao = time.perf_counter() - comeco
+        return latencias, duracao, monitor.maximo
+
+    def conferir(self, resposta, url):
+        if resposta.status_code != 200:
+            raise CommandError(f'{url}: status {resposta.status_code}')
+
+    def relatar(self, titulo, latencias, duracao, threads):
+        percentis = statistics.quantiles(latencias, n=100)
+        self.stdout.write(
+            f'{titulo}: {len(latencias) / duracao:.0f} req/s, '
+            f'p50 {percentis[49] * 1000:.0f} ms, p95 {percentis[94] * 1000:.0f} ms, '
+            f'p99 {percentis[98] * 1000:.0f} ms, pico de {threads} threads')
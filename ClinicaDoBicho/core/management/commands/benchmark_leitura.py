@@ -0,0 +1,96 @@
+import random
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils.timezone import make_aware
+from rest_framework.renderers import JSONRenderer
+
+from api.leitura import COLUNAS_ANIMAL, COLUNAS_CONSULTA, animais_em_dicts, consultas_em_dicts
+from api.renderers import JSONRapidoRenderer, orjson
+from api.serializers import AnimalSerializer, ConsultaSerializer
+from core.models import Animal, Cliente, Consulta, MedicoVeterinario
+
+
+class Desfazer(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = ('Compara a listagem pelo ModelSerializer com a leitura rápida (values() + orjson). '
+            'Os registros de teste são criados numa transação desfeita no final.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--linhas', type=int, default=10000,
+                            help='Quantidade de consultas e de animais (padrão: 10000)')
+        parser.add_argument('--repeticoes', type=int, default=3,
+                            help='Execuções de cada caminho; vale a mais rápida (padrão: 3)')
+
+    def handle(self, *args, **options):
+        linhas = options['linhas']
+        repeticoes = options['repeticoes']
+        if not orjson:
+            self.stdout.write(self.style.WARNING('orjson não instalado: o JSON usa a biblioteca padrão.'))
+
+        try:
+            with transaction.atomic():
+                self.criar_registros(linhas)
+                self.comparar(
+                    'Animais',
+                    lambda qs: JSONRenderer().render(AnimalSerializer(qs.select_related('dono'), many=True).data),
+                    lambda qs: JSONRapidoRenderer().render(animais_em_dicts(qs.values(*COLUNAS_ANIMAL))),
+                    Animal.objects.order_by('id'), repeticoes)
+                self.comparar(
+                    'Consultas',
+                    lambda qs: JSONRenderer().render(ConsultaSerializer(
+                        qs.select_related('animal__dono', 'veterinario'), many=True).data),
+                    lambda qs: JSONRapidoRenderer().render(consultas_em_dicts(qs.values(*COLUNAS_CONSULTA))),
+                    Consulta.objects.order_by('data', 'id'), repeticoes)
+                raise Desfazer
+        except Desfazer:
+            pass
+
+    def criar_registros(self, linhas):
+        aleatorio = random.Random(42)
+        veterinarios = MedicoVeterinario.objects.bulk_create(
+            MedicoVeterinario(nome=f'Veterinário {i}', crmv=f'B{i}', especialidade='Clínica geral', contato='1')
+            for i in range(20))
+        donos = Cliente.objects.bulk_create(
+            Cliente(nome=f'Cliente {i}', cpf=f'{i:011d}', telefone='1', email=f'c{i}@exemplo.com',
+                    endereco='Rua')
+            for i in range(linhas // 2 + 1))
+        animais = Animal.objects.bulk_create(
+            Animal(nome=f'Pet {i}', especie=aleatorio.choice('CGO'), raca='SRD',
+                   idade=aleatorio.randint(1, 15), peso=Decimal(aleatorio.randint(100, 4000)) / 100,
+                   dono=donos[i // 2])
+            for i in range(linhas))
+        inicio = make_aware(datetime(2031, 1, 1, 8))
+        Consulta.objects.bulk_create(
+            Consulta(animal=animais[i], veterinario=veterinarios[i % len(veterinarios)],
+                     data=inicio + timedelta(hours=i), motivo='Rotina',
+                     status=aleatorio.choice(Consulta.StatusConsulta.values))
+            for i in range(linhas))
+
+    def medir(self, funcao, queryset, repeticoes):
+        melhor, saida = None, None
+        for _ in range(repeticoes):
+            inicio = time.perf_counter()
+            saida = funcao(queryset.all())
+            duracao = time.perf_counter() - inicio
+            melhor = duracao if melhor is None else min(melhor, duracao)
+        return melhor, saida
+
+    def comparar(self, titulo, serializer, rapido, queryset, repeticoes):
+        total = queryset.count()
+        tempo_serializer, json_serializer = self.medir(serializer, queryset, repeticoes)
+        tempo_rapido, json_rapido = self.medir(rapido, queryset, repeticoes)
+        if json_serializer != json_rapido:
+            raise CommandError(f'{titulo}: a leitura rápida gerou um JSON diferente do serializer.')
+
+        self.stdout.write(
+            f'{titulo} ({total} linhas, {len(json_rapido) / 1024:.0f} KB): '
+            f'serializer {tempo_serializer * 1000:.0f} ms ({total / tempo_serializer:.0f} linhas/s), '
+            f'rápida {tempo_rapido * 1000:.0f} ms ({total / tempo_rapido:.0f} linhas/s) -> '
+            + self.style.SUCCESS(f'{tempo_serializer / tempo_rapido:.1f}x'))
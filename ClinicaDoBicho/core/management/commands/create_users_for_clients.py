@@ -1,43 +1,124 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
 from django.core.management.base import BaseCommand
+from django.contrib.auth.hashers import make_password
 from django.contrib.auth.models import User
-from core.models import Cliente 
+from django.db import connections, transaction
+from django.utils import timezone
+from core.models import Cliente
+from core.signals import gravados_em_lote
+
+
+def _iniciar_processo():
+    # Necessário quando o sistema cria os processos com "spawn" (macOS/Windows)
+    import django
+    django.setup()
+
+
+def gerar_username(cliente, usados):
+    """
+    Username a partir do e-mail (ou do nome). Se já existir, acrescenta um
+    número (maria, maria2, maria3...). Como os clientes são processados em
+    ordem de id, o resultado é sempre o mesmo para a mesma base.
+    """
+    if cliente.email:
+        base = cliente.email.split('@')[0]
+    else:
+        base = cliente.nome
+    # Mesma normalização (NFKC) de User.objects.create_user
+    base = User.normalize_username(base)[:140]
+
+    username = base
+    sufixo = 1
+    while username in usados:
+        sufixo += 1
+        username = f'{base}{sufixo}'
+    usados.add(username)
+    return username
+
 
 class Command(BaseCommand):
     help = 'Cria usuários para clientes que não possuem um usuário associado'
 
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=500,
+                            help='Quantidade de clientes gravados por transação (padrão: 500)')
+        parser.add_argument('--processos', type=int, default=os.cpu_count() or 1,
+                            help='Processos usados para gerar os hashes das senhas (1 = sem paralelismo)')
+
     def handle(self, *args, **options):
-        
+        lote = options['lote']
+        processos = options['processos']
+
         # Obter todos os clientes sem usuário associado
         clientes_sem_usuario = Cliente.objects.filter(usuario__isnull=True)
-        
-        if not clientes_sem_usuario.exists():
+        total = clientes_sem_usuario.count()
+
+        if not total:
             self.stdout.write(self.style.SUCCESS('Todos os clientes já possuem usuários associados.'))
             return
-        
+
+        self.stdout.write(f'{total} clientes sem usuário (lotes de {lote}, {processos} processo(s)).')
+
+        usados = set(User.objects.values_list('username', flat=True))
+
+        executor = None
+        if processos > 1:
+            # Os processos filhos não usam o banco; não devem herdar conexões abertas
+            connections.close_all()
+            executor = ProcessPoolExecutor(max_workers=processos, initializer=_iniciar_processo)
+
         contador = 0
-        
-        for cliente in clientes_sem_usuario:
-            
-            if cliente.email: 
-                username = cliente.email.split('@')[0] if cliente.email else None
-            else:
-                username = cliente.nome 
-            
-            senha = cliente.nome[:2] + '123123@' # Exemplo Jo123123@
-            
-            # Criar usuário
-            user = User.objects.create_user(
-                username=username,
-                email=cliente.email,
-                password=senha,
-                first_name=cliente.nome
-            ) 
-
-            # Associar usuário ao cliente
-            cliente.usuario = user
-            cliente.save()
-            
-            contador += 1
-            self.stdout.write(self.style.SUCCESS(f'Usuário criado para {cliente.nome}'))
-        
+        ultimo_id = 0
+        try:
+            while True:
+                # Percorre por id (keyset): cada lote já gravado sai do filtro, então
+                # o comando pode ser interrompido e executado de novo a qualquer momento.
+                clientes = list(clientes_sem_usuario.filter(id__gt=ultimo_id).order_by('id')[:lote])
+                if not clientes:
+                    break
+                ultimo_id = clientes[-1].id
+
+                senhas = [cliente.nome[:2] + '123123@' for cliente in clientes]  # Exemplo Jo123123@
+                if executor:
+                    hashes = list(executor.map(make_password, senhas,
+                                               chunksize=max(1, len(senhas) // (processos * 4))))
+                else:
+                    hashes = [make_password(senha) for senha in senhas]
+
+                usuarios = [
+                    User(
+                        username=gerar_username(cliente, usados),
+                        email=User.objects.normalize_email(cliente.email),
+                        password=senha_hash,
+                        first_name=cliente.nome,
+                    )
+                    for cliente, senha_hash in zip(clientes, hashes)
+                ]
+
+                with transaction.atomic():
+                    User.objects.bulk_create(usuarios)
+
+                    # Bancos que não devolvem os ids no bulk_create
+                    if usuarios[0].pk is None:
+                        ids = dict(User.objects.filter(
+                            username__in=[u.username for u in usuarios]).values_list('username', 'id'))
+                        for usuario in usuarios:
+                            usuario.pk = ids[usuario.username]
+
+                    # Associar usuário ao cliente (bulk_update não aplica auto_now)
+                    agora = timezone.now()
+                    for cliente, usuario in zip(clientes, usuarios):
+                        cliente.usuario = usuario
+                        cliente.updated_at = agora
+                    Cliente.objects.bulk_update(clientes, ['usuario', 'updated_at'])
+                    gravados_em_lote(clientes)
+
+                contador += len(clientes)
+                self.stdout.write(f'{contador}/{total} usuários criados (último cliente: {ultimo_id})')
+        finally:
+            if executor:
+                executor.shutdown()
+
         self.stdout.write(self.style.SUCCESS(f'Total de {contador} usuários criados com sucesso!'))
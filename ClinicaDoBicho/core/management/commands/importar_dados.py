@@ -0,0 +1,54 @@
+import io
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core import importacao
+
+
+class Command(BaseCommand):
+    help = ('Importa clientes, veterinários, animais ou consultas de um arquivo CSV ou JSONL, '
+            'atualizando os já cadastrados (ver core/importacao.py para as colunas). '
+            'Importe na ordem: veterinarios, clientes, animais, consultas. '
+            'Ex.: python manage.py importar_dados clientes clientes.csv')
+
+    def add_arguments(self, parser):
+        parser.add_argument('tipo', choices=sorted(importacao.IMPORTADORES))
+        parser.add_argument('arquivo', help="Caminho do arquivo ('-' lê da entrada padrão)")
+        parser.add_argument('--formato', choices=['csv', 'jsonl'],
+                            help='Formato do arquivo (padrão: pela extensão)')
+        parser.add_argument('--lote', type=int, default=importacao.TAMANHO_LOTE,
+                            help=f'Linhas gravadas por transação (padrão: {importacao.TAMANHO_LOTE})')
+        parser.add_argument('--encoding', default='utf-8-sig', help='Codificação do arquivo (padrão: utf-8-sig)')
+
+    def handle(self, *args, **options):
+        formato = options['formato'] or importacao.formato_do_arquivo(options['arquivo'])
+        if formato is None:
+            raise CommandError('Não foi possível saber o formato pela extensão: use --formato.')
+
+        if options['arquivo'] == '-':
+            arquivo = io.TextIOWrapper(sys.stdin.buffer, encoding=options['encoding'], newline='')
+        else:
+            try:
+                arquivo = open(options['arquivo'], encoding=options['encoding'], newline='')
+            except OSError as e:
+                raise CommandError(f'Não foi possível abrir o arquivo: {e}')
+
+        inicio = time.perf_counter()
+        with arquivo:
+            try:
+                resumo = importacao.importar(options['tipo'], importacao.ler_linhas(arquivo, formato),
+                                             options['lote'], ao_errar=self.relatar_erro)
+            except UnicodeDecodeError as e:
+                # Os lotes anteriores já foram gravados; importar de novo não duplica
+                raise CommandError(f'Arquivo não está em {options["encoding"]} ({e}): use --encoding.')
+        duracao = time.perf_counter() - inicio
+
+        mensagem = (f'{resumo["gravadas"]} de {resumo["linhas"]} linhas gravadas em {duracao:.1f} s '
+                    f'({resumo["linhas"] / duracao:.0f} linhas/s), {resumo["erros"]} com erro.')
+        self.stdout.write(self.style.SUCCESS(mensagem) if not resumo['erros'] else self.style.WARNING(mensagem))
+
+    def relatar_erro(self, numero, erros):
+        detalhes = '; '.join(f'{campo}: {" ".join(mensagens)}' for campo, mensagens in erros.items())
+        self.stderr.write(f'linha {numero}: {detalhes}')
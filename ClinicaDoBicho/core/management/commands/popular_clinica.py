@@ -0,0 +1,151 @@
+import random
+import time
+from collections import Counter
+from datetime import date, datetime, time as hora, timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils.timezone import get_current_timezone, make_aware, now
+
+from core import busca, cache, estatisticas
+from core.models import Animal, Cliente, Consulta, MedicoVeterinario
+from core.signals import gravados_em_lote
+
+NOMES = ['Ana', 'Bruno', 'Carla', 'Diego', 'Elisa', 'Fábio', 'Gabriela', 'Heitor', 'Isabela', 'João',
+         'Karina', 'Lucas', 'Mariana', 'Nicolas', 'Olívia', 'Paulo', 'Renata', 'Sérgio', 'Tatiane', 'Vitor']
+SOBRENOMES = ['Silva', 'Souza', 'Oliveira', 'Santos', 'Lima', 'Pereira', 'Costa', 'Almeida', 'Ferreira',
+              'Rodrigues', 'Gomes', 'Martins', 'Araújo', 'Barbosa', 'Ribeiro']
+PETS = ['Rex', 'Mel', 'Thor', 'Luna', 'Bob', 'Nina', 'Max', 'Lola', 'Fred', 'Amora', 'Toby', 'Pipoca']
+RACAS = {'C': ['SRD', 'Labrador', 'Poodle', 'Shih Tzu', 'Bulldog'], 'G': ['SRD', 'Siamês', 'Persa'],
+         'O': ['Calopsita', 'Coelho', 'Hamster']}
+ESPECIALIDADES = ['Clínica geral', 'Dermatologia', 'Cardiologia', 'Ortopedia', 'Oftalmologia']
+MOTIVOS = ['Rotina', 'Vacinação', 'Retorno', 'Exames', 'Emergência', 'Castração']
+
+# Grade da jornada padrão (core/agenda.py): seg-sex, 8h-12h e 13h-17h
+HORAS = [8, 9, 10, 11, 13, 14, 15, 16]
+
+
+class Command(BaseCommand):
+    help = ('Preenche um banco vazio com uma clínica sintética para os benchmarks, '
+            'com bulk_create e semente fixa (os mesmos dados a cada execução). '
+            'Ex.: DB_NAME=/tmp/bench.sqlite3 python manage.py migrate && '
+            'DB_NAME=/tmp/bench.sqlite3 python manage.py popular_clinica')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clientes', type=int, default=50000, help='padrão: 50000')
+        parser.add_argument('--animais', type=int, default=120000, help='padrão: 120000')
+        parser.add_argument('--consultas', type=int, default=1000000, help='padrão: 1000000')
+        parser.add_argument('--veterinarios', type=int, default=50, help='padrão: 50')
+        parser.add_argument('--semente', type=int, default=42, help='Semente do gerador aleatório (padrão: 42)')
+        parser.add_argument('--inicio', type=date.fromisoformat, default=date(2024, 1, 1),
+                            help='Segunda-feira da primeira semana de consultas (padrão: 2024-01-01)')
+        parser.add_argument('--lote', type=int, default=5000, help='Linhas por bulk_create (padrão: 5000)')
+
+    def handle(self, *args, **options):
+        if Cliente.objects.exists() or MedicoVeterinario.objects.exists():
+            raise CommandError('O banco já tem dados: use um banco vazio (DB_NAME=... python manage.py migrate).')
+        if min(options['clientes'], options['animais'], options['veterinarios']) < 1:
+            raise CommandError('São necessários ao menos um cliente, um animal e um veterinário.')
+        if options['inicio'].weekday() != 0:
+            raise CommandError('--inicio deve ser uma segunda-feira.')
+
+        self.aleatorio = random.Random(options['semente'])
+        self.lote = options['lote']
+        with transaction.atomic():
+            self.veterinarios = self.popular('veterinários', options['veterinarios'], self.veterinario,
+                                             indexar=True)
+            self.clientes = self.popular('clientes', options['clientes'], self.cliente, indexar=True)
+            self.animais = self.popular('animais', options['animais'], self.animal, indexar=True)
+            self.popular_consultas(options['consultas'], options['inicio'])
+
+    def popular(self, nome, quantidade, criar, indexar=False):
+        """
+        Grava ``quantidade`` objetos de ``criar(i)`` em lotes e devolve os ids.
+        """
+        comeco = time.perf_counter()
+        ids = []
+        for inicio in range(0, quantidade, self.lote):
+            objetos = [criar(i) for i in range(inicio, min(inicio + self.lote, quantidade))]
+            objetos = type(objetos[0]).objects.bulk_create(objetos)
+            # bulk_create não dispara os signals: índice de busca e cache
+            if indexar:
+                busca.indexar(*objetos)
+            gravados_em_lote(objetos)
+            ids.extend(objeto.pk for objeto in objetos)
+        self.stdout.write(f'{quantidade} {nome} em {time.perf_counter() - comeco:.1f} s')
+        return ids
+
+    def nome(self):
+        return f'{self.aleatorio.choice(NOMES)} {self.aleatorio.choice(SOBRENOMES)}'
+
+    def veterinario(self, i):
+        return MedicoVeterinario(nome=f'Dr(a). {self.nome()}', crmv=f'{10000 + i}',
+                                 especialidade=self.aleatorio.choice(ESPECIALIDADES),
+                                 contato=f'11 9{i:08d}')
+
+    def cliente(self, i):
+        cpf = f'{i + 1:011d}'
+        # bulk_create não passa pelo save(), que preenche o cpf_digitos
+        return Cliente(nome=self.nome(), cpf=cpf, cpf_digitos=cpf, telefone=f'11 9{i:08d}',
+                       email=f'cliente{i}@exemplo.com', endereco=f'Rua {self.aleatorio.randint(1, 999)}')
+
+    def animal(self, i):
+        especie = self.aleatorio.choice('CGO')
+        # Os primeiros animais cobrem todos os clientes; os demais são sorteados
+        dono_id = self.clientes[i] if i < len(self.clientes) else self.aleatorio.choice(self.clientes)
+        return Animal(nome=self.aleatorio.choice(PETS), especie=especie,
+                      raca=self.aleatorio.choice(RACAS[especie]), idade=self.aleatorio.randint(1, 18),
+                      peso=Decimal(self.aleatorio.randint(50, 6000)) / 100, dono_id=dono_id)
+
+    def popular_consultas(self, quantidade, inicio):
+        """
+        As consultas vão direto para um ``executemany``: com um milhão de
+        linhas, o ``bulk_create`` gasta a maior parte do tempo convertendo
+        cada valor campo a campo (~10x mais lento).
+        """
+        comeco = time.perf_counter()
+        campos = ['animal', 'veterinario', 'data', 'motivo', 'observacoes', 'status', 'created_at', 'updated_at']
+        colunas = ', '.join(connection.ops.quote_name(Consulta._meta.get_field(campo).column) for campo in campos)
+        sql = (f'INSERT INTO {connection.ops.quote_name(Consulta._meta.db_table)} ({colunas}) '
+               f'VALUES ({", ".join(["%s"] * len(campos))})')
+
+        self.inicio = inicio
+        self.slots_por_veterinario = -(-quantidade // len(self.veterinarios))
+        self.agora = connection.ops.adapt_datetimefield_value(now())
+        self.datas = {}  # slot -> (data já no formato do banco, dia) (repete para cada veterinário)
+        self.contagens = Counter()  # (veterinário, dia, status) -> consultas, para a ConsultasPorDia
+        with connection.cursor() as cursor:
+            for primeira in range(0, quantidade, self.lote):
+                cursor.executemany(sql, [self.consulta(i) for i in range(primeira, min(primeira + self.lote, quantidade))])
+
+        # O que os signals fariam para as consultas gravadas
+        cache.invalidar('api:consultas', *[f'agenda:{veterinario}' for veterinario in self.veterinarios])
+        estatisticas.invalidar_resumo()
+        estatisticas.registrar(self.contagens)
+        self.stdout.write(f'{quantidade} consultas em {time.perf_counter() - comeco:.1f} s')
+
+    def data_do_slot(self, slot):
+        if slot not in self.datas:
+            semana, resto = divmod(slot, 5 * len(HORAS))
+            dia, indice_hora = divmod(resto, len(HORAS))
+            data = make_aware(datetime.combine(self.inicio + timedelta(weeks=semana, days=dia),
+                                               hora(HORAS[indice_hora])), get_current_timezone())
+            self.datas[slot] = connection.ops.adapt_datetimefield_value(data), data.date()
+        return self.datas[slot]
+
+    def consulta(self, i):
+        # Cada veterinário recebe os slots da grade em ordem, sem conflitos;
+        # a primeira metade da agenda já aconteceu, a segunda está agendada.
+        veterinario = self.veterinarios[i % len(self.veterinarios)]
+        slot = i // len(self.veterinarios)
+        if self.aleatorio.random() < 0.1:
+            status = Consulta.StatusConsulta.CANCELADA
+        elif slot < self.slots_por_veterinario // 2:
+            status = Consulta.StatusConsulta.CONCLUIDA
+        else:
+            status = Consulta.StatusConsulta.AGENDADA
+        data, dia = self.data_do_slot(slot)
+        self.contagens[veterinario, dia, status.value] += 1
+        return (self.aleatorio.choice(self.animais), veterinario, data,
+                self.aleatorio.choice(MOTIVOS), '', status.value, self.agora, self.agora)
@@ -0,0 +1,45 @@
+import time
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core import estatisticas
+
+
+class Command(BaseCommand):
+    help = ('Confere a contagem diária de consultas (ConsultasPorDia, usada pelas séries dos dashboards) '
+            'com a tabela de consultas e corrige as divergências, como as deixadas por alterações que '
+            'não passam pelos signals (.update(), SQL direto). '
+            'Ex.: python manage.py reconstruir_estatisticas --inicio 2024-01-01')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--inicio', type=date.fromisoformat, help='Primeiro dia (AAAA-MM-DD; padrão: todos)')
+        parser.add_argument('--fim', type=date.fromisoformat, help='Último dia (AAAA-MM-DD; padrão: todos)')
+        parser.add_argument('--verificar', action='store_true',
+                            help='Só lista as divergências, sem corrigir (termina com erro se houver alguma)')
+        parser.add_argument('--mostrar', type=int, default=20,
+                            help='Divergências listadas na saída (padrão: 20)')
+
+    def handle(self, *args, **options):
+        inicio, fim = options['inicio'], options['fim']
+        if inicio and fim and fim < inicio:
+            raise CommandError('--fim deve ser igual ou posterior a --inicio.')
+
+        comeco = time.perf_counter()
+        if options['verificar']:
+            encontradas = estatisticas.divergencias(inicio, fim)
+        else:
+            encontradas = estatisticas.reconstruir(inicio, fim)
+        duracao = time.perf_counter() - comeco
+
+        for (veterinario_id, dia, status), (gravada, real) in sorted(encontradas.items())[:options['mostrar']]:
+            self.stdout.write(f'{dia:%d/%m/%Y} veterinário {veterinario_id} {status}: {gravada} -> {real}')
+        if len(encontradas) > options['mostrar']:
+            self.stdout.write(f'... e mais {len(encontradas) - options["mostrar"]}')
+
+        if not encontradas:
+            self.stdout.write(self.style.SUCCESS(f'Nenhuma divergência ({duracao:.1f} s).'))
+        elif options['verificar']:
+            raise CommandError(f'{len(encontradas)} divergência(s) encontrada(s).')
+        else:
+            self.stdout.write(self.style.WARNING(f'{len(encontradas)} divergência(s) corrigida(s) em {duracao:.1f} s.'))
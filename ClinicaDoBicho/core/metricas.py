@@ -0,0 +1,261 @@
+"""
+Métricas de desempenho por requisição.
+
+``MetricasMiddleware`` mede, em cada requisição, a quantidade e o tempo das
+consultas SQL, o tempo de renderização de templates e o de serialização
+(serializers e renderer JSON da API). Os números vão:
+
+- para o cabeçalho ``Server-Timing`` da resposta (aba Network do navegador);
+- para histogramas de latência por nome de rota (``lista_consultas``,
+  ``consulta-list``...), expostos em formato Prometheus em ``/metrics``.
+
+Consultas mais lentas que ``METRICAS_CONSULTA_LENTA`` segundos são logadas
+com o nome da rota. Os agregados são deste processo (cada worker tem os
+seus, como as estatísticas de ``core/cache.py``).
+"""
+import logging
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.template.backends.django import DjangoTemplates, Template
+
+logger = logging.getLogger(__name__)
+
+PREFIXO = 'clinicadobicho'
+# Limites dos buckets do histograma de latência (segundos)
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+ROTA_DESCONHECIDA = 'desconhecida'
+
+_atual = ContextVar('medicao', default=None)
+_rotas = {}
+_trava = threading.Lock()
+
+
+def limite_consulta_lenta():
+    return getattr(settings, 'METRICAS_CONSULTA_LENTA', 0.1)
+
+
+class Medicao:
+    """
+    Números de uma requisição. As views assíncronas fazem as consultas em
+    outra thread, mas o ContextVar acompanha o ``sync_to_async``.
+    """
+
+    def __init__(self):
+        self.rota = ROTA_DESCONHECIDA
+        self.consultas = 0
+        self.tempos = defaultdict(float)  # 'sql', 'template', 'serializacao'
+        self._abertas = defaultdict(int)
+
+
+@contextmanager
+def medir(nome):
+    """
+    Soma o tempo do bloco em ``nome`` na requisição atual. Blocos aninhados
+    do mesmo nome (serializers dentro de serializers) contam uma vez só.
+    """
+    medicao = _atual.get()
+    if medicao is None or medicao._abertas[nome]:
+        yield
+        return
+    medicao._abertas[nome] += 1
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        medicao.tempos[nome] += time.perf_counter() - inicio
+        medicao._abertas[nome] -= 1
+
+
+def _medir_sql(execute, sql, params, many, context):
+    medicao = _atual.get()
+    if medicao is None:
+        return execute(sql, params, many, context)
+    inicio = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        duracao = time.perf_counter() - inicio
+        medicao.consultas += 1
+        medicao.tempos['sql'] += duracao
+        if duracao >= limite_consulta_lenta():
+            logger.warning('Consulta lenta (%.0f ms) em %s: %s', duracao * 1000, medicao.rota, sql)
+
+
+@receiver(connection_created)
+def instalar_medidor(sender, connection, **kwargs):
+    # O signal dispara de novo a cada reconexão do mesmo DatabaseWrapper
+    if _medir_sql not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_medir_sql)
+
+
+class TemplatesMedidos(DjangoTemplates):
+    """
+    Backend de templates do Django que mede o tempo de ``render`` (ver TEMPLATES).
+    """
+
+    def from_string(self, template_code):
+        return TemplateMedido(super().from_string(template_code).template, self)
+
+    def get_template(self, template_name):
+        return TemplateMedido(super().get_template(template_name).template, self)
+
+
+class TemplateMedido(Template):
+
+    def render(self, context=None, request=None):
+        with medir('template'):
+            return super().render(context, request)
+
+
+class Rota:
+    """
+    Agregados de uma rota: histograma de latência e totais das partes.
+    """
+
+    def __init__(self):
+        self.buckets = [0] * len(BUCKETS)
+        self.total = 0
+        self.soma = 0.0
+        self.consultas = 0
+        self.tempos = defaultdict(float)
+        self.respostas = defaultdict(int)  # status -> quantidade
+
+    def registrar(self, duracao, medicao, status):
+        for indice, limite in enumerate(BUCKETS):
+            if duracao <= limite:
+                self.buckets[indice] += 1
+        self.total += 1
+        self.soma += duracao
+        self.consultas += medicao.consultas
+        for nome, tempo in medicao.tempos.items():
+            self.tempos[nome] += tempo
+        self.respostas[status] += 1
+
+
+def _registrar(medicao, duracao, status):
+    with _trava:
+        if medicao.rota not in _rotas:
+            _rotas[medicao.rota] = Rota()
+        _rotas[medicao.rota].registrar(duracao, medicao, status)
+
+
+def zerar():
+    with _trava:
+        _rotas.clear()
+
+
+def _server_timing(medicao, duracao):
+    partes = [f'sql;dur={medicao.tempos["sql"] * 1000:.1f};desc="{medicao.consultas} consultas"']
+    for nome, rotulo in (('template', 'tpl'), ('serializacao', 'ser')):
+        if nome in medicao.tempos:
+            partes.append(f'{rotulo};dur={medicao.tempos[nome] * 1000:.1f}')
+    partes.append(f'total;dur={duracao * 1000:.1f}')
+    return ', '.join(partes)
+
+
+class MetricasMiddleware:
+    """
+    Mede a requisição inteira (deve ser o primeiro da lista MIDDLEWARE).
+    Nas respostas em fluxo (SSE, eventos do calendário) o tempo vai até o
+    início da resposta.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def _iniciar(self):
+        medicao = Medicao()
+        return medicao, _atual.set(medicao), time.perf_counter()
+
+    def _concluir(self, request, resposta, medicao, token, inicio):
+        _atual.reset(token)
+        duracao = time.perf_counter() - inicio
+        resposta['Server-Timing'] = _server_timing(medicao, duracao)
+        _registrar(medicao, duracao, resposta.status_code)
+        return resposta
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        medicao, token, inicio = self._iniciar()
+        resposta = self.get_response(request)
+        return self._concluir(request, resposta, medicao, token, inicio)
+
+    async def __acall__(self, request):
+        medicao, token, inicio = self._iniciar()
+        resposta = await self.get_response(request)
+        return self._concluir(request, resposta, medicao, token, inicio)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        # A rota já é conhecida antes da view (para o log de consultas lentas)
+        medicao = _atual.get()
+        if medicao is not None and request.resolver_match.url_name:
+            medicao.rota = request.resolver_match.url_name
+
+
+def _rotulos(**rotulos):
+    texto = ','.join('{}="{}"'.format(nome, str(valor).replace('\\', '\\\\').replace('"', '\\"'))
+                     for nome, valor in rotulos.items())
+    return '{' + texto + '}'
+
+
+def prometheus():
+    """
+    Métricas no formato texto do Prometheus (versão 0.0.4).
+    """
+    from . import cache, notificacoes
+
+    linhas = []
+
+    def metrica(nome, tipo, ajuda):
+        linhas.append(f'# HELP {PREFIXO}_{nome} {ajuda}')
+        linhas.append(f'# TYPE {PREFIXO}_{nome} {tipo}')
+
+    with _trava:
+        rotas = sorted(_rotas.items())
+
+        metrica('requisicao_segundos', 'histogram', 'Duração das requisições por rota.')
+        for nome, rota in rotas:
+            for limite, quantidade in zip(BUCKETS, rota.buckets):
+                linhas.append(f'{PREFIXO}_requisicao_segundos_bucket{_rotulos(rota=nome, le=limite)} {quantidade}')
+            linhas.append(f'{PREFIXO}_requisicao_segundos_bucket{_rotulos(rota=nome, le="+Inf")} {rota.total}')
+            linhas.append(f'{PREFIXO}_requisicao_segundos_sum{_rotulos(rota=nome)} {rota.soma:.6f}')
+            linhas.append(f'{PREFIXO}_requisicao_segundos_count{_rotulos(rota=nome)} {rota.total}')
+
+        metrica('respostas_total', 'counter', 'Respostas por rota e status HTTP.')
+        for nome, rota in rotas:
+            for status, quantidade in sorted(rota.respostas.items()):
+                linhas.append(f'{PREFIXO}_respostas_total{_rotulos(rota=nome, status=status)} {quantidade}')
+
+        metrica('sql_consultas_total', 'counter', 'Consultas SQL feitas pelas requisições de cada rota.')
+        for nome, rota in rotas:
+            linhas.append(f'{PREFIXO}_sql_consultas_total{_rotulos(rota=nome)} {rota.consultas}')
+
+        for parte, ajuda in (('sql', 'nas consultas SQL'), ('template', 'renderizando templates'),
+                             ('serializacao', 'serializando as respostas')):
+            metrica(f'{parte}_segundos_total', 'counter', f'Tempo gasto {ajuda}, por rota.')
+            for nome, rota in rotas:
+                linhas.append(f'{PREFIXO}_{parte}_segundos_total{_rotulos(rota=nome)} {rota.tempos[parte]:.6f}')
+
+    metrica('cache_total', 'counter', 'Leituras do cache por escopo e resultado.')
+    for escopo, contadores in cache.estatisticas().items():
+        for resultado in ('acertos', 'falhas'):
+            linhas.append(f'{PREFIXO}_cache_total{_rotulos(escopo=escopo, resultado=resultado)} '
+                          f'{contadores[resultado]}')
+
+    metrica('avisos_conexoes', 'gauge', 'Conexões SSE de avisos abertas.')
+    linhas.append(f'{PREFIXO}_avisos_conexoes {notificacoes.broker().conexoes()}')
+
+    return '\n'.join(linhas) + '\n'
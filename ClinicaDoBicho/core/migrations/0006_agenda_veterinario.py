@@ -0,0 +1,53 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:02
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_consulta_created_at_consulta_status_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='JornadaVeterinario',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dia_semana', models.PositiveSmallIntegerField(choices=[(0, 'Segunda-feira'), (1, 'Terça-feira'), (2, 'Quarta-feira'), (3, 'Quinta-feira'), (4, 'Sexta-feira'), (5, 'Sábado'), (6, 'Domingo')])),
+                ('inicio', models.TimeField()),
+                ('fim', models.TimeField()),
+                ('veterinario', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='jornadas', to='core.medicoveterinario')),
+            ],
+            options={
+                'ordering': ['veterinario', 'dia_semana', 'inicio'],
+            },
+        ),
+        migrations.CreateModel(
+            name='PausaVeterinario',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dia_semana', models.PositiveSmallIntegerField(choices=[(0, 'Segunda-feira'), (1, 'Terça-feira'), (2, 'Quarta-feira'), (3, 'Quinta-feira'), (4, 'Sexta-feira'), (5, 'Sábado'), (6, 'Domingo')])),
+                ('inicio', models.TimeField()),
+                ('fim', models.TimeField()),
+                ('veterinario', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='pausas', to='core.medicoveterinario')),
+            ],
+            options={
+                'ordering': ['veterinario', 'dia_semana', 'inicio'],
+            },
+        ),
+        migrations.CreateModel(
+            name='Folga',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('data', models.DateField()),
+                ('motivo', models.CharField(blank=True, max_length=100)),
+                ('veterinario', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='folgas', to='core.medicoveterinario')),
+            ],
+            options={
+                'ordering': ['data'],
+                'indexes': [models.Index(fields=['data', 'veterinario'], name='core_folga_data_8466e2_idx')],
+            },
+        ),
+    ]
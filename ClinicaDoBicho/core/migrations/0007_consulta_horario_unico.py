@@ -0,0 +1,49 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:03
+
+from django.core.management.base import CommandError
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def verificar_horario_repetido(apps, schema_editor):
+    """
+    Antes da constraint, dois agendamentos simultâneos podiam gravar o mesmo
+    horário; com eles no banco a constraint falharia com um IntegrityError.
+    Aqui a migração para antes, listando as consultas a remarcar ou cancelar
+    antes de rodar o migrate de novo.
+    """
+    Consulta = apps.get_model('core', 'Consulta')
+    repetidos = (Consulta.objects.filter(status='Agendada', veterinario__isnull=False)
+                 .values('veterinario_id', 'data').annotate(total=Count('id')).filter(total__gt=1)
+                 .order_by('veterinario_id', 'data'))
+    if not repetidos:
+        return
+    linhas = [
+        f"  veterinário {horario['veterinario_id']}, {horario['data'].isoformat()}: consultas "
+        + ', '.join(str(consulta_id) for consulta_id in Consulta.objects.filter(
+            status='Agendada', veterinario_id=horario['veterinario_id'], data=horario['data'])
+            .order_by('id').values_list('id', flat=True))
+        for horario in repetidos
+    ]
+    raise CommandError(
+        'Cada veterinário passa a ter uma consulta agendada por horário, mas há horários '
+        'com mais de uma. Remarque ou cancele as repetidas e rode o migrate de novo:\n' + '\n'.join(linhas))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_agenda_veterinario'),
+    ]
+
+    operations = [
+        migrations.RunPython(verificar_horario_repetido, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='consulta',
+            index=models.Index(fields=['veterinario', 'data'], name='consulta_vet_data_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='consulta',
+            constraint=models.UniqueConstraint(condition=models.Q(('status', 'Agendada')), fields=('veterinario', 'data'), name='consulta_horario_unico', violation_error_message='Já existe uma consulta agendada neste horário para este veterinário.'),
+        ),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:13
+
+import re
+
+from django.db import migrations, models
+
+
+def preencher_cpf_digitos(apps, schema_editor):
+    """
+    Preenche cpf_digitos dos clientes existentes. Se dois clientes tiverem o
+    mesmo CPF, só o mais antigo recebe o valor (a coluna é única) e os outros
+    são listados na saída da migração para serem conferidos; enquanto o CPF
+    não mudar, eles continuam sem o valor (ver Cliente.digitos_para_gravar).
+    """
+    Cliente = apps.get_model('core', 'Cliente')
+    vistos = {}
+    repetidos = []
+    lote = []
+    for cliente in Cliente.objects.exclude(cpf__isnull=True).exclude(cpf='').order_by('id').only('id', 'cpf').iterator(chunk_size=2000):
+        digitos = re.sub(r'\D', '', cliente.cpf)[:11]
+        if not digitos:
+            continue
+        if digitos in vistos:
+            repetidos.append((cliente.id, vistos[digitos]))
+            continue
+        vistos[digitos] = cliente.id
+        cliente.cpf_digitos = digitos
+        lote.append(cliente)
+        if len(lote) == 2000:
+            Cliente.objects.bulk_update(lote, ['cpf_digitos'])
+            lote = []
+    if lote:
+        Cliente.objects.bulk_update(lote, ['cpf_digitos'])
+
+    if repetidos:
+        print(f'\n  {len(repetidos)} cliente(s) com CPF repetido ficaram sem cpf_digitos:')
+        for cliente_id, original_id in repetidos:
+            print(f'    cliente {cliente_id} repete o CPF do cliente {original_id}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_consulta_data_id_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cliente',
+            name='cpf_digitos',
+            field=models.CharField(blank=True, editable=False, max_length=11, null=True),
+        ),
+        migrations.RunPython(preencher_cpf_digitos, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='cliente',
+            name='cpf_digitos',
+            field=models.CharField(blank=True, editable=False, max_length=11, null=True, unique=True),
+        ),
+    ]
@@ -0,0 +1,51 @@
+from django.db import migrations
+
+
+def criar_indice(apps, schema_editor):
+    """
+    Cria a tabela FTS5 (só no SQLite) e indexa os registros existentes.
+    """
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+
+    def linhas(modelo, codigo, campos, documento):
+        for objeto in apps.get_model('core', modelo).objects.values_list('id', *campos).iterator(chunk_size=2000):
+            yield (objeto[0] * 4 + codigo, *documento(*objeto[1:]))
+
+    documentos = [
+        linhas('Cliente', 1, ['nome', 'email', 'telefone'],
+               lambda nome, email, telefone: (nome, f"{nome} {email} {telefone}", email, None)),
+        linhas('Animal', 2, ['nome', 'raca', 'dono_id'],
+               lambda nome, raca, dono_id: (nome, f"{nome} {raca}", raca, dono_id)),
+        linhas('MedicoVeterinario', 3, ['nome', 'crmv', 'especialidade'],
+               lambda nome, crmv, especialidade: (nome, f"{nome} {crmv} {especialidade}", especialidade, None)),
+    ]
+
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS core_busca USING fts5("
+            "titulo, conteudo, detalhe UNINDEXED, referencia_id UNINDEXED, "
+            "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+        )
+        # O gerador vai direto para o executemany: as linhas são lidas em
+        # blocos pelo iterator(), sem carregar a tabela inteira na memória
+        for linhas_modelo in documentos:
+            cursor.executemany(
+                "INSERT INTO core_busca (rowid, titulo, conteudo, detalhe, referencia_id) "
+                "VALUES (%s, %s, %s, %s, %s)", linhas_modelo)
+
+
+def remover_indice(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute("DROP TABLE IF EXISTS core_busca")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_cliente_cpf_digitos'),
+    ]
+
+    operations = [
+        migrations.RunPython(criar_indice, remover_indice),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:18
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_updated_at'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Remocao',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('modelo', models.CharField(max_length=30)),
+                ('objeto_id', models.IntegerField()),
+                ('usuario_id', models.IntegerField(blank=True, null=True)),
+                ('removido_em', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='animal',
+            index=models.Index(fields=['updated_at'], name='animal_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='cliente',
+            index=models.Index(fields=['updated_at'], name='cliente_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='consulta',
+            index=models.Index(fields=['updated_at'], name='consulta_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='remocao',
+            index=models.Index(fields=['modelo', 'removido_em'], name='remocao_modelo_data_idx'),
+        ),
+    ]
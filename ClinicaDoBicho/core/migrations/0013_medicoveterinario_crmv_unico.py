@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:45
+
+from django.core.management.base import CommandError
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def verificar_crmv_repetido(apps, schema_editor):
+    """
+    O índice único falharia no meio da série de migrações se já houver CRMVs
+    repetidos; aqui a migração para antes, listando os veterinários a corrigir
+    (pelo admin ou pela tela de veterinários) antes de rodar o migrate de novo.
+    """
+    MedicoVeterinario = apps.get_model('core', 'MedicoVeterinario')
+    repetidos = (MedicoVeterinario.objects.values('crmv').annotate(total=Count('id'))
+                 .filter(total__gt=1).order_by('crmv').values_list('crmv', flat=True))
+    if not repetidos:
+        return
+    linhas = [
+        f"  CRMV {crmv!r}: veterinários "
+        + ', '.join(str(vet_id) for vet_id in MedicoVeterinario.objects.filter(crmv=crmv)
+                    .order_by('id').values_list('id', flat=True))
+        for crmv in repetidos
+    ]
+    raise CommandError(
+        'O CRMV passa a ser único, mas há veterinários com o mesmo CRMV. '
+        'Corrija (ou remova) os repetidos e rode o migrate de novo:\n' + '\n'.join(linhas))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_sincronizacao'),
+    ]
+
+    operations = [
+        migrations.RunPython(verificar_crmv_repetido, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='medicoveterinario',
+            name='crmv',
+            field=models.CharField(max_length=20, unique=True),
+        ),
+    ]
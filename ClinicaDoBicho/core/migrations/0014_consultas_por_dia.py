@@ -0,0 +1,47 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:09
+
+from django.db import migrations, models
+from django.db.models import Count
+from django.db.models.functions import TruncDate
+
+
+def preencher_consultas_por_dia(apps, schema_editor):
+    """
+    Conta as consultas existentes; daqui em diante os signals mantêm a tabela.
+    """
+    Consulta = apps.get_model('core', 'Consulta')
+    ConsultasPorDia = apps.get_model('core', 'ConsultasPorDia')
+    linhas = (
+        Consulta.objects.annotate(dia=TruncDate('data'))
+        .values('veterinario_id', 'dia', 'status')
+        .annotate(quantidade=Count('id'))
+        .order_by()
+    )
+    ConsultasPorDia.objects.bulk_create(
+        (ConsultasPorDia(veterinario_id=linha['veterinario_id'] or 0, dia=linha['dia'], status=linha['status'],
+                         quantidade=linha['quantidade']) for linha in linhas.iterator(chunk_size=2000)),
+        batch_size=2000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_medicoveterinario_crmv_unico'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ConsultasPorDia',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('veterinario_id', models.IntegerField()),
+                ('dia', models.DateField()),
+                ('status', models.CharField(choices=[('Agendada', 'Agendada'), ('Concluida', 'Concluida'), ('Cancelada', 'Cancelada')], max_length=15)),
+                ('quantidade', models.IntegerField(default=0)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('dia', 'veterinario_id', 'status'), name='consultas_por_dia_unica')],
+            },
+        ),
+        migrations.RunPython(preencher_consultas_por_dia, migrations.RunPython.noop),
+    ]
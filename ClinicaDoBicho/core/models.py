@@ -1,8 +1,44 @@
-from django.db import models
+import re
+from datetime import time
+
+from django.db import IntegrityError, models, transaction
 from django.core.exceptions import ValidationError 
 from django.contrib.auth.models import User
 from django.utils.timezone import localtime
 
+def normalizar_cpf(cpf):
+    """
+    Mantém só os dígitos do CPF ('123.456.789-00' -> '12345678900').
+    """
+    return re.sub(r'\D', '', cpf or '')
+
+
+class ClienteQuerySet(models.QuerySet):
+
+    def com_cpf(self, cpf):
+        """
+        Busca exata pelo CPF, aceitando o número com ou sem pontuação.
+        """
+        digitos = normalizar_cpf(cpf)
+        if not digitos:
+            # filter(cpf_digitos=None) viraria IS NULL: todos os clientes sem CPF
+            return self.none()
+        return self.filter(cpf_digitos=digitos)
+
+    def cpf_comeca_com(self, prefixo):
+        """
+        Busca por prefixo do CPF (digitação em andamento). Usa um intervalo
+        ``prefixo <= cpf_digitos < prefixo + ':'`` (':' vem logo depois de '9'
+        na tabela ASCII), que é resolvido pelo índice único em qualquer banco.
+        """
+        digitos = normalizar_cpf(prefixo)
+        if not digitos:
+            return self.none()
+        if len(digitos) >= 11:
+            return self.filter(cpf_digitos=digitos)
+        return self.filter(cpf_digitos__gte=digitos, cpf_digitos__lt=digitos + ':')
+
+
 # Tabela de clientes
 class Cliente(models.Model):
     usuario = models.OneToOneField(User, 
@@ -10,9 +46,52 @@ class Cliente(models.Model):
                                    related_name='cliente', null=True)
     nome = models.CharField(max_length=100)
     cpf = models.CharField(max_length=11, blank=True, null=True)
+    # CPF só com dígitos, preenchido no save(); usado nas buscas
+    cpf_digitos = models.CharField(max_length=11, unique=True, null=True, blank=True, editable=False)
     telefone = models.CharField(max_length=15)
     email = models.EmailField()
     endereco = models.TextField()
+    updated_at = models.DateTimeField(auto_now=True) # Data de atualização
+
+    objects = ClienteQuerySet.as_manager()
+
+    class Meta:
+        indexes = [models.Index(fields=['updated_at'], name='cliente_updated_idx')]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        cliente = super().from_db(db, field_names, values)
+        # CPF como está no banco, para digitos_para_gravar()
+        if 'cpf' in cliente.__dict__ and 'cpf_digitos' in cliente.__dict__:
+            cliente._cpf_gravado = (cliente.cpf, cliente.cpf_digitos)
+        return cliente
+
+    def digitos_para_gravar(self):
+        """
+        Valor de cpf_digitos para o CPF atual. O cliente que ficou sem ele na
+        migração 0009 por repetir o CPF de um cliente mais antigo continua sem
+        ele (a coluna é única) enquanto o CPF não mudar e o outro existir; as
+        buscas por CPF encontram o mais antigo.
+        """
+        digitos = normalizar_cpf(self.cpf) or None
+        cpf, cpf_digitos = getattr(self, '_cpf_gravado', (None, None))
+        if (digitos and cpf_digitos is None and normalizar_cpf(cpf) == digitos
+                and Cliente.objects.filter(cpf_digitos=digitos).exclude(pk=self.pk).exists()):
+            return None
+        return digitos
+
+    def clean(self):
+        self.cpf_digitos = self.digitos_para_gravar()
+        if self.cpf_digitos and Cliente.objects.filter(
+                cpf_digitos=self.cpf_digitos).exclude(pk=self.pk).exists():
+            raise ValidationError({'cpf': 'Já existe um cliente com este CPF.'})
+
+    def save(self, *args, **kwargs):
+        self.cpf_digitos = self.digitos_para_gravar()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'cpf' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'cpf_digitos'}
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return self.nome
@@ -30,6 +109,10 @@ class Animal(models.Model):
     idade = models.PositiveIntegerField(null=True, blank=True)
     peso = models.DecimalField(max_digits=5, decimal_places=2, null=True, blank=True)
     dono = models.ForeignKey(Cliente, on_delete=models.CASCADE, related_name='animais')
+    updated_at = models.DateTimeField(auto_now=True) # Data de atualização
+
+    class Meta:
+        indexes = [models.Index(fields=['updated_at'], name='animal_updated_idx')]
 
     def __str__(self):
         return f"{self.nome} ({self.especie})" 
@@ -42,13 +125,99 @@ class Animal(models.Model):
 class MedicoVeterinario(models.Model):
     # nome da especie
     nome = models.CharField(max_length=100)
-    crmv = models.CharField(max_length=20)
+    crmv = models.CharField(max_length=20, unique=True)
     especialidade = models.CharField(max_length=100)
     contato = models.CharField(max_length=15)
+    updated_at = models.DateTimeField(auto_now=True) # Data de atualização
 
     def __str__(self):
         return self.nome
+
+
+DIAS_SEMANA = [
+    (0, 'Segunda-feira'),
+    (1, 'Terça-feira'),
+    (2, 'Quarta-feira'),
+    (3, 'Quinta-feira'),
+    (4, 'Sexta-feira'),
+    (5, 'Sábado'),
+    (6, 'Domingo'),
+]
+
+# Jornada de trabalho do veterinário (pode haver mais de um turno por dia)
+class JornadaVeterinario(models.Model):
+    veterinario = models.ForeignKey(MedicoVeterinario, on_delete=models.CASCADE, related_name='jornadas')
+    dia_semana = models.PositiveSmallIntegerField(choices=DIAS_SEMANA)
+    inicio = models.TimeField()
+    fim = models.TimeField()
+
+    class Meta:
+        ordering = ['veterinario', 'dia_semana', 'inicio']
+
+    def clean(self):
+        # fim às 00:00 é o fim do dia (ver agenda.mascara_intervalos)
+        if self.fim != time(0) and self.inicio >= self.fim:
+            raise ValidationError('O início da jornada deve ser anterior ao fim.')
+
+    def __str__(self):
+        return f"{self.veterinario} - {self.get_dia_semana_display()} {self.inicio:%H:%M}-{self.fim:%H:%M}"
+
+# Pausas fixas dentro da jornada (almoço, reuniões, etc.)
+class PausaVeterinario(models.Model):
+    veterinario = models.ForeignKey(MedicoVeterinario, on_delete=models.CASCADE, related_name='pausas')
+    dia_semana = models.PositiveSmallIntegerField(choices=DIAS_SEMANA)
+    inicio = models.TimeField()
+    fim = models.TimeField()
+
+    class Meta:
+        ordering = ['veterinario', 'dia_semana', 'inicio']
+
+    def clean(self):
+        if self.fim != time(0) and self.inicio >= self.fim:
+            raise ValidationError('O início da pausa deve ser anterior ao fim.')
+
+    def __str__(self):
+        return f"{self.veterinario} - pausa {self.get_dia_semana_display()} {self.inicio:%H:%M}-{self.fim:%H:%M}"
+
+# Folgas e feriados (sem veterinário = feriado para toda a clínica)
+class Folga(models.Model):
+    veterinario = models.ForeignKey(MedicoVeterinario, on_delete=models.CASCADE,
+                                    related_name='folgas', null=True, blank=True)
+    data = models.DateField()
+    motivo = models.CharField(max_length=100, blank=True)
+
+    class Meta:
+        ordering = ['data']
+        indexes = [models.Index(fields=['data', 'veterinario'])]
+
+    def __str__(self):
+        quem = self.veterinario.nome if self.veterinario else 'Clínica'
+        return f"{quem} - {self.data:%d/%m/%Y} {self.motivo}".strip()
  
+CONSTRAINT_HORARIO_UNICO = 'consulta_horario_unico'
+MENSAGEM_HORARIO_OCUPADO = 'Já existe uma consulta agendada neste horário para este veterinário.'
+
+
+def horario_ocupado(erro):
+    """
+    Indica se um IntegrityError veio da constraint de horário único da consulta
+    (SQLite informa as colunas, PostgreSQL informa o nome da constraint).
+    """
+    mensagem = str(erro)
+    return (CONSTRAINT_HORARIO_UNICO in mensagem
+            or 'core_consulta.veterinario_id, core_consulta.data' in mensagem)
+
+class ConsultaQuerySet(models.QuerySet):
+
+    def visiveis_para(self, usuario):
+        """
+        A equipe vê todas as consultas; o cliente, só as dos seus animais.
+        """
+        if usuario.is_staff:
+            return self
+        return self.filter(animal__dono__usuario=usuario)
+
+
 # Agenda consulta
 class Consulta(models.Model):
 
@@ -68,16 +237,34 @@ class Consulta(models.Model):
     created_at = models.DateTimeField(auto_now_add=True) # Data de criação
     updated_at = models.DateTimeField(auto_now=True) # Data de atualização
 
+    objects = ConsultaQuerySet.as_manager()
 
-    def clean(self):
-        if Consulta.objects.filter(
-            data=self.data, veterinario=self.veterinario).exists() and self.status == 'Agendada':
-            raise ValidationError('Já existe uma consulta agendada \
-                                  para este horário com este veterinário.')
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['veterinario', 'data'], name='consulta_vet_data_idx'),
+            models.Index(fields=['data', 'id'], name='consulta_data_id_idx'),
+            models.Index(fields=['updated_at'], name='consulta_updated_idx'),
+        ]
+        constraints = [
+            # Um veterinário não pode ter duas consultas agendadas no mesmo horário.
+            # Garantido pelo banco para continuar correto com requisições simultâneas.
+            models.UniqueConstraint(
+                fields=['veterinario', 'data'],
+                condition=models.Q(status='Agendada'),
+                name=CONSTRAINT_HORARIO_UNICO,
+                violation_error_message=MENSAGEM_HORARIO_OCUPADO,
+            ),
+        ]
 
     def save(self, *args, **kwargs):
-        self.clean()
-        super().save(*args, **kwargs)
+        try:
+            with transaction.atomic():
+                super().save(*args, **kwargs)
+        except IntegrityError as e:
+            if not horario_ocupado(e):
+                raise
+            raise ValidationError(MENSAGEM_HORARIO_OCUPADO, code='horario_ocupado')
 
     def __str__(self):
         veterinario = self.veterinario.nome if self.veterinario else 'desconhecido'
@@ -87,4 +274,38 @@ class Consulta(models.Model):
         data_local = localtime(self.data)
         data_formatada = data_local.strftime('%d/%m/%Y às %H:%M')
         
-        return f"Consulta de {self.animal.nome} com {veterinario} em {data_formatada}"
\ No newline at end of file
+        return f"Consulta de {self.animal.nome} com {veterinario} em {data_formatada}"
+
+
+# Quantidade de consultas por veterinário, dia e status, mantida pelos signals
+# da consulta (core/estatisticas.py); as séries dos dashboards leem daqui.
+class ConsultasPorDia(models.Model):
+    # 0 = consultas sem veterinário (NULL não entraria na chave única)
+    veterinario_id = models.IntegerField()
+    dia = models.DateField()  # no fuso local
+    status = models.CharField(max_length=15, choices=Consulta.StatusConsulta.choices)
+    quantidade = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            # Também é o índice das séries, que filtram por intervalo de dias
+            models.UniqueConstraint(fields=['dia', 'veterinario_id', 'status'], name='consultas_por_dia_unica'),
+        ]
+
+    def __str__(self):
+        return f"{self.dia:%d/%m/%Y} - veterinário {self.veterinario_id} - {self.status}: {self.quantidade}"
+
+
+# Registro das exclusões, para a sincronização incremental do aplicativo
+class Remocao(models.Model):
+    modelo = models.CharField(max_length=30)  # 'consulta', 'animal', 'cliente'
+    objeto_id = models.IntegerField()
+    # Usuário dono do objeto removido (os clientes só recebem as próprias remoções)
+    usuario_id = models.IntegerField(null=True, blank=True)
+    removido_em = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['modelo', 'removido_em'], name='remocao_modelo_data_idx')]
+
+    def __str__(self):
+        return f"{self.modelo} #{self.objeto_id} removido em {localtime(self.removido_em):%d/%m/%Y %H:%M}"
@@ -0,0 +1,286 @@
+"""
+Avisos de alteração de consultas para as telas de calendário abertas,
+entregues por Server-Sent Events (SSE) em vez de a tela recarregar a agenda
+a cada poucos segundos.
+
+Os signals de ``Consulta`` (core/signals.py) publicam, depois do commit, um
+aviso compacto por consulta no broker configurado em
+``settings.NOTIFICACOES['BACKEND']``:
+
+    {"tipo": "criada" | "alterada" | "cancelada" | "removida",
+     "id": 12, "veterinario": 3, "veterinario_anterior": null,
+     "status": "Agendada", "evento": {... evento do FullCalendar ...}}
+
+Cada conexão SSE aberta é uma ``Assinatura`` com a sua fila, filtrada por
+veterinário. Backends:
+
+- ``BrokerLocal``: entrega para as conexões deste processo (um worker);
+- ``BrokerRedis``: publica num canal do Redis e cada processo repassa o que
+  recebe às suas conexões (vários workers ou servidores).
+
+O fluxo fica aberto por minutos: sirva com ASGI (ClinicaDoBicho/asgi.py), em
+que cada conexão aberta não ocupa uma thread. Com WSGI o Django consumiria o
+fluxo inteiro antes de enviar o primeiro byte, prendendo o worker por
+``DURACAO_MAXIMA``; nesse caso ``resposta_sse`` responde 204, que faz o
+``EventSource`` desistir de reconectar.
+"""
+import asyncio
+import json
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.core.handlers.asgi import ASGIRequest
+from django.db import transaction
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils.module_loading import import_string
+
+from . import agenda
+from .models import Consulta
+
+logger = logging.getLogger(__name__)
+
+# Comentário enviado quando não há avisos, para proxies não fecharem a conexão (segundos)
+INTERVALO_PING = getattr(settings, 'NOTIFICACOES_PING', 15)
+# Depois disso o servidor fecha o fluxo e o navegador reconecta sozinho (segundos)
+DURACAO_MAXIMA = getattr(settings, 'NOTIFICACOES_DURACAO_MAXIMA', 300)
+# Espera do navegador antes de reconectar (milissegundos)
+RECONEXAO = 3000
+# Avisos pendentes por conexão; uma conexão lenta demais é mandada recarregar
+TAMANHO_FILA = 100
+
+CRIADA = 'criada'
+ALTERADA = 'alterada'
+CANCELADA = 'cancelada'
+REMOVIDA = 'removida'
+
+
+class Assinatura:
+    """
+    Uma conexão SSE: a fila (do loop de eventos da conexão) e os filtros.
+    """
+
+    def __init__(self, loop, veterinario_id=None, usuario_id=None):
+        self.loop = loop
+        self.fila = asyncio.Queue(TAMANHO_FILA)
+        self.veterinario_id = veterinario_id
+        # Sem veterinário, quem não é da equipe só recebe as próprias consultas
+        self.usuario_id = usuario_id
+        self.atrasada = False
+
+    def aceita(self, aviso):
+        if self.veterinario_id is not None:
+            return self.veterinario_id in (aviso['veterinario'], aviso['veterinario_anterior'])
+        return self.usuario_id is None or aviso['usuario'] == self.usuario_id
+
+    def _colocar(self, aviso):
+        try:
+            self.fila.put_nowait(aviso)
+        except asyncio.QueueFull:
+            self.atrasada = True
+
+    def entregar(self, aviso):
+        # Chamado de qualquer thread; a fila só é mexida no loop da conexão
+        if self.aceita(aviso):
+            try:
+                self.loop.call_soon_threadsafe(self._colocar, aviso)
+            except RuntimeError:
+                pass  # loop já encerrado: a conexão caiu
+
+
+class BrokerLocal:
+    """
+    Entrega os avisos às conexões abertas neste processo.
+    """
+
+    def __init__(self, **opcoes):
+        self._assinaturas = set()
+        self._trava = threading.Lock()
+
+    def assinar(self, assinatura):
+        with self._trava:
+            self._assinaturas.add(assinatura)
+
+    def cancelar(self, assinatura):
+        with self._trava:
+            self._assinaturas.discard(assinatura)
+
+    def conexoes(self):
+        with self._trava:
+            return len(self._assinaturas)
+
+    def interessado(self):
+        """
+        Se vale a pena montar os avisos (alguém pode recebê-los).
+        """
+        return self.conexoes() > 0
+
+    def publicar(self, avisos):
+        self.distribuir(avisos)
+
+    def distribuir(self, avisos):
+        with self._trava:
+            assinaturas = list(self._assinaturas)
+        for aviso in avisos:
+            for assinatura in assinaturas:
+                assinatura.entregar(aviso)
+
+
+class BrokerRedis(BrokerLocal):
+    """
+    Publica os avisos num canal do Redis; uma thread por processo escuta o
+    canal e distribui para as conexões locais. Opções: ``URL`` e ``CANAL``.
+    """
+
+    def __init__(self, URL='redis://127.0.0.1:6379/0', CANAL='clinicadobicho:consultas', **opcoes):
+        import redis  # dependência opcional, só deste backend
+
+        super().__init__(**opcoes)
+        self._redis = redis.Redis.from_url(URL)
+        self._canal = CANAL
+        self._ouvinte = None
+
+    def interessado(self):
+        # As conexões podem estar em outro processo
+        return True
+
+    def assinar(self, assinatura):
+        with self._trava:
+            if self._ouvinte is None:
+                self._ouvinte = threading.Thread(target=self._ouvir, name='notificacoes-redis', daemon=True)
+                self._ouvinte.start()
+        super().assinar(assinatura)
+
+    def publicar(self, avisos):
+        self._redis.publish(self._canal, json.dumps(avisos, cls=DjangoJSONEncoder))
+
+    def _ouvir(self):
+        while True:
+            try:
+                pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self._canal)
+                for mensagem in pubsub.listen():
+                    self.distribuir(json.loads(mensagem['data']))
+            except Exception:
+                logger.exception('Falha ao escutar o canal de avisos no Redis; reconectando')
+                time.sleep(1)
+
+
+_broker = None
+_trava_broker = threading.Lock()
+
+
+def broker():
+    global _broker
+    with _trava_broker:
+        if _broker is None:
+            configuracao = getattr(settings, 'NOTIFICACOES', {})
+            classe = import_string(configuracao.get('BACKEND', 'core.notificacoes.BrokerLocal'))
+            _broker = classe(**configuracao.get('OPCOES', {}))
+        return _broker
+
+
+def _avisos(alteracoes):
+    # Uma consulta só para montar os avisos de todas as consultas gravadas
+    linhas = Consulta.objects.filter(id__in=alteracoes).values_list(
+        'id', 'data', 'animal__nome', 'veterinario_id', 'veterinario__nome',
+        'status', 'animal__dono__usuario_id')
+    avisos = []
+    for consulta_id, data, animal_nome, veterinario_id, veterinario_nome, status, usuario_id in linhas:
+        tipo, veterinario_anterior = alteracoes[consulta_id]
+        if status == Consulta.StatusConsulta.CANCELADA:
+            tipo = CANCELADA
+        avisos.append({
+            'tipo': tipo,
+            'id': consulta_id,
+            'veterinario': veterinario_id,
+            'veterinario_anterior': veterinario_anterior if veterinario_anterior != veterinario_id else None,
+            'status': status,
+            'usuario': usuario_id,
+            'evento': agenda.evento_consulta(consulta_id, data, animal_nome, veterinario_id, veterinario_nome),
+        })
+    return avisos
+
+
+def _publicar(avisos):
+    if not avisos:
+        return
+    try:
+        broker().publicar(avisos)
+    except Exception:
+        # Os avisos são só uma otimização: a gravação já foi feita
+        logger.exception('Falha ao publicar avisos de consultas')
+
+
+def consultas_gravadas(consultas, criadas=False):
+    """
+    Avisa as telas depois do commit. ``criadas`` marca um lote só de inserções;
+    nos demais a tela trata "alterada" como criar-ou-atualizar.
+    """
+    if not broker().interessado():
+        return
+    alteracoes = {
+        consulta.pk: (CRIADA if criadas else ALTERADA, getattr(consulta, '_veterinario_inicial', None))
+        for consulta in consultas
+    }
+    transaction.on_commit(lambda: _publicar(_avisos(alteracoes)))
+
+
+def consulta_removida(consulta, usuario_id):
+    aviso = {
+        'tipo': REMOVIDA,
+        'id': consulta.pk,
+        'veterinario': consulta.veterinario_id,
+        'veterinario_anterior': None,
+        'status': consulta.status,
+        'usuario': usuario_id,
+        'evento': None,
+    }
+    transaction.on_commit(lambda: _publicar([aviso]))
+
+
+def _mensagem(evento, dados):
+    return f'event: {evento}\ndata: {json.dumps(dados, cls=DjangoJSONEncoder)}\n\n'
+
+
+async def fluxo(veterinario_id=None, usuario_id=None):
+    """
+    Corpo da resposta SSE. Começa com ``conectado`` (a tela recarrega a agenda
+    se for uma reconexão) e depois manda um ``consulta`` por aviso; se a
+    conexão não der conta dos avisos, manda ``recarregar``.
+    """
+    loop = asyncio.get_running_loop()
+    assinatura = Assinatura(loop, veterinario_id, usuario_id)
+    broker().assinar(assinatura)
+    limite = loop.time() + DURACAO_MAXIMA
+    try:
+        yield f'retry: {RECONEXAO}\n' + _mensagem('conectado', {})
+        while (restante := limite - loop.time()) > 0:
+            try:
+                aviso = await asyncio.wait_for(assinatura.fila.get(), min(INTERVALO_PING, restante))
+            except asyncio.TimeoutError:
+                if limite > loop.time():
+                    yield ': ping\n\n'
+                continue
+            if assinatura.atrasada:
+                while not assinatura.fila.empty():
+                    assinatura.fila.get_nowait()
+                assinatura.atrasada = False
+                yield _mensagem('recarregar', {})
+                continue
+            aviso = {campo: valor for campo, valor in aviso.items() if campo != 'usuario'}
+            yield _mensagem('consulta', aviso)
+    finally:
+        broker().cancelar(assinatura)
+
+
+def resposta_sse(request, veterinario_id=None, usuario_id=None):
+    if not isinstance(request, ASGIRequest):
+        return HttpResponse(status=204)
+    resposta = StreamingHttpResponse(fluxo(veterinario_id, usuario_id), content_type='text/event-stream')
+    resposta['Cache-Control'] = 'no-cache'
+    # nginx: não acumular a resposta no buffer do proxy
+    resposta['X-Accel-Buffering'] = 'no'
+    return resposta
@@ -0,0 +1,117 @@
+"""
+Agendamento de séries de consultas (vacinas em doses, retornos de cirurgia):
+a cada N dias ou semanas, K ocorrências, com a opção de pular fins de semana.
+
+A série inteira é conferida de uma vez com a agenda do veterinário
+(``agenda.compilar_agendas``: uma consulta por intervalo de datas para as
+consultas já marcadas, mais jornadas, pausas e folgas) e gravada com um único
+``bulk_create``. Se alguma ocorrência não couber, nada é gravado e cada
+conflito vem com sugestões de horários livres.
+"""
+from datetime import datetime, timedelta
+from itertools import islice
+
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, transaction
+from django.utils.timezone import get_current_timezone, localtime, make_aware, now
+
+from . import agenda
+from .models import MENSAGEM_HORARIO_OCUPADO, Consulta, horario_ocupado
+from .signals import consultas_gravadas_em_lote
+
+UNIDADES = {'dias': 1, 'semanas': 7}
+MAXIMO_OCORRENCIAS = 52
+DURACAO_MAXIMA = timedelta(days=366)  # da primeira à última ocorrência
+
+# Sugestões por conflito, procuradas até uma semana depois da última ocorrência
+SUGESTOES = 3
+JANELA_SUGESTOES = timedelta(days=7)
+
+
+def datas_da_serie(primeira, intervalo, unidade, ocorrencias, pular_fim_de_semana=True):
+    """
+    Datas das ``ocorrencias`` consultas, mantendo o horário local da
+    primeira. Com ``pular_fim_de_semana``, a ocorrência que cair no sábado ou
+    domingo passa para a segunda-feira seguinte (e, se já houver uma nela, é
+    descartada e a série continua até completar as ocorrências).
+    """
+    local = localtime(primeira)
+    passo = timedelta(days=intervalo * UNIDADES[unidade])
+    tz = get_current_timezone()
+    dias = []
+    dia = local.date()
+    while len(dias) < ocorrencias:
+        escolhido = dia
+        if pular_fim_de_semana and escolhido.weekday() >= 5:
+            escolhido += timedelta(days=7 - escolhido.weekday())
+        if not dias or escolhido > dias[-1]:
+            dias.append(escolhido)
+        dia += passo
+    # make_aware em cada dia: o horário local se mantém se o fuso mudar no meio
+    return [make_aware(datetime.combine(dia, local.time()), tz) for dia in dias]
+
+
+def validar_serie(datas):
+    if datas[-1] - datas[0] > DURACAO_MAXIMA:
+        raise ValidationError(f'A série deve caber em {DURACAO_MAXIMA.days} dias.')
+
+
+def conflitos(veterinario_id, datas):
+    """
+    Lista de {ocorrencia, data, erro, sugestoes} das datas que não cabem na
+    agenda do veterinário (horário ocupado ou fora da jornada). As sugestões
+    são os próximos horários livres a partir da data pedida, fora os já
+    tomados pelas outras ocorrências da série.
+    """
+    fim = datas[-1] + JANELA_SUGESTOES
+    agenda_veterinario = agenda.compilar_agendas([veterinario_id], datas[0], fim)[veterinario_id]
+    recusadas = []
+    for indice, data in enumerate(datas):
+        erro = agenda_veterinario.situacao(data)
+        if erro:
+            recusadas.append((indice, data, erro))
+        else:
+            agenda_veterinario.reservar(data)
+    return [
+        {
+            'ocorrencia': indice + 1,
+            'data': localtime(data),
+            'erro': erro,
+            'sugestoes': [
+                localtime(slot) for slot, _livre in islice(
+                    agenda_veterinario.slots(max(data, now()), fim, somente_livres=True), SUGESTOES)
+            ],
+        }
+        for indice, data, erro in recusadas
+    ]
+
+
+def agendar_serie(modelo, intervalo, unidade, ocorrencias, pular_fim_de_semana=True):
+    """
+    Agenda a série a partir de ``modelo`` (uma Consulta não gravada, com a
+    data da primeira ocorrência). Devolve (consultas criadas, conflitos); com
+    algum conflito nada é gravado. Levanta ValidationError se a série for
+    longa demais ou se outro agendamento ocupar um dos horários durante a
+    gravação.
+    """
+    datas = datas_da_serie(modelo.data, intervalo, unidade, ocorrencias, pular_fim_de_semana)
+    validar_serie(datas)
+    recusadas = conflitos(modelo.veterinario_id, datas)
+    if recusadas:
+        return [], recusadas
+
+    consultas = [
+        Consulta(animal_id=modelo.animal_id, veterinario_id=modelo.veterinario_id, data=data,
+                 motivo=modelo.motivo, observacoes=modelo.observacoes)
+        for data in datas
+    ]
+    try:
+        with transaction.atomic():
+            consultas = Consulta.objects.bulk_create(consultas)
+    except IntegrityError as e:
+        # Outro agendamento entre a conferência e o INSERT
+        if not horario_ocupado(e):
+            raise
+        raise ValidationError(MENSAGEM_HORARIO_OCUPADO, code='horario_ocupado')
+    consultas_gravadas_em_lote(consultas)
+    return consultas, []
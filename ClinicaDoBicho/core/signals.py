@@ -0,0 +1,187 @@
+from django.db.models.signals import post_delete, post_init, post_save, pre_delete, pre_save
+from django.contrib.auth.models import User
+from django.dispatch import receiver
+
+from .models import (Animal, Cliente, Consulta, Folga, JornadaVeterinario, MedicoVeterinario,
+                     PausaVeterinario, Remocao)
+from . import busca, cache, estatisticas, notificacoes
+
+# Escopos do cache (core/cache.py) afetados por cada modelo. As listas da
+# API mostram os relacionamentos aninhados, então a consulta depende de todos.
+ESCOPOS_DO_MODELO = {
+    MedicoVeterinario: ("veterinarios", "api:veterinarios", "api:consultas"),
+    Cliente: ("api:clientes", "api:animais", "api:consultas"),
+    # O nome do animal aparece nos eventos do calendário
+    Animal: ("api:animais", "api:consultas", "agenda"),
+    Consulta: ("api:consultas",),
+}
+
+
+def dono_da_consulta(consulta):
+    """
+    Id do usuário dono do animal da consulta (ou None se o cliente não tiver usuário).
+    """
+    return (
+        Cliente.objects.filter(animais__id=consulta.animal_id)
+        .values_list("usuario_id", flat=True)
+        .first()
+    )
+
+
+@receiver(post_save, sender=Consulta)
+@receiver(post_delete, sender=Consulta)
+def consulta_alterada(sender, instance, **kwargs):
+    estatisticas.invalidar_resumo(dono_da_consulta(instance))
+
+
+@receiver(post_save, sender=Consulta)
+def avisar_telas(sender, instance, created, **kwargs):
+    notificacoes.consultas_gravadas([instance], criadas=created)
+
+
+@receiver(post_delete, sender=Consulta)
+def avisar_remocao(sender, instance, **kwargs):
+    if notificacoes.broker().interessado():
+        notificacoes.consulta_removida(instance, dono_da_consulta(instance))
+
+
+@receiver(post_init, sender=Consulta)
+def guardar_veterinario_inicial(sender, instance, **kwargs):
+    # Se a consulta mudar de veterinário, a agenda antiga também muda
+    instance._veterinario_inicial = instance.__dict__.get("veterinario_id")
+    # Para as contagens por dia: o que está no banco (None = consulta nova)
+    instance._estatistica_inicial = (
+        None if instance.pk is None else estatisticas.estado_da_consulta(instance))
+
+
+@receiver(pre_save, sender=Consulta)
+@receiver(pre_delete, sender=Consulta)
+def ler_estado_no_banco(sender, instance, **kwargs):
+    # Campos adiados, ou objeto montado com pk em vez de lido do banco
+    if instance.pk is not None and (
+            instance._state.adding or instance._estatistica_inicial is estatisticas.DESCONHECIDO):
+        instance._estatistica_inicial = estatisticas.estados_no_banco([instance.pk]).get(instance.pk)
+
+
+@receiver(post_save, sender=Consulta)
+def contar_consulta_gravada(sender, instance, created, **kwargs):
+    anterior = None if created else instance._estatistica_inicial
+    atual = estatisticas.estado_da_consulta(instance)
+    if atual is estatisticas.DESCONHECIDO:
+        # save(update_fields=...) de um objeto com campos adiados
+        atual = estatisticas.estados_no_banco([instance.pk])[instance.pk]
+    estatisticas.registrar(estatisticas.variacoes([(anterior, atual)]))
+    instance._estatistica_inicial = atual
+
+
+@receiver(post_delete, sender=Consulta)
+def contar_consulta_removida(sender, instance, **kwargs):
+    estatisticas.registrar(estatisticas.variacoes([(instance._estatistica_inicial, None)]))
+
+
+@receiver(post_delete, sender=MedicoVeterinario)
+def mover_contagens_do_veterinario(sender, instance, **kwargs):
+    estatisticas.veterinario_removido(instance.pk)
+
+
+def escopos_do_objeto(instancia):
+    escopos = set(ESCOPOS_DO_MODELO.get(type(instancia), ()))
+    if isinstance(instancia, MedicoVeterinario):
+        escopos.add(f"agenda:{instancia.pk}")
+    elif isinstance(instancia, Consulta):
+        for veterinario_id in (instancia.veterinario_id, getattr(instancia, "_veterinario_inicial", None)):
+            if veterinario_id is not None:
+                escopos.add(f"agenda:{veterinario_id}")
+    elif isinstance(instancia, (JornadaVeterinario, PausaVeterinario, Folga)):
+        # Folga sem veterinário é feriado da clínica inteira
+        escopos.add(f"agenda:{instancia.veterinario_id}" if instancia.veterinario_id else "agenda")
+    return escopos
+
+
+@receiver(post_save, sender=Cliente)
+@receiver(post_save, sender=Animal)
+@receiver(post_save, sender=MedicoVeterinario)
+@receiver(post_save, sender=Consulta)
+@receiver(post_save, sender=JornadaVeterinario)
+@receiver(post_save, sender=PausaVeterinario)
+@receiver(post_save, sender=Folga)
+@receiver(post_delete, sender=Cliente)
+@receiver(post_delete, sender=Animal)
+@receiver(post_delete, sender=MedicoVeterinario)
+@receiver(post_delete, sender=Consulta)
+@receiver(post_delete, sender=JornadaVeterinario)
+@receiver(post_delete, sender=PausaVeterinario)
+@receiver(post_delete, sender=Folga)
+def invalidar_cache(sender, instance, **kwargs):
+    cache.invalidar(*escopos_do_objeto(instance))
+
+
+@receiver(post_save, sender=User)
+def usuario_alterado(sender, instance, update_fields=None, **kwargs):
+    # A lista de clientes da API mostra o usuário; o login só grava last_login
+    if update_fields is None or set(update_fields) != {"last_login"}:
+        cache.invalidar("api:clientes")
+
+
+@receiver(post_save, sender=Cliente)
+@receiver(post_save, sender=Animal)
+@receiver(post_save, sender=MedicoVeterinario)
+def indexar_para_busca(sender, instance, **kwargs):
+    busca.indexar(instance)
+
+
+@receiver(post_delete, sender=Cliente)
+@receiver(post_delete, sender=Animal)
+@receiver(post_delete, sender=MedicoVeterinario)
+def remover_da_busca(sender, instance, **kwargs):
+    busca.remover(instance)
+
+
+def usuario_dono(instancia):
+    """
+    Id do usuário dono de um cliente, animal ou consulta.
+    """
+    if isinstance(instancia, Cliente):
+        return instancia.usuario_id
+    if isinstance(instancia, Animal):
+        return Cliente.objects.filter(pk=instancia.dono_id).values_list("usuario_id", flat=True).first()
+    return dono_da_consulta(instancia)
+
+
+@receiver(post_delete, sender=Cliente)
+@receiver(post_delete, sender=Animal)
+@receiver(post_delete, sender=Consulta)
+def registrar_remocao(sender, instance, **kwargs):
+    # Nas exclusões em cascata os filhos são removidos antes do pai,
+    # então o dono ainda existe quando este receiver roda.
+    Remocao.objects.create(
+        modelo=sender._meta.model_name,
+        objeto_id=instance.pk,
+        usuario_id=usuario_dono(instance),
+    )
+
+
+def gravados_em_lote(objetos):
+    """
+    ``bulk_create``/``bulk_update`` não disparam ``post_save``: invalida o
+    cache de uma vez para o lote inteiro.
+    """
+    escopos = set()
+    for objeto in objetos:
+        escopos |= escopos_do_objeto(objeto)
+    cache.invalidar(*escopos)
+
+
+def consultas_gravadas_em_lote(consultas):
+    """
+    Mesmo efeito dos receivers de ``Consulta`` para um lote gravado com
+    ``bulk_create``/``bulk_update``, com uma consulta só.
+    """
+    gravados_em_lote(consultas)
+    estatisticas.consultas_gravadas(consultas)
+    notificacoes.consultas_gravadas(consultas)
+    animal_ids = {consulta.animal_id for consulta in consultas}
+    usuario_ids = set(
+        Cliente.objects.filter(animais__id__in=animal_ids).values_list("usuario_id", flat=True)
+    )
+    estatisticas.invalidar_resumo(*usuario_ids)
@@ -1,3 +1,1527 @@
-from django.test import TestCase
+import csv
+import importlib
+import json
+import os
+import tempfile
+import zipfile
+from contextlib import redirect_stdout
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+from io import BytesIO, StringIO
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.apps import apps as django_apps
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.db.models import Count
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.utils.timezone import localtime, make_aware
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from api.renderers import JSONRapidoRenderer
+from api.sincronizacao import SincronizacaoMixin
+from api.serializers import AnimalSerializer, ConsultaSerializer
+
+from . import agenda, busca, cache as cache_dados, estatisticas, exportacao, importacao, metricas, notificacoes, recorrencia
+from .forms import ClienteForm, ConsultaForm
+from .models import (MENSAGEM_HORARIO_OCUPADO, Animal, Cliente, Consulta, ConsultasPorDia, Folga,
+                     JornadaVeterinario, MedicoVeterinario, PausaVeterinario)
+
+
+class TesteAPI(TestCase):
+    """
+    Cliente da API autenticado como ``cls.equipe``. O cache não participa do
+    rollback do banco entre os testes, então começa vazio em cada um.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.api = APIClient()
+        self.api.force_authenticate(self.equipe)
+
+
+class OrcamentoDeConsultasAPITest(TesteAPI):
+    """
+    Cada endpoint da API tem um número fixo de consultas ao banco, não
+    importa quantas linhas são retornadas (nas listas, uma delas é a
+    agregação que calcula o ETag). Se um novo campo aninhado for
+    adicionado a um serializer sem o JOIN correspondente na viewset
+    (``select_related_campos``), estes testes falham.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.equipe = User.objects.create_user('equipe', password='x', is_staff=True)
+        cls.usuario = User.objects.create_user('cliente', password='x')
+        cls.veterinario = MedicoVeterinario.objects.create(
+            nome='Dra. Ana', crmv='123', especialidade='Clínica geral', contato='1')
+        cls.cliente = Cliente.objects.create(
+            nome='Maria', cpf='12345678900', telefone='1', email='maria@exemplo.com',
+            endereco='Rua A', usuario=cls.usuario)
+
+
+    def criar_registros(self, quantidade):
+        inicio = make_aware(datetime(2030, 1, 7, 8))
+        for i in range(quantidade):
+            usuario = User.objects.create(username=f'dono{Cliente.objects.count()}')
+            dono = Cliente.objects.create(
+                nome=f'Dono {i}', telefone='1', email='dono@exemplo.com', endereco='Rua',
+                usuario=usuario)
+            animal = Animal.objects.create(nome=f'Pet {i}', especie='C', raca='SRD', dono=dono)
+            pet_cliente = Animal.objects.create(nome=f'Pet M{i}', especie='G', raca='SRD', dono=self.cliente)
+            Consulta.objects.create(
+                animal=animal, veterinario=self.veterinario,
+                data=inicio + timedelta(hours=Consulta.objects.count()), motivo='Rotina')
+            Consulta.objects.create(
+                animal=pet_cliente, veterinario=self.veterinario,
+                data=inicio + timedelta(hours=Consulta.objects.count()), motivo='Rotina')
+
+    def contar_consultas(self, url):
+        # Mede o custo da requisição sem o cache
+        cache.clear()
+        with CaptureQueriesContext(connection) as contexto:
+            resposta = self.api.get(url)
+        self.assertEqual(resposta.status_code, 200)
+        return len(contexto)
+
+    def assertOrcamentoConstante(self, url, orcamento):
+        self.criar_registros(1)
+        poucos = self.contar_consultas(url)
+        self.criar_registros(20)
+        muitos = self.contar_consultas(url)
+        self.assertEqual(poucos, muitos, f'{url}: consultas crescem com o número de linhas')
+        self.assertLessEqual(muitos, orcamento, f'{url}: {muitos} consultas (orçamento {orcamento})')
+
+    def test_lista_consultas(self):
+        self.assertOrcamentoConstante('/api/consultas/', 2)
+
+    def test_lista_consultas_cliente(self):
+        self.api.force_authenticate(self.usuario)
+        self.assertOrcamentoConstante('/api/consultas/', 2)
+
+    def test_lista_consultas_paginada_por_numero(self):
+        self.assertOrcamentoConstante('/api/consultas/?page=1', 3)
+
+    def test_lista_animais(self):
+        self.assertOrcamentoConstante('/api/animais/', 2)
+
+    def test_lista_animais_cliente(self):
+        self.api.force_authenticate(self.usuario)
+        self.assertOrcamentoConstante('/api/animais/', 2)
+
+    def test_lista_clientes(self):
+        self.assertOrcamentoConstante('/api/clientes/', 2)
+
+    def test_lista_veterinarios(self):
+        self.assertOrcamentoConstante('/api/veterinarios/', 2)
+
+    def test_detalhe_consulta(self):
+        self.criar_registros(1)
+        consulta = Consulta.objects.first()
+        self.assertLessEqual(self.contar_consultas(f'/api/consultas/{consulta.pk}/'), 1)
+
+    def test_detalhe_animal(self):
+        self.criar_registros(1)
+        animal = Animal.objects.first()
+        self.assertLessEqual(self.contar_consultas(f'/api/animais/{animal.pk}/'), 1)
+
+    def test_detalhe_cliente(self):
+        self.assertLessEqual(self.contar_consultas(f'/api/clientes/{self.cliente.pk}/'), 1)
+
+    def test_resumo_consultas_por_veterinario(self):
+        self.assertOrcamentoConstante('/api/consultas/resumo_consultas/?por_veterinario=1', 1)
+
+    def test_eventos_veterinario(self):
+        url = (f'/api/consultas/eventos_veterinario/?veterinario={self.veterinario.pk}'
+               '&start=2030-01-07&end=2030-01-14')
+        self.assertOrcamentoConstante(url, 4)
+
+
+class HorarioUnicoTest(TesteAPI):
+    """
+    Dois agendamentos no mesmo horário do mesmo veterinário: a constraint do
+    banco recusa o segundo, que chega ao usuário como erro de validação (400
+    na API), nunca como IntegrityError.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.equipe = User.objects.create_superuser('equipe', password='x')
+        cls.ana = MedicoVeterinario.objects.create(nome='Dra. Ana', crmv='1', especialidade='X', contato='1')
+        dono = Cliente.objects.create(nome='Maria', telefone='1', email='m@exemplo.com', endereco='Rua')
+        cls.rex = Animal.objects.create(nome='Rex', especie='C', raca='SRD', dono=dono)
+        cls.tom = Animal.objects.create(nome='Tom', especie='G', raca='SRD', dono=dono)
+        cls.data = make_aware(datetime(2030, 1, 7, 9))
+        cls.ocupada = Consulta.objects.create(animal=cls.rex, veterinario=cls.ana, data=cls.data, motivo='Rotina')
+
+    def test_save_levanta_erro_de_validacao(self):
+        with self.assertRaisesMessage(ValidationError, MENSAGEM_HORARIO_OCUPADO):
+            Consulta.objects.create(animal=self.tom, veterinario=self.ana, data=self.data, motivo='Vacina')
+        # O save() roda em um savepoint: a transação continua utilizável
+        self.assertEqual(Consulta.objects.count(), 1)
+
+    def test_cancelada_libera_o_horario(self):
+        self.ocupada.status = Consulta.StatusConsulta.CANCELADA
+        self.ocupada.save()
+        Consulta.objects.create(animal=self.tom, veterinario=self.ana, data=self.data, motivo='Vacina')
+        # Reativar a cancelada agora conflita com a nova
+        self.ocupada.status = Consulta.StatusConsulta.AGENDADA
+        with self.assertRaises(ValidationError):
+            self.ocupada.save()
+
+    def test_formulario(self):
+        self.client.force_login(self.equipe)
+        dados = {'salvar': '1', 'animal': self.tom.pk, 'veterinario': self.ana.pk, 'data': '2030-01-07T09:00',
+                 'motivo': 'Vacina'}
+        resposta = self.client.post('/agendar_consulta/', dados)
+        self.assertEqual(resposta.status_code, 200)
+        self.assertIn(MENSAGEM_HORARIO_OCUPADO, resposta.context['form'].non_field_errors())
+        self.assertEqual(Consulta.objects.count(), 1)
+
+    def test_api(self):
+        dados = {'animal': self.tom.pk, 'veterinario': self.ana.pk, 'data': self.data.isoformat(), 'motivo': 'Vacina'}
+        resposta = self.api.post('/api/consultas/', dados, format='json')
+        self.assertEqual(resposta.status_code, 400)
+        self.assertEqual(resposta.data['non_field_errors'], [MENSAGEM_HORARIO_OCUPADO])
+
+        outra = Consulta.objects.create(animal=self.tom, veterinario=self.ana, data=self.data + timedelta(hours=1),
+                                        motivo='Vacina')
+        resposta = self.api.patch(f'/api/consultas/{outra.pk}/', {'data': self.data.isoformat()}, format='json')
+        self.assertEqual(resposta.status_code, 400)
+        self.assertEqual(Consulta.objects.get(pk=outra.pk).data, outra.data)
+
+    def test_admin(self):
+        self.client.force_login(self.equipe)
+        resposta = self.client.post('/admin/core/consulta/add/', {
+            'animal': self.tom.pk, 'veterinario': self.ana.pk, 'data_0': '07/01/2030', 'data_1': '09:00',
+            'motivo': 'Vacina', 'status': 'Agendada'})
+        self.assertEqual(resposta.status_code, 200)
+        self.assertContains(resposta, MENSAGEM_HORARIO_OCUPADO)
+        self.assertEqual(Consulta.objects.count(), 1)
+
+
+class AgendaVeterinarioTest(TestCase):
+    """
+    Bitmaps da agenda (core/agenda.py): um bit por slot de 1 hora do dia.
+    """
+
+    def test_jornada_ate_meia_noite(self):
+        ana = MedicoVeterinario.objects.create(nome='Dra. Ana', crmv='1', especialidade='X', contato='1')
+        JornadaVeterinario(veterinario=ana, dia_semana=0, inicio=time(18), fim=time(0)).full_clean()
+        PausaVeterinario(veterinario=ana, dia_semana=0, inicio=time(23), fim=time(0)).full_clean()
+        with self.assertRaises(ValidationError):
+            JornadaVeterinario(veterinario=ana, dia_semana=0, inicio=time(18), fim=time(17)).full_clean()
+        self.assertEqual(agenda.mascara_intervalos([(time(18), time(0))]), 0b111111 << 18)
+        self.assertEqual(agenda.mascara_ocupacao([(time(23), time(0))]), 1 << 23)
+
+    def test_arredondamento(self):
+        # A jornada só tem os slots inteiros; a pausa tira todos os que ela toca
+        self.assertEqual(agenda.mascara_intervalos([(time(8, 30), time(12))]), 0b111 << 9)
+        self.assertEqual(agenda.mascara_intervalos([(time(8), time(11, 45))]), 0b111 << 8)
+        self.assertEqual(agenda.mascara_ocupacao([(time(12, 30), time(13, 15))]), 0b11 << 12)
+
+        ana = MedicoVeterinario.objects.create(nome='Dra. Ana', crmv='1', especialidade='X', contato='1')
+        JornadaVeterinario.objects.create(veterinario=ana, dia_semana=0, inicio=time(8), fim=time(17))
+        PausaVeterinario.objects.create(veterinario=ana, dia_semana=0, inicio=time(12, 30), fim=time(13, 15))
+        segunda = make_aware(datetime(2030, 1, 7))
+        terca = segunda + timedelta(days=1)
+        agenda_ana = agenda.compilar_agendas([ana.pk], segunda, terca)[ana.pk]
+        self.assertEqual([localtime(slot).hour for slot, _livre in agenda_ana.slots(segunda, terca)],
+                         [8, 9, 10, 11, 14, 15, 16])
+
+    def test_folgas(self):
+        ana = MedicoVeterinario.objects.create(nome='Dra. Ana', crmv='1', especialidade='X', contato='1')
+        beto = MedicoVeterinario.objects.create(nome='Dr. Beto', crmv='2', especialidade='X', contato='2')
+        segunda = make_aware(datetime(2030, 1, 7, 9))
+        Folga.objects.create(veterinario=ana, data=segunda.date())
+        Folga.objects.create(data=(segunda + timedelta(days=1)).date(), motivo='Feriado')  # a clínica toda
+        agendas = agenda.compilar_agendas([ana.pk, beto.pk], segunda, segunda + timedelta(days=3))
+
+        self.assertEqual(agendas[ana.pk].situacao(segunda), agenda.MENSAGEM_FORA_DA_JORNADA)
+        self.assertIsNone(agendas[beto.pk].situacao(segunda))
+        for agenda_veterinario in agendas.values():
+            self.assertEqual(agenda_veterinario.mascara_trabalho((segunda + timedelta(days=1)).date()), 0)
+            self.assertIsNone(agenda_veterinario.situacao(segunda + timedelta(days=2)))
+
+    def test_horario_de_verao(self):
+        # São Paulo: em 04/11/2018 o relógio pulou de 00:00 para 01:00 e em
+        # 17/02/2019 voltou de 00:00 para 23:00 do dia 16
+        agenda_veterinario = agenda.AgendaVeterinario(1, {
+            6: agenda.mascara_intervalos([(time(0), time(3))]),
+            5: agenda.mascara_intervalos([(time(22), time(0))]),
+        }, set())
+        inicio = make_aware(datetime(2018, 11, 4))
+        self.assertEqual([localtime(slot).strftime('%H:%M') for slot, _livre in
+                          agenda_veterinario.slots(inicio, inicio + timedelta(days=1))], ['01:00', '02:00'])
+
+        inicio = make_aware(datetime(2019, 2, 16))
+        slots = [slot for slot, _livre in agenda_veterinario.slots(inicio, inicio + timedelta(days=1))]
+        self.assertEqual([localtime(slot).strftime('%H:%M') for slot in slots], ['22:00', '23:00'])
+        # As duas 23:00 caem no mesmo slot do dia 16
+        segunda_vez = parse_datetime('2019-02-17T02:00:00+00:00')
+        self.assertEqual(localtime(segunda_vez).strftime('%d %H:%M'), '16 23:00')
+        agenda_veterinario.reservar(segunda_vez)
+        self.assertEqual(agenda_veterinario.situacao(slots[-1]), MENSAGEM_HORARIO_OCUPADO)
+
+
+class GradeNoAgendamentoTest(TesteAPI):
+    """
+    A consulta avulsa segue a mesma grade das séries: jornada, pausas, folgas
+    e início de slot (padrão: seg-sex, 8h-12h e 13h-17h).
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.equipe = User.objects.create_superuser('equipe', password='x')
+        cls.ana = MedicoVeterinario.objects.create(nome='Dra. Ana', crmv='1', especialidade='X', contato='1')
+        dono = Cliente.objects.create(nome='Maria', telefone='1', email='m@exemplo.com', endereco='Rua')
+        cls.rex = Animal.objects.create(nome='Rex', especie='C', raca='SRD', dono=dono)
+        Folga.objects.create(data=datetime(2030, 1, 8).date(), motivo='Feriado')
+        cls.segunda = make_aware(datetime(2030, 1, 7, 9))
+
+    def test_situacao_na_grade(self):
+        casos = [
+            (self.segunda, None),
+            (self.segunda.replace(hour=12), agenda.MENSAGEM_FORA_DA_JORNADA),    # almoço
+            (self.segunda.replace(minute=30), agenda.MENSAGEM_FORA_DA_GRADE),
+            (self.segunda + timedelta(days=1), agenda.MENSAGEM_FORA_DA_JORNADA),  # feriado
+            (self.segunda + timedelta(days=5), agenda.MENSAGEM_FORA_DA_JORNADA),  # sábado
+        ]
+        with self.assertNumQueries(3):
+            situacoes = agenda.situacoes_na_grade((self.ana.pk, data) for data, _erro in casos)
+        self.assertEqual(situacoes, [erro for _data, erro in casos])
+
+    def test_formulario(self):
+        self.client.force_login(self.equipe)
+        dados = {'salvar': '1', 'animal': self.rex.pk, 'veterinario': self.ana.pk, 'data': '2030-01-07T12:00',
+                 'motivo': 'Vacina'}
+        resposta = self.client.post('/agendar_consulta/', dados)
+        self.assertEqual(resposta.context['form'].errors['data'], [agenda.MENSAGEM_FORA_DA_JORNADA])
+        self.assertFalse(Consulta.objects.exists())
+        self.client.post('/agendar_consulta/', {**dados, 'data': '2030-01-07T09:00'})
+        self.assertTrue(Consulta.objects.exists())
+
+    def test_api(self):
+        dados = {'animal': self.rex.pk, 'veterinario': self.ana.pk, 'motivo': 'Vacina',
+                 'data': (self.segunda + timedelta(days=1)).isoformat()}
+        resposta = self.api.post('/api/consultas/', dados, format='json')
+        self.assertEqual((resposta.status_code, resposta.data['data']), (400, [agenda.MENSAGEM_FORA_DA_JORNADA]))
+        resposta = self.api.post('/api/consultas/', {**dados, 'data': self.segunda.isoformat()}, format='json')
+        self.assertEqual(resposta.status_code, 201)
+
+        consulta = Consulta.objects.get()
+        resposta = self.api.patch(f'/api/consultas/{consulta.pk}/',
+                                  {'data': self.segunda.replace(minute=30).isoformat()}, format='json')
+        self.assertEqual((resposta.status_code, resposta.data['data']), (400, [agenda.MENSAGEM_FORA_DA_GRADE]))
+        # Sem mudar o horário, a grade não é conferida
+        Folga.objects.create(veterinario=self.ana, data=self.segunda.date())
+        resposta = self.api.patch(f'/api/consultas/{consulta.pk}/', {'motivo': 'Retorno'}, format='json')
+        self.assertEqual(resposta.status_code, 200)
+
+    def test_lote(self):
+        item = {'animal': self.rex.pk, 'veterinario': self.ana.pk, 'motivo': 'Vacina'}
+        resposta = self.api.post('/api/consultas/lote/', [
+            {**item, 'data': self.segunda.isoformat()},
+            {**item, 'data': self.segunda.replace(hour=18).isoformat()},
+            {**item, 'data': self.segunda.replace(minute=15).isoformat()},
+        ], format='json')
+        self.assertEqual(resposta.status_code, 207)
+        self.assertEqual([item.get('erros', {}).get('data') for item in resposta.data],
+                         [None, [agenda.MENSAGEM_FORA_DA_JORNADA], [agenda.MENSAGEM_FORA_DA_GRADE]])
+
+
+class LoteAPITest(TesteAPI):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.equipe = User.objects.create(username='equipe', is_staff=True)
+        cls.usuario = User.objects.create(username='cliente')
+        cls.ana = MedicoVeterinario.objects.create(nome='Dra. Ana', crmv='1', especialidade='X', contato='1')
+        cls.maria = Cliente.objects.create(nome='Maria', cpf='12345678900', telefone='1', email='m@exemplo.com',
+                                           endereco='Rua', usuario=cls.usuario)
+        cls.joao = Cliente.objects.create(nome='João', telefone='1', email='j@exemplo.com', endereco='Rua')
+        cls.rex = Animal.objects.create(nome='Rex', especie='C', raca='SRD', dono=cls.maria)
+        cls.bob = Animal.objects.create(nome='Bob', especie='C', raca='SRD', dono=cls.joao)
+        cls.data = make_aware(datetime(2030, 1, 7, 9))
+        cls.ocupada = Consulta.objects.create(animal=cls.rex, veterinario=cls.ana, data=cls.data, motivo='Rotina')
+
+    def consulta(self, horas, **campos):
+        return {'animal': self.rex.pk, 'veterinario': self.ana.pk, 'motivo': 'Vacina',
+                'data': (self.data + timedelta(hours=horas)).isoformat(), **campos}
+
+    def test_sucesso_parcial_com_erros_por_item(self):
+        cliente = {'nome': 'Novo', 'telefone': '1', 'email': 'n@exemplo.com', 'endereco': 'Rua'}
+        resposta = self.api.post('/api/clientes/lote/', [
+            {**cliente, 'cpf': '11122233344'},
+            {**cliente, 'email': 'invalido'},
+            {**cliente, 'cpf': '12345678900'},         # já é da Maria
+            {**cliente, 'cpf': '11122233344'},         # repete o item 0
+            {'id': self.joao.pk, 'telefone': '2'},
+            {'id': 999999, 'telefone': '2'},
+        ], format='json')
+        self.assertEqual(resposta.status_code, 207)
+        self.assertEqual([item['status'] for item in resposta.data],
+                         ['criado', 'erro', 'erro', 'erro', 'atualizado', 'erro'])
+        self.assertIn('email', resposta.data[1]['erros'])
+        self.assertEqual(resposta.data[2]['erros'], {'cpf': ['Já existe um cliente com este CPF.']})
+        self.assertEqual(resposta.data[3]['erros'], {'cpf': ['CPF repetido no item 0 do lote.']})
+        self.assertEqual(resposta.data[5]['erros'], {'id': ['Objeto não encontrado.']})
+
+        novo = Cliente.objects.get(pk=resposta.data[0]['id'])
+        self.assertEqual(novo.cpf_digitos, '11122233344')
+        self.assertEqual(Cliente.objects.get(pk=self.joao.pk).telefone, '2')
+
+        resposta = self.api.post('/api/clientes/lote/', [{**cliente, 'email': 'invalido'}], format='json')
+        self.assertEqual(resposta.status_code, 400)
+
+    def test_conflitos_de_horario(self):
+        resposta = self.api.post('/api/consultas/lote/', [
+            self.consulta(0),                          # horário da consulta já agendada
+            self.consulta(1),
+            self.consulta(1, animal=self.bob.pk),      # repete o item 1
+            self.consulta(0, status='Cancelada'),      # cancelada não ocupa o horário
+        ], format='json')
+        self.assertEqual(resposta.status_code, 207)
+        self.assertEqual(resposta.data[0]['erros'], {'non_field_errors': [MENSAGEM_HORARIO_OCUPADO]})
+        self.assertEqual(resposta.data[2]['erros'], {'non_field_errors': ['Conflita com o item 1 do lote.']})
+        self.assertEqual([item['status'] for item in resposta.data], ['erro', 'criado', 'erro', 'criado'])
+        self.assertEqual(Consulta.objects.count(), 3)
+        self.assertEqual(estatisticas.divergencias(), {})
+
+    def test_conflito_na_gravacao_responde_409(self):
+        # Outro processo grava o horário entre a validação e o INSERT
+        with mock.patch('api.views.ConsultaViewSet.validar_lote', return_value={}):
+            resposta = self.api.post('/api/consultas/lote/', [self.consulta(2), self.consulta(0)], format='json')
+        self.assertEqual(resposta.status_code, 409)
+        self.assertEqual(resposta.data, {'detail': MENSAGEM_HORARIO_OCUPADO})
+        self.assertEqual(Consulta.objects.count(), 1)
+
+    def test_atualizacoes_com_um_select(self):
+        outra = Consulta.objects.create(animal=self.bob, veterinario=self.ana, data=self.data + timedelta(hours=1),
+                                        motivo='Rotina')
+        antes = Consulta.objects.get(pk=self.ocupada.pk).updated_at
+        with CaptureQueriesContext(connection) as capturadas:
+            resposta = self.api.post('/api/consultas/lote/', [
+                {'id': self.ocupada.pk, 'status': 'Concluida'},
+                {'id': outra.pk, 'observacoes': 'Em jejum'},
+            ], format='json')
+        self.assertEqual(resposta.status_code, 200)
+        sqls = [q['sql'] for q in capturadas]
+        self.assertEqual(len([sql for sql in sqls if sql.startswith('SELECT') and '"core_consulta"."id" IN' in sql]), 1)
+        self.assertEqual(len([sql for sql in sqls if sql.startswith('UPDATE "core_consulta"')]), 1)
+
+        ocupada = Consulta.objects.get(pk=self.ocupada.pk)
+        self.assertEqual((ocupada.status, ocupada.motivo), ('Concluida', 'Rotina'))
+        self.assertGreater(ocupada.updated_at, antes)
+        self.assertEqual(Consulta.objects.get(pk=outra.pk).observacoes, 'Em jejum')
+
+        # O cliente só atualiza as consultas dos próprios animais
+        self.api.force_authenticate(self.usuario)
+        resposta = self.api.post('/api/consultas/lote/', [{'id': outra.pk, 'observacoes': 'X'}], format='json')
+        self.assertEqual(resposta.status_code, 400)
+        self.assertEqual(resposta.data[0]['erros'], {'id': ['Objeto não encontrado.']})
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class CriarUsuariosTest(TestCase):
+
+    def setUp(self):
+        User.objects.create(username='maria')
+        for nome, email in [('Maria', 'maria@exemplo.com'), ('Maria Souza', 'maria@outro.com'),
+                            ('Maria Lima', 'ｍａｒｉａ@EXEMPLO.COM'), ('João', '')]:
+            Cliente.objects.create(nome=nome, telefone='1', email=email, endereco='Rua')
+
+    def criar(self, **opcoes):
+        call_command('create_users_for_clients', processos=1, stdout=StringIO(), **opcoes)
+
+    def test_usernames_normalizados_e_sem_repeticao(self):
+        self.criar(lote=2)
+        usuarios = dict(Cliente.objects.order_by('id').values_list('nome', 'usuario__username'))
+        self.assertEqual(usuarios, {'Maria': 'maria2', 'Maria Souza': 'maria3', 'Maria Lima': 'maria4',
+                                    'João': 'João'})
+        self.assertEqual(User.objects.get(username='maria4').email, 'ｍａｒｉａ@exemplo.com')
+        self.assertTrue(User.objects.get(username='maria2').check_password('Ma123123@'))
+
+    def test_retoma_depois_de_interrompido(self):
+        bulk_create = User.objects.bulk_create
+        lotes = []
+
+        def bulk_create_interrompido(usuarios):
+            lotes.append(usuarios)
+            if len(lotes) > 1:
+                raise RuntimeError('interrompido')
+            return bulk_create(usuarios)
+
+        with mock.patch.object(User.objects, 'bulk_create', bulk_create_interrompido):
+            with self.assertRaises(RuntimeError):
+                self.criar(lote=2)
+        # O primeiro lote ficou gravado; o segundo foi desfeito por inteiro
+        self.assertEqual(Cliente.objects.filter(usuario__isnull=True).count(), 2)
+
+        with CaptureQueriesContext(connection) as capturadas:
+            self.criar(lote=2)
+        self.assertFalse(Cliente.objects.filter(usuario__isnull=True).exists())
+        self.assertEqual(User.objects.count(), 5)
+        # Só os clientes restantes são lidos de novo
+        selects = [q['sql'] for q in capturadas if q['sql'].startswith('SELECT "core_cliente"')]
+        self.assertEqual(len(selects), 2)
+
+
+class CpfTest(TesteAPI):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.equipe = User.objects.create(username='equipe', is_staff=True)
+        cls.maria = Cliente.objects.create(nome='Maria', cpf='123.456.789-00', telefone='1',
+                                           email='m@exemplo.com', endereco='Rua')
+        Cliente.objects.create(nome='João', cpf='12399999999', telefone='1', email='j@exemplo.com', endereco='Rua')
+        Cliente.objects.create(nome='Ana', telefone='1', email='a@exemplo.com', endereco='Rua')
+
+    def test_com_cpf_e_cpf_comeca_com(self):
+        self.assertEqual(self.maria.cpf_digitos, '12345678900')
+        self.assertEqual(Cliente.objects.com_cpf('123.456.789-00').get(), self.maria)
+        self.assertEqual(Cliente.objects.com_cpf('12345678900').get(), self.maria)
+        self.assertFalse(Cliente.objects.com_cpf('').exists())
+
+        nomes = lambda prefixo: sorted(Cliente.objects.cpf_comeca_com(prefixo).values_list('nome', flat=True))
+        self.assertEqual(nomes('123'), ['João', 'Maria'])
+        self.assertEqual(nomes('123.4'), ['Maria'])
+        self.assertEqual(nomes('123.456.789-00'), ['Maria'])
+        self.assertEqual(nomes('9'), [])
+        self.assertEqual(nomes('abc'), [])
+
+    def test_cpf_repetido_no_formulario_e_na_api(self):
+        dados = {'nome': 'Outra', 'cpf': '123.456.789-00', 'telefone': '1', 'email': 'o@exemplo.com',
+                 'endereco': 'Rua'}
+        form = ClienteForm(dados)
+        self.assertFalse(form.is_valid())
+        self.assertEqual(form.errors['cpf'], ['Já existe um cliente com este CPF.'])
+        self.assertEqual(ClienteForm({**dados, 'cpf': '123'}).errors['cpf'], ['O CPF deve ter 11 dígitos.'])
+        # A edição do próprio cliente mantém o CPF
+        self.assertTrue(ClienteForm({**dados, 'cpf': '12345678900'}, instance=self.maria).is_valid())
+
+        resposta = self.api.post('/api/clientes/', {**dados, 'cpf': '12345678900'}, format='json')
+        self.assertEqual(resposta.status_code, 400)
+        self.assertEqual(resposta.data['cpf'], ['Já existe um cliente com este CPF.'])
+        resposta = self.api.patch(f'/api/clientes/{self.maria.pk}/', {'cpf': '12345678900'}, format='json')
+        self.assertEqual(resposta.status_code, 200)
+
+    def test_cpf_repetido_antes_da_migracao(self):
+        # Dois clientes com o mesmo CPF gravados antes da coluna cpf_digitos
+        antigo, novo = Cliente.objects.bulk_create([
+            Cliente(nome='Pedro', cpf='38432499324', telefone='1', email='p@exemplo.com', endereco='Rua'),
+            Cliente(nome='Pedro Filho', cpf='384.324.993-24', telefone='1', email='f@exemplo.com', endereco='Rua'),
+        ])
+        migracao = importlib.import_module('core.migrations.0009_cliente_cpf_digitos')
+        with redirect_stdout(StringIO()) as saida:
+            migracao.preencher_cpf_digitos(django_apps, None)
+        self.assertIn(f'cliente {novo.pk} repete o CPF do cliente {antigo.pk}', saida.getvalue())
+        self.assertEqual(Cliente.objects.com_cpf('38432499324').get(), antigo)
+
+        # O cliente repetido continua editável, sem ganhar o CPF do outro no índice
+        novo = Cliente.objects.get(pk=novo.pk)
+        novo.telefone = '2'
+        novo.save()
+        self.assertIsNone(Cliente.objects.get(pk=novo.pk).cpf_digitos)
+        resposta = self.api.patch(f'/api/clientes/{novo.pk}/', {'telefone': '3'}, format='json')
+        self.assertEqual(resposta.status_code, 200)
+        resposta = self.api.patch(f'/api/clientes/{novo.pk}/', {'cpf': '38432499324'}, format='json')
+        self.assertEqual(resposta.status_code, 200)
+        resposta = self.api.post('/api/clientes/lote/', [{'id': novo.pk, 'cpf': '38432499324'}], format='json')
+        self.assertEqual(resposta.status_code, 200)
+        self.client.force_login(self.equipe)
+        resposta = self.client.post(f'/clientes/{novo.pk}/edit/', {
+            'nome': 'Pedro Filho', 'cpf': '38432499324', 'telefone': '4', 'email': 'f@exemplo.com',
+            'endereco': 'Rua'})
+        self.assertEqual(resposta.status_code, 302)
+        self.assertEqual(Cliente.objects.get(pk=novo.pk).telefone, '4')
+
+        # Com outro CPF, o valor é gravado; sem o cliente mais antigo, também
+        novo.cpf = '11122233344'
+        novo.save()
+        self.assertEqual(Cliente.objects.com_cpf('11122233344').get(), novo)
+        Cliente.objects.filter(pk=novo.pk).update(cpf='38432499324', cpf_digitos=None)
+        antigo.delete()
+        Cliente.objects.get(pk=novo.pk).save()
+        self.assertEqual(Cliente.objects.com_cpf('38432499324').get(), novo)
+
+
+class BuscaTest(TesteAPI):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.equipe = User.objects.create(username='equipe', is_staff=True)
+        cls.usuario = User.objects.create(username='cliente')
+        cls.maria = Cliente.objects.create(nome='Maria Conceição', telefone='1199', email='maria@exemplo.com',
+                                           endereco='Rua')
+        cls.rex = Animal.objects.create(nome='Rex', especie='C', raca='Labrador', dono=cls.maria)
+        cls.thor = Animal.objects.create(nome='Thor', especie='C', raca='Labrador', dono=cls.maria)
+        cls.ana = MedicoVeterinario.objects.create(nome='Dra. Ana', crmv='SP-12345', especialidade='Dermatologia',
+                                                   contato='1')
+        data = make_aware(datetime(2030, 1, 7, 9))
+        for horas, animal in enumerate([cls.rex, cls.rex, cls.thor]):
+            Consulta.objects.create(animal=animal, veterinario=cls.ana, data=data + timedelta(hours=horas),
+                                    motivo='Rotina')
+
+    def encontrados(self, texto, tipos=None):
+        return [(resultado['tipo'], resultado['id']) for resultado in busca.buscar(texto, tipos)]
+
+    def test_indice_mantido_pelos_signals(self):
+        # Prefixo, sem acento e com o título acima do conteúdo
+        self.assertEqual(self.encontrados('concei'), [('cliente', self.maria.pk)])
+        self.assertEqual(self.encontrados('labr'), [('animal', self.rex.pk), ('animal', self.thor.pk)])
+        self.assertEqual(self.encontrados('dra derm'), [('veterinario', self.ana.pk)])
+        self.assertEqual(self.encontrados('"*) OR ('), [])
+
+        self.rex.nome = 'Bidu'
+        self.rex.save()
+        self.assertEqual(self.encontrados('rex'), [])
+        self.assertEqual(self.encontrados('bidu'), [('animal', self.rex.pk)])
+
+        self.thor.delete()
+        self.assertEqual(self.encontrados('thor'), [])
+
+    def test_api(self):
+        resposta = self.api.get('/api/search/', {'q': 'labrador', 'limite': -1})
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(len(resposta.data), 1)
+        self.assertEqual(resposta.data[0]['referencia_id'], self.maria.pk)
+        resposta = self.api.get('/api/search/', {'q': 'labrador', 'tipo': ['cliente', 'veterinario']})
+        self.assertEqual(resposta.data, [])
+        self.assertEqual(self.api.get('/api/search/', {'q': 'a', 'tipo': 'pet'}).status_code, 400)
+        self.assertEqual(self.api.get('/api/search/', {'q': 'a', 'limite': 'x'}).status_code, 400)
+
+        # Fora da equipe, só veterinários
+        self.api.force_authenticate(self.usuario)
+        resposta = self.api.get('/api/search/', {'q': 'maria ana'})
+        self.assertEqual(resposta.data, [])
+        resposta = self.api.get('/api/search/', {'q': 'ana'})
+        self.assertEqual([resultado['tipo'] for resultado in resposta.data], ['veterinario'])
+
+    def test_telas(self):
+        self.client.force_login(self.equipe)
+        resposta = self.client.get('/busca/', {'q': 'rex'})
+        self.assertContains(resposta, f'href="/clientes/{self.maria.pk}/edit/"')
+
+        # O filtro da lista de consultas é pelo nome do animal, não pela raça
+        resposta = self.client.get('/consultas/', {'animal': 'rex'})
+        self.assertEqual(resposta.context['consultas'].paginator.count, 2)
+        resposta = self.client.get('/consultas/', {'animal': 'Labrador'})
+        self.assertEqual(resposta.context['consultas'].paginator.count, 0)
+
+        resposta = self.client.get('/veterinarios/', {'q': '2345'})
+        self.assertEqual(list(resposta.context['veterinarios']), [self.ana])
+
+
+class RespostaCondicionalAPITest(TesteAPI):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.equipe = User.objects.create(username='equipe', is_staff=True)
+        cls.veterinario = MedicoVeterinario.objects.create(
+            nome='Dra. Ana', crmv='123', especialidade='Clínica geral', contato='1')
+
+
+    def test_lista_sem_alteracao_responde_304(self):
+        resposta = self.api.get('/api/veterinarios/')
+        self.assertEqual(resposta.status_code, 200)
+        with CaptureQueriesContext(connection) as contexto:
+            resposta = self.api.get('/api/veterinarios/', HTTP_IF_NONE_MATCH=resposta['ETag'])
+        self.assertEqual(resposta.status_code, 304)
+        self.assertEqual(len(contexto), 1)
+
+    def test_lista_muda_etag_quando_linha_e_alterada(self):
+        etag = self.api.get('/api/veterinarios/')['ETag']
+        self.veterinario.contato = '2'
+        self.veterinario.save()
+        resposta = self.api.get('/api/veterinarios/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resposta.status_code, 200)
+        self.assertNotEqual(resposta['ETag'], etag)
+
+    def test_lista_muda_etag_quando_linha_e_removida(self):
+        MedicoVeterinario.objects.create(nome='Dr. Beto', crmv='456', especialidade='X', contato='1')
+        etag = self.api.get('/api/veterinarios/')['ETag']
+        MedicoVeterinario.objects.filter(crmv='456').delete()
+        self.assertEqual(self.api.get('/api/veterinarios/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_detalhe_if_modified_since(self):
+        url = f'/api/veterinarios/{self.veterinario.pk}/'
+        resposta = self.api.get(url)
+        self.assertIn('Last-Modified', resposta)
+        resposta = self.api.get(url, HTTP_IF_MODIFIED_SINCE=resposta['Last-Modified'])
+        self.assertEqual(resposta.status_code, 304)
+
+    def test_etag_depende_do_usuario(self):
+        etag = self.api.get('/api/veterinarios/')['ETag']
+        self.api.force_authenticate(User.objects.create(username='outro'))
+        self.assertEqual(self.api.get('/api/veterinarios/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class SincronizacaoAPITest(TesteAPI):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.equipe = User.objects.create(username='equipe', is_staff=True)
+        cls.usuario = User.objects.create(username='cliente')
+        cls.cliente = Cliente.objects.create(
+            nome='Maria', telefone='1', email='maria@exemplo.com', endereco='Rua A', usuario=cls.usuario)
+        cls.animal = Animal.objects.create(nome='Rex', especie='C', raca='SRD', dono=cls.cliente)
+
+
+    def test_carga_inicial_traz_marca(self):
+        resposta = self.api.get('/api/animais/')
+        self.assertEqual(resposta.status_code, 200)
+        self.assertIn('X-Sync-Marca', resposta)
+
+    @mock.patch.object(SincronizacaoMixin, 'sincronizacao_margem', timedelta(0))
+    def test_since_traz_apenas_alterados_e_removidos(self):
+        marca = self.api.get('/api/animais/')['X-Sync-Marca']
+        removido = Animal.objects.create(nome='Tom', especie='G', raca='SRD', dono=self.cliente)
+        marca = self.api.get('/api/animais/', {'since': marca}).data['marca']
+
+        self.animal.peso = 10
+        self.animal.save()
+        removido_id = removido.pk
+        removido.delete()
+
+        dados = self.api.get('/api/animais/', {'since': marca}).data
+        self.assertEqual([animal['id'] for animal in dados['alterados']], [self.animal.pk])
+        self.assertEqual(dados['removidos'], [removido_id])
+
+        dados = self.api.get('/api/animais/', {'since': dados['marca']}).data
+        self.assertEqual((dados['alterados'], dados['removidos']), ([], []))
+
+    def test_remocoes_em_cascata(self):
+        marca = self.api.get('/api/clientes/')['X-Sync-Marca']
+        animal_id = self.animal.pk
+        self.cliente.delete()
+        self.assertEqual(self.api.get('/api/animais/', {'since': marca}).data['removidos'], [animal_id])
+
+    def test_cliente_so_recebe_as_proprias_remocoes(self):
+        marca = self.api.get('/api/animais/')['X-Sync-Marca']
+        outro = Cliente.objects.create(nome='João', telefone='1', email='j@exemplo.com', endereco='Rua B')
+        Animal.objects.create(nome='Bob', especie='C', raca='SRD', dono=outro).delete()
+        self.api.force_authenticate(self.usuario)
+        self.assertEqual(self.api.get('/api/animais/', {'since': marca}).data['removidos'], [])
+
+    def test_since_invalido(self):
+        self.assertEqual(self.api.get('/api/consultas/', {'since': 'ontem'}).status_code, 400)
+        self.assertEqual(self.api.get('/api/consultas/', {'since': '2025-13-45T00:00'}).status_code, 400)
+        self.assertEqual(self.api.get('/api/consultas/', {'since': '2025-01-01T00:00~2025-01-01T00:00~x'}).status_code,
+                         400)
+
+    def test_marca_com_margem_para_transacoes_longas(self):
+        marca = parse_datetime(self.api.get('/api/animais/', {'since': '2000-01-01T00:00'}).data['marca'])
+        self.assertLessEqual(marca, timezone.now() - SincronizacaoMixin.sincronizacao_margem)
+
+        # Linha gravada por uma transação que começou antes da marca e confirmou depois da leitura
+        Animal.objects.filter(pk=self.animal.pk).update(updated_at=marca + timedelta(seconds=1))
+        alterados = self.api.get('/api/animais/', {'since': marca.isoformat()}).data['alterados']
+        self.assertEqual([animal['id'] for animal in alterados], [self.animal.pk])
+
+    @mock.patch.object(SincronizacaoMixin, 'sincronizacao_tamanho_pagina', 2)
+    def test_alterados_em_paginas(self):
+        # Cinco animais com o mesmo updated_at (gravados por um bulk_update)
+        animais = [self.animal] + [Animal.objects.create(nome=f'Pet {i}', especie='C', raca='SRD', dono=self.cliente)
+                                   for i in range(4)]
+        Animal.objects.update(updated_at=timezone.now())
+
+        recebidos = []
+        since = '2000-01-01T00:00'
+        for _pagina in range(3):
+            dados = self.api.get('/api/animais/', {'since': since}).data
+            recebidos += [animal['id'] for animal in dados['alterados']]
+            since = dados['marca']
+            if dados['completo']:
+                break
+        self.assertTrue(dados['completo'])
+        self.assertEqual(recebidos, [animal.pk for animal in animais])
+        self.assertNotIn('~', dados['marca'])
+
+
+class CamposDinamicosAPITest(TesteAPI):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.equipe = User.objects.create(username='equipe', is_staff=True)
+        veterinario = MedicoVeterinario.objects.create(
+            nome='Dra. Ana', crmv='123', especialidade='Clínica geral', contato='1')
+        cls.cliente = Cliente.objects.create(
+            nome='Maria', telefone='1', email='maria@exemplo.com', endereco='Rua A')
+        cls.animal = Animal.objects.create(nome='Rex', especie='C', raca='SRD', dono=cls.cliente)
+        cls.consulta = Consulta.objects.create(
+            animal=cls.animal, veterinario=veterinario,
+            data=make_aware(datetime(2030, 1, 7, 8)), motivo='Rotina')
+
+
+    def listar(self, url):
+        with CaptureQueriesContext(connection) as contexto:
+            resposta = self.api.get(url)
+        self.assertEqual(resposta.status_code, 200)
+        return resposta.data['results'], contexto.captured_queries[-1]['sql']
+
+    def test_sem_parametros_resposta_completa(self):
+        consultas, sql = self.listar('/api/consultas/')
+        self.assertEqual(consultas[0]['animal']['dono']['nome'], 'Maria')
+        self.assertIn('JOIN', sql)
+
+    def test_fields_remove_campos_e_joins(self):
+        consultas, sql = self.listar('/api/consultas/?fields=id,data,status')
+        self.assertEqual(set(consultas[0]), {'id', 'data', 'status'})
+        self.assertNotIn('JOIN', sql)
+
+    def test_expand_controla_aninhados(self):
+        consultas, sql = self.listar('/api/consultas/?fields=id,animal,veterinario&expand=animal')
+        self.assertEqual(consultas[0]['animal']['nome'], 'Rex')
+        self.assertEqual(consultas[0]['animal']['dono'], self.cliente.pk)
+        self.assertEqual(consultas[0]['veterinario'], self.consulta.veterinario_id)
+        self.assertEqual(sql.count('JOIN'), 1)
+
+        consultas, _sql = self.listar('/api/consultas/?expand=animal,animal.dono')
+        self.assertEqual(consultas[0]['animal']['dono']['nome'], 'Maria')
+
+    def test_detalhe(self):
+        resposta = self.api.get(f'/api/animais/{self.animal.pk}/?fields=nome,dono&expand=')
+        self.assertEqual(resposta.data, {'nome': 'Rex', 'dono': self.cliente.pk})
+
+
+class LeituraRapidaAPITest(TesteAPI):
+    """
+    A listagem por values() precisa gerar exatamente o JSON dos serializers.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.equipe = User.objects.create(username='equipe', is_staff=True)
+        veterinario = MedicoVeterinario.objects.create(
+            nome='Dra. Ana', crmv='123', especialidade='Clínica geral', contato='1')
+        cliente = Cliente.objects.create(
+            nome='José', cpf='12345678900', telefone='1', email='jose@exemplo.com', endereco='Rua A')
+        com_peso = Animal.objects.create(nome='Rex', especie='C', raca='SRD', idade=3,
+                                         peso=Decimal('12.5'), dono=cliente)
+        sem_peso = Animal.objects.create(nome='Mia', especie='G', raca='SRD', dono=cliente)
+        inicio = make_aware(datetime(2030, 1, 7, 8))
+        Consulta.objects.create(animal=com_peso, veterinario=veterinario, data=inicio,
+                                motivo='Vacina', observacoes='Trazer carteira de vacinação')
+        Consulta.objects.create(animal=sem_peso, veterinario=None, data=inicio + timedelta(hours=1),
+                                motivo='Rotina', status=Consulta.StatusConsulta.CANCELADA)
+
+
+    def assertMesmoJSON(self, url, serializer):
+        resposta = self.api.get(url)
+        self.assertEqual(resposta.status_code, 200)
+        esperado = JSONRenderer().render(serializer.data)
+        self.assertEqual(JSONRapidoRenderer().render(resposta.data['results']), esperado)
+        self.assertIn(esperado[1:-1], resposta.content)
+
+    def test_lista_consultas(self):
+        consultas = Consulta.objects.order_by('data', 'id')
+        self.assertMesmoJSON('/api/consultas/', ConsultaSerializer(consultas, many=True))
+
+    def test_lista_animais(self):
+        self.assertMesmoJSON('/api/animais/?page=1', AnimalSerializer(Animal.objects.order_by('id'), many=True))
+
+
+class CacheTest(TesteAPI):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.equipe = User.objects.create(username='equipe', is_staff=True)
+        cls.usuario = User.objects.create(username='cliente')
+        cls.veterinario = MedicoVeterinario.objects.create(
+            nome='Dra. Ana', crmv='123', especialidade='Clínica geral', contato='1')
+        cls.cliente = Cliente.objects.create(
+            nome='Maria', telefone='1', email='maria@exemplo.com', endereco='Rua A', usuario=cls.usuario)
+        cls.animal = Animal.objects.create(nome='Rex', especie='C', raca='SRD', dono=cls.cliente)
+
+    def setUp(self):
+        super().setUp()
+        cache_dados.zerar_estatisticas()
+
+    def consultas_ao_banco(self, url):
+        with CaptureQueriesContext(connection) as contexto:
+            resposta = self.api.get(url)
+        self.assertEqual(resposta.status_code, 200)
+        return resposta, len(contexto)
+
+    def test_lista_da_api_em_cache_e_invalidada(self):
+        _resposta, sem_cache = self.consultas_ao_banco('/api/veterinarios/')
+        resposta, com_cache = self.consultas_ao_banco('/api/veterinarios/')
+        self.assertEqual(com_cache, sem_cache - 1)  # só a agregação do ETag
+
+        self.veterinario.nome = 'Dra. Ana Lima'
+        self.veterinario.save()
+        resposta, _consultas = self.consultas_ao_banco('/api/veterinarios/')
+        self.assertEqual(resposta.data['results'][0]['nome'], 'Dra. Ana Lima')
+        self.assertEqual(cache_dados.estatisticas()['api'], {'acertos': 1, 'falhas': 2, 'taxa_acertos': 0.333})
+
+    def test_etag_e_corpo_da_mesma_versao(self):
+        resposta = self.api.get('/api/clientes/')
+        etag = resposta['ETag']
+
+        # Alteração sem signals (como um .update() ou outro processo com cache local)
+        Cliente.objects.filter(pk=self.cliente.pk).update(nome='Maria Lima', updated_at=timezone.now())
+        resposta = self.api.get('/api/clientes/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(resposta.data['results'][0]['nome'], 'Maria Lima')
+        resposta = self.api.get('/api/clientes/', HTTP_IF_NONE_MATCH=resposta['ETag'])
+        self.assertEqual(resposta.status_code, 304)
+
+    @override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+    def test_create_users_for_clients_invalida_a_lista(self):
+        sem_usuario = Cliente.objects.create(nome='João', telefone='1', email='joao@exemplo.com', endereco='Rua')
+        self.assertIsNone(self.api.get('/api/clientes/').data['results'][1]['usuario'])
+        call_command('create_users_for_clients', processos=1, stdout=StringIO())
+        resultados = self.api.get('/api/clientes/').data['results']
+        self.assertEqual(resultados[1]['id'], sem_usuario.pk)
+        self.assertEqual(resultados[1]['usuario']['username'], 'joao')
+
+    def test_paginas_separadas_por_usuario(self):
+        Consulta.objects.create(animal=self.animal, veterinario=self.veterinario,
+                                data=make_aware(datetime(2030, 1, 7, 8)), motivo='Rotina')
+        self.assertEqual(len(self.api.get('/api/consultas/').data['results']), 1)
+        self.api.force_authenticate(User.objects.create(username='outro'))
+        self.assertEqual(self.api.get('/api/consultas/').data['results'], [])
+
+    def test_agenda_invalidada_por_nova_consulta(self):
+        url = (f'/api/consultas/eventos_veterinario/?veterinario={self.veterinario.pk}'
+               '&start=2030-01-07&end=2030-01-08')
+        self.assertEqual(self.api.get(url).json()[0]['title'], 'Disponível')
+        _resposta, consultas = self.consultas_ao_banco(url)
+        self.assertEqual(consultas, 0)
+
+        Consulta.objects.create(animal=self.animal, veterinario=self.veterinario,
+                                data=make_aware(datetime(2030, 1, 7, 8)), motivo='Rotina')
+        self.assertEqual(self.api.get(url).json()[0]['title'], 'Rex - Dra. Ana')
+
+        # O nome do animal aparece no evento
+        self.animal.nome = 'Rex II'
+        self.animal.save()
+        self.assertEqual(self.api.get(url).json()[0]['title'], 'Rex II - Dra. Ana')
+
+    def test_select_do_formulario(self):
+        self.assertEqual(len(ConsultaForm().fields['veterinario'].choices), 2)
+        MedicoVeterinario.objects.create(nome='Dr. Beto', crmv='456', especialidade='X', contato='1')
+        with CaptureQueriesContext(connection) as contexto:
+            opcoes = [str(nome) for _id, nome in ConsultaForm().fields['veterinario'].choices]
+            ConsultaForm()
+        self.assertEqual(opcoes, ['---------', 'Dr. Beto', 'Dra. Ana'])
+        self.assertEqual(len(contexto), 1)
+
+    def test_estatisticas_so_para_equipe(self):
+        self.api.get('/api/veterinarios/')
+        self.assertIn('api', self.api.get('/api/cache/').data['escopos'])
+        self.api.force_authenticate(self.usuario)
+        self.assertEqual(self.api.get('/api/cache/').status_code, 403)
+
+
+class ViewsAssincronasTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.equipe = User.objects.create(username='equipe', is_staff=True)
+        cls.veterinario = MedicoVeterinario.objects.create(
+            nome='Dra. Ana', crmv='123', especialidade='Clínica geral', contato='1')
+        cliente = Cliente.objects.create(nome='Maria', telefone='1', email='m@exemplo.com', endereco='Rua')
+        animal = Animal.objects.create(nome='Rex', especie='C', raca='SRD', dono=cliente)
+        Consulta.objects.create(animal=animal, veterinario=cls.veterinario,
+                                data=make_aware(datetime(2030, 1, 7, 8)), motivo='Rotina')
+
+    def setUp(self):
+        cache.clear()
+        self.token = {'Authorization': f'Bearer {AccessToken.for_user(self.equipe)}'}
+
+    async def test_resumo_consultas(self):
+        resposta = await self.async_client.get('/api/consultas/resumo_consultas/', headers=self.token)
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(resposta.json(), {'todas': 1, 'agendadas': 1, 'concluidas': 0, 'canceladas': 0})
+
+        resposta = await self.async_client.get(
+            '/api/consultas/resumo_consultas/?por_veterinario=1&inicio=2030-01-01', headers=self.token)
+        self.assertEqual(resposta.json()[0]['veterinario_nome'], 'Dra. Ana')
+
+    async def test_erros_no_formato_do_drf(self):
+        resposta = await self.async_client.get('/api/consultas/resumo_consultas/')
+        self.assertEqual(resposta.status_code, 401)
+        self.assertIn('Bearer', resposta['WWW-Authenticate'])
+
+        resposta = await self.async_client.get(
+            '/api/consultas/resumo_consultas/?inicio=ontem', headers=self.token)
+        self.assertEqual((resposta.status_code, resposta.json()), (400, {'detail': 'Data inválida: ontem'}))
+
+    async def test_eventos_veterinario(self):
+        resposta = await self.async_client.get(
+            f'/api/consultas/eventos_veterinario/?veterinario={self.veterinario.pk}'
+            '&start=2030-01-07&end=2030-01-08', headers=self.token)
+        eventos = resposta.json()
+        self.assertEqual(eventos[0]['title'], 'Rex - Dra. Ana')
+        self.assertEqual(len(eventos), 8)  # jornada padrão: 8 slots, 1 ocupado + 7 livres
+
+    async def test_proximos_horarios(self):
+        # 07/01/2030 (seg) 8h está ocupado com a Dra. Ana; o Dr. Beto tem folga no dia
+        beto = await MedicoVeterinario.objects.acreate(
+            nome='Dr. Beto', crmv='456', especialidade='Clínica geral', contato='1')
+        await Folga.objects.acreate(veterinario=beto, data=datetime(2030, 1, 7).date())
+        await MedicoVeterinario.objects.acreate(nome='Dra. Cris', crmv='789', especialidade='Cardiologia',
+                                                contato='1')
+        url = '/api/consultas/proximos_horarios/?especialidade=cl%C3%ADnica%20geral&a_partir_de=2030-01-07'
+        resposta = await self.async_client.get(url + '&limite=3', headers=self.token)
+        self.assertEqual([(h['inicio'], h['veterinario']['nome']) for h in resposta.json()], [
+            ('2030-01-07T09:00:00', 'Dra. Ana'), ('2030-01-07T10:00:00', 'Dra. Ana'),
+            ('2030-01-07T11:00:00', 'Dra. Ana'),
+        ])
+        # Sexta à tarde: os dois veterinários intercalados, continuando na segunda
+        resposta = await self.async_client.get(
+            url.replace('2030-01-07', '2030-01-11T16:00') + '&limite=4', headers=self.token)
+        self.assertEqual([(h['inicio'], h['veterinario']['nome']) for h in resposta.json()], [
+            ('2030-01-11T16:00:00', 'Dr. Beto'), ('2030-01-11T16:00:00', 'Dra. Ana'),
+            ('2030-01-14T08:00:00', 'Dr. Beto'), ('2030-01-14T08:00:00', 'Dra. Ana'),
+        ])
+        resposta = await self.async_client.get(url + '&limite=500', headers=self.token)
+        self.assertEqual(resposta.status_code, 400)
+
+    def test_proximos_horarios_agenda_cheia(self):
+        # Sem horário livre nas primeiras janelas: a busca continua nas seguintes
+        inicio = make_aware(datetime(2030, 1, 7))
+        resultado = agenda.proximos_horarios('Clínica geral', inicio, 1)
+        self.assertEqual(resultado[0]['inicio'], '2030-01-07T09:00:00')
+        with mock.patch.object(agenda, 'JORNADA_PADRAO', {4: agenda.JORNADA_PADRAO[0]}):
+            resultado = agenda.proximos_horarios('Clínica geral', inicio, 1)
+        self.assertEqual(resultado[0]['inicio'], '2030-01-11T08:00:00')
+
+    async def test_eventos_da_clinica_em_fluxo(self):
+        await self.async_client.aforce_login(self.equipe)
+        resposta = await self.async_client.get('/eventos/?start=2030-01-07&end=2030-01-08')
+        self.assertTrue(resposta.streaming)
+        conteudo = b''.join([parte async for parte in resposta.streaming_content])
+        self.assertEqual([evento['title'] for evento in json.loads(conteudo)], ['Rex - Dra. Ana'])
+
+    def test_eventos_da_clinica_em_fluxo_com_wsgi(self):
+        # Com WSGI o gerador é síncrono: um assíncrono seria acumulado inteiro antes do envio
+        self.client.force_login(self.equipe)
+        resposta = self.client.get('/eventos/?start=2030-01-07&end=2030-01-08')
+        self.assertFalse(resposta.is_async)
+        self.assertEqual([evento['title'] for evento in json.loads(resposta.getvalue())], ['Rex - Dra. Ana'])
+        resposta = self.client.get('/eventos/?start=2030-01-08&end=2030-01-09')
+        self.assertEqual(resposta.getvalue(), b'[]')
+
+
+class AvisosConsultasTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.equipe = User.objects.create(username='equipe', is_staff=True)
+        cls.ana = MedicoVeterinario.objects.create(
+            nome='Dra. Ana', crmv='123', especialidade='Clínica geral', contato='1')
+        cls.bruno = MedicoVeterinario.objects.create(
+            nome='Dr. Bruno', crmv='456', especialidade='Clínica geral', contato='2')
+        cliente = Cliente.objects.create(nome='Maria', telefone='1', email='m@exemplo.com', endereco='Rua')
+        cls.animal = Animal.objects.create(nome='Rex', especie='C', raca='SRD', dono=cliente)
+
+    def setUp(self):
+        self.token = {'Authorization': f'Bearer {AccessToken.for_user(self.equipe)}'}
+
+    def gravar(self, funcao):
+        # Os avisos saem no commit
+        with self.captureOnCommitCallbacks(execute=True):
+            return funcao()
+
+    async def proximo_aviso(self, fluxo):
+        mensagem = (await anext(fluxo)).decode()
+        evento, dados = mensagem.split('\n\n')[0].splitlines()[-2:]
+        return evento.removeprefix('event: '), json.loads(dados.removeprefix('data: '))
+
+    @mock.patch.object(notificacoes, 'DURACAO_MAXIMA', 1)
+    async def test_avisos_filtrados_por_veterinario(self):
+        resposta = await self.async_client.get(f'/api/consultas/avisos/?veterinario={self.ana.pk}',
+                                               headers=self.token)
+        self.assertEqual(resposta['Content-Type'], 'text/event-stream')
+        fluxo = aiter(resposta.streaming_content)
+        self.assertEqual(await self.proximo_aviso(fluxo), ('conectado', {}))
+
+        criar = lambda veterinario, hora: self.gravar(lambda: Consulta.objects.create(
+            animal=self.animal, veterinario=veterinario, data=make_aware(datetime(2030, 1, 7, hora)), motivo='Rotina'))
+        await sync_to_async(criar)(self.bruno, 8)  # outro veterinário: não chega
+        consulta = await sync_to_async(criar)(self.ana, 9)
+        evento, aviso = await self.proximo_aviso(fluxo)
+        self.assertEqual((evento, aviso['tipo'], aviso['id']), ('consulta', 'criada', consulta.pk))
+        self.assertEqual(aviso['evento']['title'], 'Rex - Dra. Ana')
+        self.assertNotIn('usuario', aviso)
+
+        # Trocar de veterinário avisa a agenda antiga; cancelar e remover também
+        def transferir():
+            consulta.veterinario = self.bruno
+            consulta.save()
+        await sync_to_async(self.gravar)(transferir)
+        _evento, aviso = await self.proximo_aviso(fluxo)
+        self.assertEqual((aviso['tipo'], aviso['veterinario'], aviso['veterinario_anterior']),
+                         ('alterada', self.bruno.pk, self.ana.pk))
+
+        def cancelar():
+            Consulta.objects.filter(pk=consulta.pk).update(veterinario=self.ana)
+            consulta.refresh_from_db()
+            consulta.status = Consulta.StatusConsulta.CANCELADA
+            consulta.save()
+        await sync_to_async(self.gravar)(cancelar)
+        self.assertEqual((await self.proximo_aviso(fluxo))[1]['tipo'], 'cancelada')
+        await sync_to_async(self.gravar)(consulta.delete)
+        self.assertEqual((await self.proximo_aviso(fluxo))[1]['tipo'], 'removida')
+
+        # Fim do fluxo: o navegador reconecta depois de ``retry``
+        self.assertEqual([parte async for parte in fluxo], [])
+        self.assertEqual(notificacoes.broker().conexoes(), 0)
+
+    def test_wsgi_nao_abre_o_fluxo(self):
+        # Com WSGI o fluxo prenderia o worker: 204 faz o EventSource desistir
+        self.client.force_login(self.equipe)
+        self.assertEqual(self.client.get('/eventos/avisos/').status_code, 204)
+        resposta = self.client.get('/api/consultas/avisos/', headers=self.token)
+        self.assertEqual(resposta.status_code, 204)
+        self.assertEqual(notificacoes.broker().conexoes(), 0)
+
+        self.assertNotContains(self.client.get('/consultas/'), 'EventSource')
+        with override_settings(NOTIFICACOES_ATIVAS=True):
+            self.assertContains(self.client.get('/consultas/'), 'EventSource')
+
+    def test_sem_conexoes_nao_monta_avisos(self):
+        with self.assertNumQueries(0):
+            notificacoes.consultas_gravadas([Consulta(pk=1, veterinario=self.ana)])
+
+    def test_cliente_so_recebe_as_proprias_consultas(self):
+        assinatura = notificacoes.Assinatura(loop=None, usuario_id=7)
+        aviso = {'veterinario': self.ana.pk, 'veterinario_anterior': None, 'usuario': 7}
+        self.assertTrue(assinatura.aceita(aviso))
+        self.assertFalse(assinatura.aceita({**aviso, 'usuario': 8}))
+
+
+class MetricasTest(TesteAPI):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.equipe = User.objects.create(username='equipe', is_staff=True)
+        MedicoVeterinario.objects.create(nome='Dra. Ana', crmv='123', especialidade='Clínica geral', contato='1')
+
+    def setUp(self):
+        super().setUp()
+        metricas.zerar()
+        cache_dados.zerar_estatisticas()
+
+    def test_server_timing(self):
+        resposta = self.api.get('/api/veterinarios/')
+        self.assertRegex(resposta['Server-Timing'], r'^sql;dur=[\d.]+;desc="\d+ consultas", ser;dur=[\d.]+, total')
+
+        self.client.force_login(self.equipe)
+        resposta = self.client.get('/veterinarios/')
+        self.assertIn('tpl;dur=', resposta['Server-Timing'])
+
+    def test_histogramas_por_rota_no_formato_prometheus(self):
+        self.api.get('/api/veterinarios/')
+        self.api.get('/api/veterinarios/')
+        self.client.force_login(self.equipe)
+        texto = self.client.get('/metrics').content.decode()
+        self.assertIn('# TYPE clinicadobicho_requisicao_segundos histogram', texto)
+        self.assertIn('clinicadobicho_requisicao_segundos_count{rota="veterinario-list"} 2', texto)
+        self.assertIn('clinicadobicho_requisicao_segundos_bucket{rota="veterinario-list",le="+Inf"} 2', texto)
+        self.assertIn('clinicadobicho_respostas_total{rota="veterinario-list",status="200"} 2', texto)
+        self.assertIn('clinicadobicho_cache_total{escopo="api",resultado="acertos"} 1', texto)
+
+    @override_settings(METRICAS_TOKEN='segredo', METRICAS_IPS=['10.0.0.9'])
+    def test_metrics_so_para_equipe_token_ou_ips_liberados(self):
+        self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='10.0.0.5').status_code, 403)
+        self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='10.0.0.9').status_code, 200)
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer outro').status_code, 403)
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer segredo').status_code, 200)
+        self.client.force_login(self.equipe)
+        self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='10.0.0.5').status_code, 200)
+
+    def test_metrics_fechado_por_padrao(self):
+        # Atrás de um proxy local toda requisição vem de 127.0.0.1
+        self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='127.0.0.1').status_code, 403)
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer ').status_code, 403)
+
+    @override_settings(METRICAS_CONSULTA_LENTA=0)
+    def test_consulta_lenta_logada_com_a_rota(self):
+        with self.assertLogs('core.metricas', 'WARNING') as logs:
+            self.api.get('/api/veterinarios/')
+        self.assertIn('Consulta lenta', logs.output[0])
+        self.assertIn('em veterinario-list:', logs.output[0])
+
+
+class BenchmarkTest(TestCase):
+
+    def setUp(self):
+        call_command('popular_clinica', clientes=20, animais=30, consultas=200, veterinarios=3, stdout=StringIO())
+        self.pasta = tempfile.TemporaryDirectory()
+        self.addCleanup(self.pasta.cleanup)
+        self.base = os.path.join(self.pasta.name, 'base.json')
+
+    def test_popular_clinica_sem_conflitos_de_horario(self):
+        self.assertEqual(Consulta.objects.count(), 200)
+        self.assertEqual(Animal.objects.values('dono').distinct().count(), 20)
+        self.assertTrue(Cliente.objects.com_cpf('000.000.000-01').exists())
+        self.assertFalse(Consulta.objects.values('veterinario', 'data').annotate(n=Count('id')).filter(n__gt=1))
+        with self.assertRaises(CommandError):
+            call_command('popular_clinica', clientes=1, animais=1, consultas=0, veterinarios=1, stdout=StringIO())
+
+    def test_regressao_falha_a_execucao(self):
+        call_command('benchmark', repeticoes=2, aquecimento=0, salvar=self.base, stdout=StringIO())
+        with open(self.base) as arquivo:
+            base = json.load(arquivo)
+        self.assertEqual(base['parametros']['consultas'], 200)
+        # O que as requisições gravaram foi desfeito
+        self.assertEqual(Consulta.objects.count(), 200)
+
+        # Nada mudou: a comparação com folga passa
+        call_command('benchmark', repeticoes=2, aquecimento=0, linha_de_base=self.base, tolerancia=100,
+                     margem=1000, stdout=StringIO())
+
+        base['casos']['api consultas']['consultas'] -= 1
+        with open(self.base, 'w') as arquivo:
+            json.dump(base, arquivo)
+        with self.assertRaisesRegex(CommandError, 'api consultas: consultas SQL'):
+            call_command('benchmark', repeticoes=2, aquecimento=0, linha_de_base=self.base, tolerancia=100,
+                         margem=1000, stdout=StringIO())
+
+
+class ImportacaoTest(TesteAPI):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.equipe = User.objects.create(username='equipe', is_staff=True)
+
+    def importar(self, tipo, texto, formato='csv', tamanho_lote=2):
+        erros = {}
+        linhas = importacao.ler_linhas(texto.splitlines(keepends=True), formato)
+        resumo = importacao.importar(tipo, linhas, tamanho_lote, ao_errar=erros.__setitem__)
+        return resumo, erros
+
+    def test_upsert_pelas_chaves_naturais(self):
+        self.importar('veterinarios', 'nome,crmv,especialidade,contato\nDra. Ana,SP-1,Clínica geral,1\n')
+        resumo, erros = self.importar('clientes', (
+            'nome,cpf,telefone,email,endereco\n'
+            'Maria,123.456.789-00,1,maria@exemplo.com,Rua A\n'
+            'João,98765432100,2,joao@exemplo.com,Rua B\n'
+            'Sem email,11111111111,3,,Rua C\n'
+            'Maria Silva,12345678900,1,maria@exemplo.com,Rua A\n'))
+        self.assertEqual(resumo, {'linhas': 4, 'gravadas': 3, 'erros': 1})
+        self.assertEqual(list(erros), [4])
+        self.assertIn('email', erros[4])
+        self.assertEqual(Cliente.objects.count(), 2)
+        # A última linha com o mesmo CPF vale, mesmo em outro lote
+        self.assertEqual(Cliente.objects.com_cpf('12345678900').get().nome, 'Maria Silva')
+        _resumo, erros = self.importar('clientes', 'nome,cpf,telefone,email,endereco\nAna,123.456,1,a@exemplo.com,Rua\n')
+        self.assertEqual(erros, {2: {'cpf': ['O CPF deve ter 11 dígitos.']}})
+
+        animais = ('cpf_dono,nome,especie,raca,idade,peso\n'
+                   '12345678900,Rex,Cachorro,SRD,,"12,5"\n'
+                   '12345678900,Mia,g,Siamês,2,4\n'
+                   '00000000000,Bob,C,SRD,1,3\n')
+        self.assertEqual(self.importar('animais', animais)[0]['gravadas'], 2)
+        resumo, erros = self.importar('animais', animais.replace('SRD,,', 'Labrador,,'))
+        self.assertEqual(erros, {4: {'cpf_dono': ['Cliente não encontrado.']}})
+        self.assertEqual(Animal.objects.count(), 2)
+        rex = Animal.objects.get(nome='Rex')
+        self.assertEqual((rex.raca, rex.idade, rex.peso), ('Labrador', None, Decimal('12.5')))
+        self.assertEqual(Animal.objects.get(nome='Mia').especie, 'G')
+
+    def test_consultas_com_conflito_de_horario(self):
+        veterinario = MedicoVeterinario.objects.create(
+            nome='Dra. Ana', crmv='SP-1', especialidade='Clínica geral', contato='1')
+        dono = Cliente.objects.create(nome='Maria', cpf='12345678900', telefone='1',
+                                      email='m@exemplo.com', endereco='Rua')
+        Animal.objects.create(nome='Rex', especie='C', raca='SRD', dono=dono)
+        Animal.objects.create(nome='Mia', especie='G', raca='SRD', dono=dono)
+        linhas = [
+            {'cpf_dono': '123.456.789-00', 'animal': 'Rex', 'crmv': 'SP-1', 'data': '02/01/2030 09:00',
+             'motivo': 'Rotina'},
+            {'cpf_dono': '12345678900', 'animal': 'Mia', 'crmv': 'SP-1', 'data': '2030-01-02T09:00',
+             'motivo': 'Vacina'},
+            {'cpf_dono': '12345678900', 'animal': 'Mia', 'crmv': 'SP-1', 'data': '2030-01-02 10:00',
+             'motivo': 'Vacina', 'status': 'cancelada'},
+            {'cpf_dono': '12345678900', 'animal': 'Rex', 'crmv': 'SP-9', 'data': '2030-01-02 11:00'},
+        ]
+        texto = '\n'.join(json.dumps(linha) for linha in linhas) + '\n[1]\n'
+        resumo, erros = self.importar('consultas', texto, 'jsonl')
+        self.assertEqual(resumo, {'linhas': 5, 'gravadas': 2, 'erros': 3})
+        self.assertIn('Já existe uma consulta agendada', erros[2]['data'][0])
+        self.assertEqual(list(erros[4]), ['motivo'])
+        self.assertEqual(erros[5], {'linha': ['Cada linha deve ser um objeto JSON.']})
+
+        # Importar de novo atualiza as mesmas consultas
+        resumo, erros = self.importar('consultas', texto.replace('Rotina', 'Retorno'), 'jsonl')
+        self.assertEqual(resumo['gravadas'], 2)
+        self.assertEqual(Consulta.objects.count(), 2)
+        consulta = Consulta.objects.get(animal__nome='Rex')
+        self.assertEqual((consulta.motivo, consulta.veterinario, localtime(consulta.data).hour),
+                         ('Retorno', veterinario, 9))
+
+    def test_endpoint_da_equipe(self):
+        arquivo = SimpleUploadedFile('vets.csv', 'nome,crmv,especialidade,contato\nDra. Ana,SP-1,X,1\n,SP-2,X,1\n'
+                                     .encode('utf-8-sig'))
+        resposta = self.api.post('/api/importacao/veterinarios/', {'arquivo': arquivo}, format='multipart')
+        self.assertEqual(resposta.status_code, 207)
+        self.assertEqual(resposta.json()['detalhes'], [{'linha': 3, 'erros': {'nome': ['Este campo não pode estar vazio.']}}])
+        self.assertTrue(MedicoVeterinario.objects.filter(crmv='SP-1').exists())
+
+        self.assertEqual(self.api.post('/api/importacao/pets/', {'arquivo': arquivo}).status_code, 404)
+        cliente = APIClient()
+        cliente.force_authenticate(User.objects.create(username='cliente'))
+        self.assertEqual(cliente.post('/api/importacao/veterinarios/', {'arquivo': arquivo}).status_code, 403)
+
+
+class ExportacaoTest(TesteAPI):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.equipe = User.objects.create(username='equipe', is_staff=True)
+        cls.ana = MedicoVeterinario.objects.create(nome='Dra. Ana', crmv='1', especialidade='X', contato='1')
+        cls.beto = MedicoVeterinario.objects.create(nome='Dr. Beto', crmv='2', especialidade='X', contato='1')
+        dono = Cliente.objects.create(nome='Maria', cpf='12345678900', telefone='1', email='m@exemplo.com',
+                                      endereco='Rua "A", 1')
+        Cliente.objects.create(nome='Sem pets', cpf='98765432100', telefone='2', email='s@exemplo.com',
+                               endereco='Rua B')
+        rex = Animal.objects.create(nome='Rex', especie='C', raca='SRD', peso=Decimal('12.50'), dono=dono)
+        Animal.objects.create(nome='Mia', especie='G', raca='SRD', dono=dono)
+        for dia, veterinario, status in ((5, cls.ana, 'Agendada'), (6, cls.beto, 'Agendada'),
+                                         (7, cls.ana, 'Cancelada')):
+            Consulta.objects.create(animal=rex, veterinario=veterinario, motivo='Rotina', status=status,
+                                    data=make_aware(datetime(2030, 1, dia, 9)))
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.equipe)
+
+    def baixar(self, url, **params):
+        resposta = self.client.get(url, params)
+        self.assertEqual(resposta.status_code, 200)
+        self.assertTrue(resposta.streaming)
+        return b''.join(resposta.streaming_content)
+
+    def test_consultas_csv_com_filtros(self):
+        conteudo = self.baixar('/consultas/exportar/', veterinario=self.ana.pk, status='Agendada',
+                               inicio='2030-01-01', fim='2030-01-05').decode('utf-8-sig')
+        linhas = conteudo.splitlines()
+        self.assertEqual(linhas[0], 'ID,Data,Status,Animal,Espécie,Dono,CPF,Veterinário,CRMV,Motivo,Observações')
+        self.assertEqual(len(linhas), 2)
+        self.assertIn(',05/01/2030 09:00,Agendada,Rex,Cachorro,Maria,12345678900,Dra. Ana,1,Rotina,', linhas[1])
+
+        self.assertEqual(len(self.baixar('/consultas/exportar/').splitlines()), 4)
+        resposta = self.client.get('/consultas/exportar/', {'inicio': '05/01/2030'})
+        self.assertEqual(resposta.status_code, 400)
+
+    def test_csv_sem_formulas(self):
+        Consulta.objects.filter(status='Agendada').update(motivo='=HYPERLINK("http://x","clique")',
+                                                          observacoes='-2+3')
+        linhas = list(csv.reader(self.baixar('/consultas/exportar/', status='Agendada')
+                                 .decode('utf-8-sig').splitlines()))
+        self.assertEqual(linhas[1][-2:], ['\'=HYPERLINK("http://x","clique")', "'-2+3"])
+        self.assertEqual(linhas[1][2], 'Agendada')
+
+    def test_clientes_xlsx(self):
+        resposta = self.client.get('/clientes/exportar/', {'formato': 'xlsx'})
+        self.assertIn('clientes-', resposta['Content-Disposition'])
+        pacote = zipfile.ZipFile(BytesIO(b''.join(resposta.streaming_content)))
+        self.assertIn('xl/workbook.xml', pacote.namelist())
+        planilha = pacote.read('xl/worksheets/sheet1.xml').decode()
+        # Cabeçalho, dois animais da Maria e o cliente sem pets
+        self.assertEqual(planilha.count('<row>'), 4)
+        self.assertIn('<t xml:space="preserve">Rua "A", 1</t>', planilha)
+        self.assertIn('<c><v>12.50</v></c>', planilha)
+
+    def test_planilhas_divididas_no_limite_de_linhas(self):
+        with mock.patch.object(exportacao, 'LINHAS_POR_PLANILHA', 2):
+            conteudo = self.baixar('/consultas/exportar/', formato='xlsx')
+        pacote = zipfile.ZipFile(BytesIO(conteudo))
+        self.assertEqual(sorted(nome for nome in pacote.namelist() if 'worksheets/' in nome),
+                         ['xl/worksheets/sheet1.xml', 'xl/worksheets/sheet2.xml'])
+        self.assertIn('name="Consultas 2"', pacote.read('xl/workbook.xml').decode())
+
+    def test_so_para_a_equipe(self):
+        self.client.force_login(User.objects.create(username='cliente'))
+        self.assertEqual(self.client.get('/consultas/exportar/').status_code, 403)
+        resposta = self.api.get('/api/exportacao/consultas/', {'formato': 'csv', 'status': 'Cancelada'})
+        self.assertEqual(len(b''.join(resposta.streaming_content).splitlines()), 2)
+        self.assertEqual(self.api.get('/api/exportacao/animais/').status_code, 404)
+
+
+class EstatisticasPorDiaTest(TesteAPI):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.equipe = User.objects.create(username='equipe', is_staff=True)
+        cls.ana = MedicoVeterinario.objects.create(nome='Dra. Ana', crmv='1', especialidade='X', contato='1')
+        cls.beto = MedicoVeterinario.objects.create(nome='Dr. Beto', crmv='2', especialidade='X', contato='1')
+        dono = Cliente.objects.create(nome='Maria', telefone='1', email='m@exemplo.com', endereco='Rua')
+        cls.rex = Animal.objects.create(nome='Rex', especie='C', raca='SRD', dono=dono)
+
+    def agendar(self, dia, hora, veterinario=None, status='Agendada'):
+        return Consulta.objects.create(animal=self.rex, veterinario=veterinario or self.ana, motivo='Rotina',
+                                       status=status, data=make_aware(datetime(2030, 1, dia, hora)))
+
+    def contagens(self):
+        return {(vet, dia.day, status): quantidade for vet, dia, status, quantidade in
+                ConsultasPorDia.objects.exclude(quantidade=0).values_list(
+                    'veterinario_id', 'dia', 'status', 'quantidade')}
+
+    def test_signals_mantem_as_contagens(self):
+        ana, beto = self.ana.pk, self.beto.pk
+        consulta = self.agendar(7, 9)
+        self.agendar(7, 10)
+        # 23h em São Paulo já é o dia seguinte em UTC: conta no dia local
+        self.agendar(7, 23, status='Cancelada')
+        self.assertEqual(self.contagens(), {(ana, 7, 'Agendada'): 2, (ana, 7, 'Cancelada'): 1})
+
+        consulta.status = 'Concluida'
+        consulta.save()
+        consulta = Consulta.objects.only('id', 'veterinario').get(pk=consulta.pk)
+        consulta.veterinario = self.beto
+        consulta.save()
+        self.api.patch(f'/api/consultas/{consulta.pk}/', {'data': '2030-01-08T09:00:00-03:00'}, format='json')
+        self.assertEqual(self.contagens(), {(ana, 7, 'Agendada'): 1, (ana, 7, 'Cancelada'): 1,
+                                            (beto, 8, 'Concluida'): 1})
+
+        # Lote da API (bulk_create/bulk_update) e remoções
+        resposta = self.api.post('/api/consultas/lote/', [
+            {'id': consulta.pk, 'status': 'Cancelada'},
+            {'animal': self.rex.pk, 'veterinario': beto, 'data': '2030-01-09T09:00:00-03:00', 'motivo': 'X'},
+        ], format='json')
+        self.assertEqual(resposta.status_code, 201)
+        Consulta.objects.filter(data__day=7, status='Cancelada').delete()
+        self.assertEqual(self.contagens(), {(ana, 7, 'Agendada'): 1, (beto, 8, 'Cancelada'): 1,
+                                            (beto, 9, 'Agendada'): 1})
+
+        # As consultas do veterinário removido ficam sem veterinário (0)
+        self.beto.delete()
+        self.assertEqual(self.contagens(), {(ana, 7, 'Agendada'): 1, (0, 8, 'Cancelada'): 1,
+                                            (0, 9, 'Agendada'): 1})
+        self.assertEqual(estatisticas.divergencias(), {})
+
+    def test_reconstruir_corrige_divergencias(self):
+        self.agendar(7, 9)
+        self.agendar(8, 9)
+        # .update() não dispara os signals
+        Consulta.objects.filter(data__day=8).update(status='Cancelada')
+        self.assertEqual(len(estatisticas.divergencias()), 2)
+        self.assertEqual(estatisticas.divergencias(inicio=datetime(2030, 1, 8).date(),
+                                                   fim=datetime(2030, 1, 8).date()),
+                         {(self.ana.pk, datetime(2030, 1, 8).date(), 'Agendada'): (1, 0),
+                          (self.ana.pk, datetime(2030, 1, 8).date(), 'Cancelada'): (0, 1)})
+
+        with self.assertRaises(CommandError):
+            call_command('reconstruir_estatisticas', '--verificar', stdout=StringIO())
+        saida = StringIO()
+        call_command('reconstruir_estatisticas', stdout=saida)
+        self.assertIn('2 divergência(s) corrigida(s)', saida.getvalue())
+        self.assertEqual(self.contagens(), {(self.ana.pk, 7, 'Agendada'): 1, (self.ana.pk, 8, 'Cancelada'): 1})
+        self.assertFalse(ConsultasPorDia.objects.filter(quantidade=0).exists())
+        call_command('reconstruir_estatisticas', '--verificar', stdout=StringIO())
+
+    def test_series_dos_dashboards(self):
+        # Semana de 07/01/2030 (seg): jornada padrão, 8 slots por dia; quarta é feriado
+        Folga.objects.create(data=datetime(2030, 1, 9).date(), motivo='Feriado')
+        self.agendar(7, 9)
+        self.agendar(7, 10, status='Concluida')
+        self.agendar(8, 9, veterinario=self.beto, status='Cancelada')
+        self.agendar(14, 9, veterinario=self.beto)
+
+        url = '/api/estatisticas/ocupacao/'
+        params = {'inicio': '2030-01-07', 'fim': '2030-01-20', 'agrupar': 'semana'}
+        with CaptureQueriesContext(connection) as capturadas:
+            self.assertEqual(self.api.get(url, params).json(), [
+                {'periodo': '2030-01-07', 'capacidade': 2 * 4 * 8, 'ocupados': 2, 'ocupacao': 0.0312},
+                {'periodo': '2030-01-14', 'capacidade': 2 * 5 * 8, 'ocupados': 1, 'ocupacao': 0.0125},
+            ])
+        # Nenhuma leitura da tabela de consultas, seja qual for o histórico
+        self.assertFalse([q for q in capturadas if 'core_consulta"' in q['sql']])
+        resposta = self.api.get(url, {**params, 'veterinario': self.beto.pk})
+        self.assertEqual([periodo['ocupacao'] for periodo in resposta.json()], [0.0, 0.025])
+
+        resposta = self.api.get('/api/estatisticas/cancelamentos/', {'inicio': '2030-01-07', 'fim': '2030-01-08'})
+        self.assertEqual(resposta.json(), [
+            {'periodo': '2030-01-07', 'consultas': 2, 'canceladas': 0, 'taxa_cancelamento': 0.0},
+            {'periodo': '2030-01-08', 'consultas': 1, 'canceladas': 1, 'taxa_cancelamento': 1.0},
+        ])
+        resposta = self.api.get('/api/estatisticas/cancelamentos/', {'agrupar': 'ano'})
+        self.assertEqual(resposta.status_code, 400)
+        self.api.force_authenticate(User.objects.create(username='cliente'))
+        self.assertEqual(self.api.get(url).status_code, 403)
+
+
+class RecorrenciaTest(TesteAPI):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.equipe = User.objects.create(username='equipe', is_staff=True)
+        cls.ana = MedicoVeterinario.objects.create(nome='Dra. Ana', crmv='1', especialidade='X', contato='1')
+        dono = Cliente.objects.create(nome='Maria', telefone='1', email='m@exemplo.com', endereco='Rua')
+        cls.rex = Animal.objects.create(nome='Rex', especie='C', raca='SRD', dono=dono)
+
+    def test_datas_da_serie(self):
+        # Sexta-feira 04/01/2030, 9h
+        primeira = make_aware(datetime(2030, 1, 4, 9))
+        datas = recorrencia.datas_da_serie(primeira, 1, 'dias', 4)
+        self.assertEqual([localtime(data).day for data in datas], [4, 7, 8, 9])
+        datas = recorrencia.datas_da_serie(primeira, 8, 'dias', 3)
+        self.assertEqual([localtime(data).day for data in datas], [4, 14, 21])  # 12 (sáb) -> 14
+        datas = recorrencia.datas_da_serie(primeira, 1, 'semanas', 3, pular_fim_de_semana=False)
+        self.assertEqual([(localtime(data).day, localtime(data).hour) for data in datas], [(4, 9), (11, 9), (18, 9)])
+
+    def test_api_grava_a_serie_com_um_insert(self):
+        url = '/api/consultas/recorrente/'
+        serie = {'animal': self.rex.pk, 'veterinario': self.ana.pk, 'data': '2030-01-07T09:00:00-03:00',
+                 'motivo': 'Vacina', 'intervalo': 3, 'unidade': 'semanas', 'ocorrencias': 4}
+        with CaptureQueriesContext(connection) as capturadas:
+            resposta = self.api.post(url, serie, format='json')
+        self.assertEqual(resposta.status_code, 201)
+        self.assertEqual(len(resposta.data['consultas']), 4)
+        sqls = [q['sql'] for q in capturadas]
+        self.assertEqual(len([sql for sql in sqls if sql.startswith('INSERT INTO "core_consulta"')]), 1)
+        self.assertEqual(len([sql for sql in sqls if sql.startswith('SELECT') and 'FROM "core_consulta"' in sql]), 1)
+        self.assertEqual(Consulta.objects.filter(motivo='Vacina').count(), 4)
+        self.assertEqual(estatisticas.divergencias(), {})
+
+        # 28/01 já está ocupado (3ª dose acima) e 04/02 é folga: nada é gravado
+        Folga.objects.create(veterinario=self.ana, data=datetime(2030, 2, 4).date())
+        resposta = self.api.post(url, {**serie, 'data': '2030-01-14T09:00:00-03:00', 'motivo': 'Retorno',
+                                       'unidade': 'dias', 'intervalo': 7}, format='json')
+        self.assertEqual(resposta.status_code, 409)
+        conflitos = resposta.data['conflitos']
+        self.assertEqual([(c['ocorrencia'], c['erro']) for c in conflitos],
+                         [(3, 'Já existe uma consulta agendada neste horário para este veterinário.'),
+                          (4, 'Fora do horário de atendimento do veterinário.')])
+        self.assertEqual([localtime(data).strftime('%d %H') for data in conflitos[0]['sugestoes']],
+                         ['28 10', '28 11', '28 13'])
+        self.assertEqual(localtime(conflitos[1]['sugestoes'][0]).strftime('%d %H'), '05 08')
+        self.assertFalse(Consulta.objects.filter(motivo='Retorno').exists())
+
+        resposta = self.api.post(url, {**serie, 'ocorrencias': 53}, format='json')
+        self.assertEqual(resposta.status_code, 400)
+
+    def test_formulario(self):
+        self.client.force_login(self.equipe)
+        dados = {'salvar': '1', 'animal': self.rex.pk, 'veterinario': self.ana.pk, 'data': '2030-01-07T09:00',
+                 'motivo': 'Vacina', 'repetir': 'on', 'intervalo': 1, 'unidade': 'semanas', 'ocorrencias': 3,
+                 'pular_fim_de_semana': 'on'}
+        resposta = self.client.post('/agendar_consulta/', dados)
+        self.assertRedirects(resposta, '/consultas/', fetch_redirect_response=False)
+        self.assertEqual(Consulta.objects.count(), 3)
+
+        resposta = self.client.post('/agendar_consulta/', {**dados, 'data': '2030-01-14T09:00'})
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual([c['ocorrencia'] for c in resposta.context['conflitos']], [1, 2])
+        self.assertContains(resposta, '1ª consulta, 14/01/2030 09:00')
+        self.assertEqual(Consulta.objects.count(), 3)
+
+        resposta = self.client.post('/agendar_consulta/', {**dados, 'ocorrencias': ''})
+        self.assertEqual(resposta.status_code, 200)
+        self.assertIn('ocorrencias', resposta.context['form'].errors)
@@ -9,12 +9,17 @@ urlpatterns = [
     path('animais/', views.lista_animais, name='lista_animais'),
     path('agendar_consulta/', views.agendar_consulta, name='agendar_consulta'),
     path('consultas/', views.lista_consultas, name='lista_consultas'),
+    path('consultas/exportar/', views.exportar, {'relatorio': 'consultas'}, name='exportar_consultas'),
     path('eventos/', views.consulta_eventos, name='consulta_eventos'),
     path('eventos_doctor/', views.consulta_eventos_veterinario, name='eventos_doctor'),
+    path('eventos/avisos/', views.consulta_avisos, name='consulta_avisos'),
+    path('busca/', views.busca_rapida, name='busca'),
+    path('metrics', views.metricas_prometheus, name='metricas'),
     path('add_animal/', views.add_animal, name='add_animal'),
     path('add_cliente/', views.add_cliente, name='add_cliente'),
 
     path('clientes/', views.lista_clientes, name='lista_clientes'), 
+    path('clientes/exportar/', views.exportar, {'relatorio': 'clientes'}, name='exportar_clientes'),
     path('clientes/<int:pk>/edit/', views.edit_cliente, name='edit_cliente'),
      
     path('animal/<int:pk>/edit/', views.edit_animal, name='edit_animal'),
@@ -1,11 +1,19 @@
-import random
+import hmac
+import json
+from itertools import islice
 from django.shortcuts import render, redirect, get_object_or_404 
+from django.urls import reverse
 from django.views.decorators.csrf import csrf_exempt
 from django.core.paginator import Paginator
-from django.http import JsonResponse
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden, JsonResponse, StreamingHttpResponse
+from django.core.handlers.asgi import ASGIRequest
+from django.core.serializers.json import DjangoJSONEncoder
 from django.contrib import messages
-from django.db.models import Q 
-from .models import Animal, Consulta, Cliente, MedicoVeterinario
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from .models import Animal, Consulta, Cliente, MedicoVeterinario, MENSAGEM_HORARIO_OCUPADO
+from . import agenda, busca, cache, exportacao, metricas, notificacoes
 from .forms import ConsultaForm, AnimalForm, ClienteForm, MedicoVeterinarioForm
 from django.contrib.auth import login, logout
 from django.contrib.auth.forms import AuthenticationForm
@@ -18,7 +26,6 @@ def login_view(request):
         form = AuthenticationForm(request, data=request.POST)
         if form.is_valid():
             user = form.get_user()
-            print(user)
             login(request, user)
             return redirect('home')  # troque para sua URL de destino
     else:
@@ -47,7 +54,7 @@ def add_animal(request):
             animal = form.save(commit=False) 
             cpf = request.POST.get("cpf")
             # print(cpf)
-            animal.dono = Cliente.objects.get(cpf=cpf) 
+            animal.dono = Cliente.objects.com_cpf(cpf).get()
             animal.save()
             return JsonResponse({
                 'id': animal.id, 
@@ -82,9 +89,9 @@ def edit_animal(request, pk):
 @login_required(login_url='login')
 def lista_clientes(request):
     filtro_cpf = request.GET.get('cpf', '')
-    clientes_qs = Cliente.objects.all().prefetch_related('animais')
+    clientes_qs = Cliente.objects.order_by('id').prefetch_related('animais')
     if filtro_cpf:
-        clientes_qs = clientes_qs.filter(cpf__icontains=filtro_cpf)
+        clientes_qs = clientes_qs.cpf_comeca_com(filtro_cpf)
 
     paginator = Paginator(clientes_qs, 10)  # 10 clientes por página
     page_number = request.GET.get('page')
@@ -129,8 +136,6 @@ def edit_cliente(request, pk):
         forms_pet = {}
         for animal in animais:
             forms_pet[animal.id] = AnimalForm(instance=animal)
-        
-        print(forms_pet)
 
 
     return render(request, 'cliente/edit_cliente.html', {
@@ -146,12 +151,12 @@ def edit_cliente(request, pk):
 @login_required(login_url='login')
 def lista_veterinarios(request):
     q = request.GET.get('q', '')
-    veterinarios = MedicoVeterinario.objects.all()
     form = MedicoVeterinarioForm()
     if q:
-        veterinarios = veterinarios.filter(
-            Q(nome__icontains=q) | Q(crmv__icontains=q)
-        )
+        veterinarios = MedicoVeterinario.objects.order_by('nome').filter(
+            Q(nome__icontains=q) | Q(crmv__icontains=q))
+    else:
+        veterinarios = cache.veterinarios()
     
     paginator = Paginator(veterinarios, 10)  # 10 veterinários por página
     page_number = request.GET.get('page')
@@ -205,11 +210,12 @@ def edit_veterinario(request, pk):
 def agendar_consulta(request):
     cliente = None
     animais = None
+    conflitos = []
 
     cpf = request.GET.get("cpf")
     if cpf:
         try:
-            cliente = Cliente.objects.get(cpf=cpf)
+            cliente = Cliente.objects.com_cpf(cpf).get()
             animais = cliente.animais.all()
         except Cliente.DoesNotExist:
             pass
@@ -220,7 +226,7 @@ def agendar_consulta(request):
             cpf = request.POST.get("cpf")
             # print(cpf)
             try:
-                cliente = Cliente.objects.get(cpf=cpf)
+                cliente = Cliente.objects.com_cpf(cpf).get()
                 animais = cliente.animais.all()
                 # print(cliente, animais)
                 form = ConsultaForm() 
@@ -232,10 +238,24 @@ def agendar_consulta(request):
         elif "salvar" in request.POST:
             form = ConsultaForm(request.POST)
             # print(request.POST)
-            if form.is_valid():
-                form.save()
-                messages.success(request, 'Consulta agendada com sucesso!')
-                return redirect('lista_consultas')
+            if form.is_valid() and form.cleaned_data['repetir']:
+                try:
+                    consultas, conflitos = form.agendar_serie()
+                except ValidationError as e:
+                    messages.error(request, ' '.join(e.messages))
+                else:
+                    if consultas:
+                        messages.success(request, f'{len(consultas)} consultas agendadas com sucesso!')
+                        return redirect('lista_consultas')
+                    messages.error(request, 'Nenhuma consulta foi agendada: há conflitos na série.')
+            elif form.is_valid():
+                try:
+                    form.save()
+                except ValidationError:
+                    messages.error(request, MENSAGEM_HORARIO_OCUPADO)
+                else:
+                    messages.success(request, 'Consulta agendada com sucesso!')
+                    return redirect('lista_consultas')
             else:
                 messages.error(request, 'Erro ao agendar consulta.')
     else:
@@ -247,7 +267,9 @@ def agendar_consulta(request):
         'cliente': cliente,
         'animais': animais, 
         'form_pet': form_pet,
-        'form_cliente': form_cliente
+        'form_cliente': form_cliente,
+        'conflitos': conflitos,
+        'notificacoes_ativas': settings.NOTIFICACOES_ATIVAS,
     }) 
 
 
@@ -257,7 +279,7 @@ def lista_consultas(request):
     filtro_animal = request.GET.get('animal')
     if filtro_animal:
         consultas = Consulta.objects.filter(
-            animal__nome__icontains=filtro_animal)
+            animal_id__in=busca.ids_por_nome(busca.ANIMAL, filtro_animal))
     else:
         consultas = Consulta.objects.all()
     
@@ -267,77 +289,128 @@ def lista_consultas(request):
     
     return render(request, 'consulta/lista_consultas.html', 
                   {'consultas': consultas, 
-                   'filtro_animal': filtro_animal
+                   'filtro_animal': filtro_animal,
+                   'veterinarios': cache.veterinarios(),
+                   'status_consulta': Consulta.StatusConsulta.values,
+                   'notificacoes_ativas': settings.NOTIFICACOES_ATIVAS,
                    })
 
 
 
 
 
+def _json_em_fluxo(itens, tamanho_bloco=500):
+    """
+    Serializa um iterável como array JSON em pedaços, para usar com
+    StreamingHttpResponse sem montar a lista inteira na memória.
+    """
+    itens = iter(itens)
+    yield '['
+    primeiro = True
+    while bloco := list(islice(itens, tamanho_bloco)):
+        yield ('' if primeiro else ',') + ','.join(json.dumps(item, cls=DjangoJSONEncoder) for item in bloco)
+        primeiro = False
+    yield ']'
+
+
+async def _ajson_em_fluxo(itens, tamanho_bloco=500):
+    """
+    ``_json_em_fluxo`` para um iterável assíncrono.
+    """
+    yield '['
+    bloco = []
+    primeiro = True
+    async for item in itens:
+        bloco.append(json.dumps(item, cls=DjangoJSONEncoder))
+        if len(bloco) == tamanho_bloco:
+            yield ('' if primeiro else ',') + ','.join(bloco)
+            primeiro = False
+            bloco = []
+    if bloco:
+        yield ('' if primeiro else ',') + ','.join(bloco)
+    yield ']'
+
+
+# Views assíncronas: o calendário consulta estes endpoints o tempo todo e,
+# com ASGI, a espera pelo banco não ocupa uma thread do servidor.
+
 @login_required(login_url='login')
-def consulta_eventos(request):
-    eventos = []
-    for c in Consulta.objects.all():
-        eventos.append({
-            "id": c.id,
-            "title": f"{c.animal.nome} - {c.veterinario.nome}",
-            "start": c.data.strftime("%Y-%m-%dT%H:%M:%S"),
-            "color": "#" + "".join([random.choice("0123456789ABCDEF") for _ in range(6)])
-        })
-    # print(eventos)
-    return JsonResponse(eventos, safe=False)
+async def consulta_eventos(request):
+    try:
+        inicio, fim = agenda.intervalo_da_requisicao(request.GET)
+    except ValueError as e:
+        return JsonResponse({'errors': str(e)}, status=400)
+
+    # Com WSGI um iterador assíncrono seria acumulado inteiro antes do envio
+    # (e com ASGI um síncrono): o gerador acompanha o servidor
+    if isinstance(request, ASGIRequest):
+        corpo = _ajson_em_fluxo(agenda.aeventos_clinica(inicio, fim))
+    else:
+        corpo = _json_em_fluxo(agenda.eventos_clinica(inicio, fim))
+    return StreamingHttpResponse(corpo, content_type='application/json')
 
 
 @login_required(login_url="login")
-def consulta_eventos_veterinario(request):
-    from django.utils.timezone import localtime, make_aware, get_current_timezone
-    from datetime import datetime, time, timedelta # time é mais limpo que datetime.min.time() 
+async def consulta_eventos_veterinario(request):
+    veterinario_id = request.GET.get("veterinario")
+    if not veterinario_id or not veterinario_id.isdigit():
+        return JsonResponse([], safe=False)
+
+    try:
+        inicio, fim = agenda.intervalo_da_requisicao(request.GET)
+    except ValueError as e:
+        return JsonResponse({'errors': str(e)}, status=400)
+
+    eventos = await agenda.aeventos_veterinario_em_cache(int(veterinario_id), inicio, fim)
+    return JsonResponse(eventos, safe=False)
 
+
+# Avisos SSE para os calendários atualizarem os eventos sem recarregar (core/notificacoes.py)
+@login_required(login_url="login")
+async def consulta_avisos(request):
     veterinario_id = request.GET.get("veterinario")
-    if not veterinario_id:
-        return JsonResponse([], status=200)
-
-    # Consultas agendadas já no formato necessário
-    consultas = (
-        Consulta.objects.filter(veterinario_id=veterinario_id)
-        .select_related("animal", "veterinario")
-    )
-
-    consultas_dict = {
-            f"{localtime(c.data).strftime('%Y-%m-%d')}-{localtime(c.data).hour}": c.id for c in consultas
-        }
-    # 2025-09-12-09
-    print(consultas_dict)
-
-    eventos = [
-        {
-            "id": c.id,
-            "title": f"{c.animal.nome} - {c.veterinario.nome}",
-            "start": localtime(c.data).strftime("%Y-%m-%dT%H:%M:%S"), # 2: Converta para o fuso local
-            "color": "#dc3545",  # vermelho
-        }
-        for c in consultas
-    ]
-
-    hoje = localtime().date() # Use localtime() para pegar a data atual no fuso correto
-    horarios = [8, 9, 10, 11, 13, 14, 15, 16]
-
-    for i in range(7): 
-        data = hoje + timedelta(days=i)
-        if data.weekday() >= 5:  # Pula sábado e domingo
-            continue 
-
-        for hora in horarios:
-            key = f"{data.strftime('%Y-%m-%d')}-{hora}" 
-            print(key)
-            if key not in consultas_dict:
-                slot_inicio = make_aware(datetime.combine(data, time(hour=hora)), get_current_timezone()) # timezone são paulo, portugal
-                eventos.append(
-                    {
-                        "id": f"disp-{data}-{hora}",
-                        "title": "Disponível",
-                        "start": slot_inicio.strftime("%Y-%m-%dT%H:%M:%S"), # Formate o slot fuso horário
-                        "color": "#28a745",  # verde
-                    }
-                )  
-    return JsonResponse(eventos, safe=False)
\ No newline at end of file
+    if veterinario_id and not veterinario_id.isdigit():
+        return JsonResponse({'errors': 'veterinario deve ser um número.'}, status=400)
+    return notificacoes.resposta_sse(request, int(veterinario_id) if veterinario_id else None)
+
+
+def _acesso_as_metricas(request):
+    if request.user.is_staff or request.META.get('REMOTE_ADDR') in settings.METRICAS_IPS:
+        return True
+    token = request.headers.get('Authorization', '').removeprefix('Bearer ')
+    return bool(settings.METRICAS_TOKEN) and hmac.compare_digest(token, settings.METRICAS_TOKEN)
+
+
+# Métricas no formato do Prometheus (core/metricas.py): equipe, token ou IPs liberados
+def metricas_prometheus(request):
+    if not _acesso_as_metricas(request):
+        return HttpResponseForbidden()
+    return HttpResponse(metricas.prometheus(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+# Relatórios em CSV/XLSX enviados em fluxo (core/exportacao.py), só para a equipe
+@login_required(login_url='login')
+def exportar(request, relatorio):
+    if not request.user.is_staff:
+        return HttpResponseForbidden()
+    try:
+        return exportacao.resposta(request, relatorio, request.GET.get('formato', 'csv'), request.GET)
+    except ValueError as e:
+        return JsonResponse({'errors': str(e)}, status=400)
+
+
+# Busca rápida (caixa de busca da barra de navegação)
+@login_required(login_url='login')
+def busca_rapida(request):
+    q = request.GET.get('q', '').strip()
+    resultados = busca.buscar(q, limite=50) if q else []
+
+    for resultado in resultados:
+        if resultado['tipo'] == busca.CLIENTE:
+            resultado['url'] = reverse('edit_cliente', args=[resultado['id']])
+        elif resultado['tipo'] == busca.ANIMAL:
+            resultado['url'] = reverse('edit_cliente', args=[resultado['referencia_id']])
+        else:
+            resultado['url'] = reverse('edit_veterinario', args=[resultado['id']])
+
+    return render(request, 'busca.html', {'q': q, 'resultados': resultados})
@@ -1,4 +1,4 @@
-import { Component, ViewChild } from '@angular/core';
+import { Component, OnDestroy, ViewChild } from '@angular/core';
 import { CommonModule } from '@angular/common';
 import { FormsModule } from '@angular/forms';
 import {
@@ -18,8 +18,9 @@ import {
   AlertController
 } from '@ionic/angular/standalone';
 
-import { ApiService, Consulta, Animal, Veterinario } from '../services/api';
+import { ApiService, AvisoConsulta, Consulta, Animal, Veterinario } from '../services/api';
 import { Router } from '@angular/router';
+import { Subscription } from 'rxjs';
 
 import { addIcons } from 'ionicons';
 import { checkmarkCircleOutline } from 'ionicons/icons';
@@ -49,7 +50,7 @@ import { CalendarComponent } from '../components/calendar/calendar.component';
     CalendarComponent
   ]
 })
-export class AgendarConsultaPage {
+export class AgendarConsultaPage implements OnDestroy {
 
   public consulta: Consulta = {
     animal: {} as Animal,
@@ -142,6 +143,7 @@ export class AgendarConsultaPage {
         this.veterinarioSelecionado = res;
         this.consulta.veterinario = res.id // Passa id do veterinario p/ DB
         this.carregarEventosVeterinario(res.id)
+        this.acompanharAgenda(res.id)
       }
     });
 
@@ -168,18 +170,46 @@ export class AgendarConsultaPage {
 
     if (!veterinarioId) return;
 
+    this.buscarEventos(veterinarioId, () => loading.dismiss());
+  }
+
+  buscarEventos(veterinarioId: number, concluido: () => void = () => {}) {
     this.api.getEventosVeterinario(veterinarioId).subscribe({
       next: (eventos: any[]) => {
         this.meusEventos = eventos;
-        loading.dismiss();
+        concluido();
       },
       error: (error) => {
         console.error('Erro ao carregar eventos:', error);
-        loading.dismiss();
+        concluido();
+      }
+    });
+  }
+
+  // Avisos do servidor (SSE): o calendário é atualizado quando alguém marca,
+  // altera ou cancela uma consulta deste veterinário, sem recarregar a agenda
+  private avisos?: Subscription;
+  private conectado = false;
+
+  acompanharAgenda(veterinarioId: number) {
+    this.avisos?.unsubscribe();
+    this.conectado = false;
+
+    this.avisos = this.api.avisosConsultas(veterinarioId).subscribe((aviso: AvisoConsulta) => {
+      if (aviso.tipo === 'conectado') {
+        // Numa reconexão algum aviso pode ter se perdido
+        if (this.conectado) this.buscarEventos(veterinarioId);
+        this.conectado = true;
+      } else if (aviso.tipo === 'recarregar' || !this.calendar.aplicarAviso(aviso, veterinarioId)) {
+        this.buscarEventos(veterinarioId);
       }
     });
   }
 
+  ngOnDestroy() {
+    this.avisos?.unsubscribe();
+  }
+
 
   // data
   dataSelecionada: string = '';
@@ -230,6 +260,7 @@ export class AgendarConsultaPage {
     this.veterinarioSelecionado = null;
     this.dataSelecionada = '';
     this.meusEventos = [];
+    this.avisos?.unsubscribe();
 
     this.calendar.clearEvents();
   }
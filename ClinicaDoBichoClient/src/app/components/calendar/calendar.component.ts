@@ -7,6 +7,8 @@ import timeGridWeekPlugin from '@fullcalendar/timegrid';
 import interactionPlugin from '@fullcalendar/interaction';
 import ptBrLocale from '@fullcalendar/core/locales/pt-br';
 
+import { AvisoConsulta } from '../../services/api';
+
 @Component({
   selector: 'app-calendar',
   standalone: true,
@@ -102,6 +104,27 @@ export class CalendarComponent {
     }
   }
 
+  // Aplica um aviso (SSE) de consulta nos eventos já mostrados. Devolve false
+  // quando algum horário foi liberado: os horários livres vêm do servidor.
+  public aplicarAviso(aviso: AvisoConsulta, veterinarioId: number): boolean {
+    if (!this.calendarInstance || !aviso.evento) return false;
+    const api = this.calendarInstance.getApi();
+    const atual = api.getEventById(String(aviso.id));
+    const inicio: string = aviso.evento.start;
+
+    if (aviso.status !== 'Agendada' || aviso.veterinario !== veterinarioId ||
+      (atual && atual.startStr.slice(0, 19) !== inicio)) {
+      return false;
+    }
+
+    // Consulta nova (ou no mesmo horário): ocupa o slot livre correspondente
+    const livre = api.getEventById(`disp-${inicio.slice(0, 10)}-${inicio.slice(11, 13)}${inicio.slice(14, 16)}`);
+    livre?.remove();
+    atual?.remove();
+    api.addEvent({ ...aviso.evento, color: '#dc3545' }, api.getEventSources()[0]);
+    return true;
+  }
+
   public clearEvents() {
     if (this.calendarInstance) {
       console.log("Calendar Instance !!!")
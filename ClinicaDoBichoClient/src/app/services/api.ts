@@ -1,6 +1,7 @@
 import { Injectable } from '@angular/core';
-import { HttpClient } from '@angular/common/http';
-import { Observable } from 'rxjs';
+import { HttpClient, HttpDownloadProgressEvent, HttpEventType } from '@angular/common/http';
+import { EMPTY, Observable, defer, from } from 'rxjs';
+import { expand, mergeMap, reduce, repeat, retry } from 'rxjs/operators';
 
 import { environment } from 'src/environments/environment';
 
@@ -39,6 +40,37 @@ export interface Consulta {
   status: string;
 }
 
+// Resposta paginada da API (paginação por cursor do DRF)
+export interface Pagina<T> {
+  next: string | null;
+  previous: string | null;
+  results: T[];
+}
+
+// Aviso do servidor (SSE) sobre uma consulta; "conectado" e "recarregar"
+// pedem para buscar os eventos de novo
+export interface AvisoConsulta {
+  tipo: 'conectado' | 'recarregar' | 'criada' | 'alterada' | 'cancelada' | 'removida';
+  id?: number;
+  veterinario?: number | null;
+  veterinario_anterior?: number | null;
+  status?: string;
+  evento?: any;
+}
+
+// Lê uma mensagem SSE ("event: ...\ndata: ...")
+function lerAviso(mensagem: string): AvisoConsulta | null {
+  let tipo = '';
+  let dados = '';
+  for (const linha of mensagem.split('\n')) {
+    if (linha.startsWith('event: ')) tipo = linha.slice(7);
+    else if (linha.startsWith('data: ')) dados += linha.slice(6);
+  }
+  if (tipo === 'consulta') return JSON.parse(dados);
+  if (tipo === 'conectado' || tipo === 'recarregar') return { tipo };
+  return null; // ping
+}
+
 @Injectable({
   providedIn: 'root' // já disponível em todo app
 })
@@ -50,6 +82,14 @@ export class ApiService {
     console.log('ApiService: baseUrl =', this.baseUrl);
   }
 
+  // Percorre todas as páginas seguindo o link "next" e devolve a lista completa
+  private listarTodos<T>(url: string): Observable<T[]> {
+    return this.http.get<Pagina<T>>(url).pipe(
+      expand(pagina => pagina.next ? this.http.get<Pagina<T>>(pagina.next) : EMPTY),
+      reduce((todos: T[], pagina: Pagina<T>) => todos.concat(pagina.results), [])
+    );
+  }
+
   // login retorna login
   login(username: string, password: string): Observable<any> {
     return this.http.post(`${this.baseUrl}/login/`, { username, password });
@@ -65,7 +105,7 @@ export class ApiService {
   listConsultas(): Observable<Consulta[]> {
     console.log('ApiService: Método getConsultas() chamado. Fazendo requisição GET...');
 
-    return this.http.get<Consulta[]>(`${this.baseUrl}/consultas/`);
+    return this.listarTodos<Consulta>(`${this.baseUrl}/consultas/`);
   }
 
   // Resumo Consultas
@@ -80,13 +120,42 @@ export class ApiService {
     return this.http.get<any[]>(`${this.baseUrl}/consultas/eventos_veterinario/?veterinario=${veterinarioId}`);
   }
 
+  // Avisos das consultas do veterinário (SSE). Lido pelo HttpClient, e não
+  // pelo EventSource, para o token passar pelo interceptor; quando o servidor
+  // fecha o fluxo ou a conexão cai, conecta de novo.
+  avisosConsultas(veterinarioId: number): Observable<AvisoConsulta> {
+    const url = `${this.baseUrl}/consultas/avisos/?veterinario=${veterinarioId}`;
+    return defer(() => {
+      let lido = 0;
+      return this.http.get(url, { observe: 'events', responseType: 'text', reportProgress: true }).pipe(
+        mergeMap(evento => {
+          let texto = '';
+          if (evento.type === HttpEventType.DownloadProgress) {
+            texto = (evento as HttpDownloadProgressEvent).partialText ?? '';
+          } else if (evento.type === HttpEventType.Response) {
+            texto = evento.body ?? '';
+          }
+          // Só as mensagens completas (terminadas por linha em branco) ainda não lidas
+          const fim = texto.lastIndexOf('\n\n');
+          if (fim < lido) return EMPTY;
+          const mensagens = texto.slice(lido, fim).split('\n\n');
+          lido = fim + 2;
+          return from(mensagens.map(lerAviso).filter((aviso): aviso is AvisoConsulta => aviso !== null));
+        })
+      );
+    }).pipe(
+      repeat({ delay: 3000 }),
+      retry({ delay: 3000 })
+    );
+  }
+
   // criar consulta
   agendarConsulta(consulta: Consulta): Observable<Consulta> {
     return this.http.post<Consulta>(`${this.baseUrl}/consultas/`, consulta);
   }
 
   listAnimais(): Observable<Animal[]> {
-    return this.http.get<Animal[]>(`${this.baseUrl}/animais/`);
+    return this.listarTodos<Animal>(`${this.baseUrl}/animais/`);
   }
 
   // Adicionar um novo Animal
@@ -105,6 +174,6 @@ export class ApiService {
   }
 
   listVeterinarios(): Observable<Veterinario[]> {
-    return this.http.get<Veterinario[]>(`${this.baseUrl}/veterinarios/`);
+    return this.listarTodos<Veterinario>(`${this.baseUrl}/veterinarios/`);
   }
 }